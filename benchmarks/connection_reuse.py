@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Compares connection setups per file with and without keep-alive sessions
+
+Run from the repository root:
+    python -m benchmarks.connection_reuse [files] [threads]
+"""
+import sys
+import tempfile
+import time
+from dcmweb import dcmweb
+from dcmweb import requests_util
+from benchmarks import mock_server
+
+
+def run(server, files, threads, keep_alive):
+    """Downloads files through one Requests object and returns measurements"""
+    server.reset()
+    requests = requests_util.Requests(server.url, None, threads, keep_alive)
+    output = tempfile.mkdtemp()
+    futures = ((requests.download_dicom_by_ids,
+                {"study_id": "1", "series_id": "1", "instance_id": str(i)}, output)
+               for i in range(files))
+    start = time.perf_counter()
+    dcmweb.execute_file_transfer_futures(futures, threads > 1)
+    elapsed = time.perf_counter() - start
+    return {"keep_alive": keep_alive, "seconds": round(elapsed, 3),
+            "connections": server.connections,
+            "connections_per_file": round(server.connections / files, 3)}
+
+
+def main():
+    """Prints results for both modes"""
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else dcmweb.worker_count(True)
+    with mock_server.MockServer() as server:
+        for keep_alive in (False, True):
+            print(run(server, files, threads, keep_alive))
+
+
+if __name__ == "__main__":
+    main()
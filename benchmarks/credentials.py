@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Compares applying credentials under shared lock with precomputed lock-free headers
+
+Run from the repository root:
+    python -m benchmarks.credentials [requests] [threads]
+"""
+import sys
+import time
+import datetime
+import threading
+import concurrent.futures
+from dcmweb import dcmweb
+
+
+class Credentials:
+    """Credentials with token valid for an hour, never refreshed"""
+
+    token = "token"
+    valid = True
+
+    def __init__(self):
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+    def apply(self, headers):
+        """Adds token to headers"""
+        headers["authorization"] = "Bearer {}".format(self.token)
+        return headers
+
+
+def locked_apply(authenticator, lock):
+    """Returns function applying credentials the way requests did before,
+    by validity check under lock shared by all threads"""
+    def apply(headers):
+        with lock:
+            authenticator.check_and_refresh_credentials()
+            authenticator.credentials.apply(headers)
+        return headers
+    return apply
+
+
+def run(apply, requests, threads):
+    """Applies credentials from threads and returns measurements"""
+    def worker(count):
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            apply({})
+            latencies.append(time.perf_counter() - start)
+        return latencies
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = sorted(latency for result in executor.map(
+            worker, [requests // threads] * threads) for latency in result)
+    elapsed = time.perf_counter() - start
+    return {"requests_per_second": round(len(latencies) / elapsed),
+            "p50_us": round(latencies[len(latencies) // 2] * 1e6, 2),
+            "p99_us": round(latencies[int(len(latencies) * 0.99)] * 1e6, 2)}
+
+
+def main():
+    """Prints results for both modes"""
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    authenticator = dcmweb.GoogleAuthenticator()
+    authenticator.credentials = Credentials()
+    print(dict(mode="locked", **run(locked_apply(authenticator, threading.Lock()),
+                                    requests, threads)))
+    print(dict(mode="lock_free", **run(authenticator.apply_credentials, requests, threads)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""Local in-process stand-in for a DICOMweb server used by benchmarks
+
+Serves QIDO searches with limit/offset paging, single instances and multipart studies
+or series on WADO requests, stores single and multipart STOW requests and accepts deletes.
+Instances are generated minimal DICOM files of a catalog of
+studies x series x instances, any other instance path is served as well.
+"""
+import http.server
+import io
+import json
+import random
+import socketserver
+import struct
+import threading
+import time
+import urllib.parse as urlparse
+from dcmweb import dicom_header
+from dcmweb import resources
+
+BOUNDARY = "mock-boundary"
+CHUNK_SIZE = 65536
+EXPLICIT_VR_LITTLE_ENDIAN = "1.2.840.10008.1.2.1"
+QIDO_LEVELS = {"studies": resources.STUDY_ID, "series": resources.SERIES_ID,
+               "instances": resources.INSTANCE_ID}
+STOW_ITEM = '<Item><DicomAttribute keyword="ReferencedSOPInstanceUID"><Value>{0}</Value>\
+</DicomAttribute><DicomAttribute keyword="RetrieveURL"><Value>{1}</Value></DicomAttribute></Item>'
+STOW_RESPONSE = '<NativeDicomModel><DicomAttribute tag="00081199" vr="SQ" \
+keyword="ReferencedSOPSequence">{}</DicomAttribute></NativeDicomModel>'
+
+
+def dicom_element(group, element, value_representation, value):
+    """Encodes explicit VR little endian element, values are padded to even length"""
+    if len(value) % 2:
+        value += b"\0"
+    if value_representation in dicom_header.LONG_LENGTH_VRS:
+        return struct.pack("<HH2sHI", group, element, value_representation, 0, len(value)) \
+            + value
+    return struct.pack("<HH2sH", group, element, value_representation, len(value)) + value
+
+
+def dicom_instance(ids, size):
+    """Builds DICOM part 10 file with UIDs of ids padded by pixel data up to size bytes"""
+    header = b"\0" * dicom_header.PREAMBLE_LENGTH + dicom_header.PREFIX + dicom_element(
+        0x0002, 0x0010, b"UI", EXPLICIT_VR_LITTLE_ENDIAN.encode()) + b"".join(
+            dicom_element(tag[0], tag[1], b"UI", ids[key].encode())
+            for tag, key in sorted(dicom_header.TAG_IDS.items()))
+    pixel_data = max(size - len(header) - 12, 0)
+    return header + dicom_element(0x7FE0, 0x0010, b"OB", b"\0" * (pixel_data - pixel_data % 2))
+
+
+def catalog_ids(studies, series, instances):
+    """Returns list of ids of all instances of catalog"""
+    return [{resources.STUDY_ID: "{}".format(study),
+             resources.SERIES_ID: "{}.{}".format(study, serie),
+             resources.INSTANCE_ID: "{}.{}.{}".format(study, serie, instance)}
+            for study in range(1, studies + 1) for serie in range(1, series + 1)
+            for instance in range(1, instances + 1)]
+
+
+def qido_json(ids, level):
+    """Returns QIDO result of ids on level"""
+    result = {resources.STUDY_TAG: {"vr": "UI", "Value": [ids[resources.STUDY_ID]]}}
+    if level != "studies":
+        result[resources.SERIES_TAG] = {"vr": "UI", "Value": [ids[resources.SERIES_ID]]}
+    if level == "instances":
+        result[resources.INSTANCE_TAG] = {"vr": "UI", "Value": [ids[resources.INSTANCE_ID]]}
+    return result
+
+
+class LocalServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """HTTP server on free local port, handles each connection in separate thread
+    and serves in background while used as context manager"""
+
+    daemon_threads = True
+
+    def __init__(self, handler, **attributes):
+        """
+        :param handler: request handler class
+        :param attributes: initial attributes of server used by handler
+        """
+        super().__init__(("127.0.0.1", 0), handler)
+        self.thread = None
+        for name, value in attributes.items():
+            setattr(self, name, value)
+
+    @property
+    def url(self):
+        """Base url of the server"""
+        return "http://127.0.0.1:{}/".format(self.server_address[1])
+
+    def __enter__(self):
+        # short poll interval keeps shutdown between scenarios quick
+        self.thread = threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05},
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class LocalHandler(http.server.BaseHTTPRequestHandler):
+    """HTTP/1.1 handler which doesn't log requests"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin; signature of base class
+        """Keeps test and benchmark output clean"""
+
+    def respond(self, status, content_type, body):
+        """Sends response with body, connection is closed if client asked for it"""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if self.headers.get("Connection", "").lower() == "close":
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.write_body(body)
+
+    def write_body(self, body):
+        """Writes response body"""
+        self.wfile.write(body)
+
+
+class MockServer(LocalServer):
+    """HTTP/1.1 server which counts accepted connections, requests and payload"""
+
+    request_queue_size = 128
+
+    def __init__(self, instance_size=8192, latency=0.0, bandwidth=None, error_rate=0.0,  # pylint: disable=too-many-arguments; server configuration
+                 catalog=(1, 1, 1)):
+        """
+        :param instance_size: size of served instances in bytes
+        :param latency: seconds each request waits before response
+        :param bandwidth: bytes per second of each connection, unlimited if None
+        :param error_rate: share of requests answered by 503
+        :param catalog: amount of studies, series per study and instances per series
+        """
+        super().__init__(MockHandler)
+        self.instance_size = instance_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.catalog = catalog_ids(*catalog)
+        self.random = random.Random(0)
+        self.counter_lock = threading.Lock()
+        self.reset()
+
+    def __enter__(self):
+        # returned from here, so pylint knows counters of mock server
+        super().__enter__()
+        return self
+
+    def get_request(self):
+        """Counts new connections"""
+        connection = super().get_request()
+        with self.counter_lock:
+            self.connections += 1
+        return connection
+
+    def count_request(self):
+        """Counts handled requests and emulates server latency
+        :returns: True if request should fail by injected error
+        """
+        with self.counter_lock:
+            self.requests += 1
+            failed = self.error_rate and self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return failed
+
+    def count(self, instances=0, sent=0, received=0, results=0):
+        """Counts transferred instances, payload bytes and QIDO results"""
+        with self.counter_lock:
+            self.instances += instances
+            self.results += results
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+    def throttle(self, size):
+        """Delays transfer of size bytes according to bandwidth"""
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+
+    def find(self, ids):
+        """Returns ids of catalog instances inside resource of ids"""
+        return [instance for instance in self.catalog
+                if all(instance[key] == value for key, value in ids.items())]
+
+    def reset(self):
+        """Resets counters"""
+        with self.counter_lock:
+            self.connections = 0
+            self.requests = 0
+            self.errors = 0
+            self.instances = 0
+            self.results = 0
+            self.bytes_sent = 0
+            self.bytes_received = 0
+
+
+class MockHandler(LocalHandler):
+    """Serves QIDO and WADO on GET, accepts STOW on POST and DELETE"""
+
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # pylint: disable=invalid-name; name required by BaseHTTPRequestHandler
+        """Returns search results, instance or multipart study or series"""
+        if self.server.count_request():
+            self.respond(503, "text/plain", b"")
+            return
+        url = urlparse.urlparse(self.path)
+        components = [component for component in url.path.split("/") if component]
+        if components and components[-1] in QIDO_LEVELS:
+            self._search(components, urlparse.parse_qs(url.query))
+            return
+        ids = resources.ids_from_path("/".join(components))
+        if resources.INSTANCE_ID in ids:
+            body = dicom_instance(ids, self.server.instance_size)
+            self.server.count(1)
+            self.respond(200, "application/dicom", body)
+            return
+        instances = self.server.find(ids)
+        parts = [b"--" + BOUNDARY.encode() + b"\r\nContent-Type: application/dicom\r\n\r\n" +
+                 dicom_instance(instance, self.server.instance_size) + b"\r\n"
+                 for instance in instances]
+        self.server.count(len(instances))
+        self.respond(200, 'multipart/related; type="application/dicom"; boundary=' + BOUNDARY,
+                      b"".join(parts) + b"--" + BOUNDARY.encode() + b"--\r\n")
+
+    def do_POST(self):  # pylint: disable=invalid-name; name required by BaseHTTPRequestHandler
+        """Reads uploaded single or multipart body and returns STOW response"""
+        length = int(self.headers.get("Content-Length", 0))
+        body = bytearray()
+        while len(body) < length:
+            chunk = self.rfile.read(min(CHUNK_SIZE, length - len(body)))
+            if not chunk:
+                break
+            self.server.throttle(len(chunk))
+            body += chunk
+        if self.server.count_request():
+            self.respond(503, "text/plain", b"")
+            return
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/related"):
+            boundary = b"--" + content_type.split("boundary=")[1].strip('"').encode()
+            parts = [part.split(b"\r\n\r\n", 1)[1][:-2]
+                     for part in bytes(body).split(boundary)[1:-1]]
+        else:
+            parts = [bytes(body)]
+        items = []
+        for part in parts:
+            ids = dicom_header.read_ids(io.BytesIO(part))
+            items.append(STOW_ITEM.format(ids[resources.INSTANCE_ID], self.server.url +
+                                          resources.path_from_ids(ids)))
+        self.server.count(len(parts), received=length)
+        self.respond(200, "application/dicom+xml", STOW_RESPONSE.format("".join(items)).encode())
+
+    def do_DELETE(self):  # pylint: disable=invalid-name; name required by BaseHTTPRequestHandler
+        """Returns empty json"""
+        if self.server.count_request():
+            self.respond(503, "text/plain", b"")
+            return
+        self.server.count(1)
+        self.respond(200, "application/json", b"{}")
+
+    def _search(self, components, query):
+        """Returns page of QIDO results of catalog"""
+        level = components[-1]
+        ids = resources.ids_from_path("/".join(components[:-1]))
+        results = []
+        keys = set()
+        for instance in self.server.find(ids):
+            key = instance[QIDO_LEVELS[level]]
+            if key not in keys:
+                keys.add(key)
+                results.append(qido_json(instance, level))
+        offset = int(query.get("offset", ["0"])[0])
+        limit = int(query.get("limit", [str(len(results))])[0])
+        results = results[offset:offset + limit]
+        self.server.count(results=len(results))
+        self.respond(200, "application/dicom+json", json.dumps(results).encode())
+
+    def write_body(self, body):
+        """Writes response body throttled to bandwidth of server"""
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = body[start:start + CHUNK_SIZE]
+            self.server.throttle(len(chunk))
+            self.wfile.write(chunk)
+        self.server.count(sent=len(body))
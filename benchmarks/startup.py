@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Measures latency of single instance retrieve including client startup with validation
+request made up front, with lazy validation and without validation
+
+Run from the repository root:
+    python -m benchmarks.startup [runs] [latency_seconds]
+"""
+import logging
+import shutil
+import sys
+import tempfile
+import time
+from dcmweb import dcmweb
+from benchmarks import mock_server
+
+MODES = ("eager", "lazy", "off")
+
+
+def run(server, runs, mode):
+    """Creates client and retrieves instance runs times, returns measurements"""
+    server.reset()
+    output = tempfile.mkdtemp()
+    start = time.perf_counter()
+    for _ in range(runs):
+        dcmweb_cli = dcmweb.Dcmweb(server.url, False, None, validate=mode != "off")
+        if mode == "eager":
+            # the request every command made before validation became lazy
+            dcmweb_cli.requests.request("studies", "limit=1", {})
+        dcmweb_cli.retrieve("studies/1/series/1/instances/1", output)
+    elapsed = time.perf_counter() - start
+    shutil.rmtree(output)
+    return {"validation": mode, "ms_per_command": round(elapsed / runs * 1000, 2),
+            "requests_per_command": round(server.requests / runs, 2)}
+
+
+def main():
+    """Prints results for all validation modes"""
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    logging.getLogger().setLevel(logging.WARNING)
+    with mock_server.MockServer(latency=latency) as server:
+        for mode in MODES:
+            print(run(server, runs, mode))
+
+
+if __name__ == "__main__":
+    main()
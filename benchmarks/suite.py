@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""Runs commands against the local mock DICOMweb server and reports files/s, MB/s,
+p50/p99 request latency and peak RSS of each scenario
+
+Each scenario runs in a fresh interpreter so peak RSS isn't inherited from previous ones,
+RSS includes the mock server running in the same process.
+
+Run from the repository root:
+    python -m benchmarks.suite [--scenarios store retrieve_root ...] [--studies 4]
+        [--series 2] [--instances 50] [--instance_size 65536] [--latency 0.005]
+        [--bandwidth bytes_per_second] [--error_rate 0.01] [--metrics] [-m]
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+try:
+    import resource
+except ImportError:  # peak RSS isn't reported on Windows
+    resource = None
+from dcmweb import dcmweb
+from dcmweb import metrics
+from dcmweb import requests_util
+from benchmarks import mock_server
+
+
+def store(dcmweb_cli, server, workspace, arguments):
+    """Stores catalog generated as files"""
+    for ids in server.catalog:
+        with open(os.path.join(workspace, ids["instance_id"] + ".dcm"), "wb") as file:
+            file.write(mock_server.dicom_instance(ids, arguments.instance_size))
+    server.reset()
+    dcmweb_cli.store(os.path.join(workspace, "*.dcm"), batch_size=arguments.batch_size)
+    return server.instances
+
+
+def retrieve_root(dcmweb_cli, server, workspace, _):
+    """Retrieves all instances by QIDO search and request per instance"""
+    server.reset()
+    dcmweb_cli.retrieve("", workspace)
+    return server.instances
+
+
+def retrieve_study(dcmweb_cli, server, workspace, _):
+    """Retrieves each study by QIDO search and request per instance"""
+    server.reset()
+    for study_id in sorted({ids["study_id"] for ids in server.catalog}):
+        dcmweb_cli.retrieve("studies/" + study_id, workspace)
+    return server.instances
+
+
+def retrieve_bulk(dcmweb_cli, server, workspace, _):
+    """Retrieves all series by single multipart request per series"""
+    server.reset()
+    dcmweb_cli.retrieve("", workspace, bulk="series")
+    return server.instances
+
+
+def retrieve_instance(dcmweb_cli, server, workspace, _):
+    """Retrieves instances one by one like separate commands do"""
+    server.reset()
+    for ids in server.catalog:
+        dcmweb_cli.retrieve("studies/{study_id}/series/{series_id}/instances/{instance_id}"
+                            .format(**ids), workspace)
+    return server.instances
+
+
+def search(dcmweb_cli, server, _, __):
+    """Streams all instances found by QIDO search"""
+    server.reset()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        dcmweb_cli.search("instances", all=True)
+    return server.results
+
+
+def delete(dcmweb_cli, server, _, __):
+    """Deletes instances one by one"""
+    server.reset()
+    for ids in server.catalog:
+        dcmweb_cli.delete("studies/{study_id}/series/{series_id}/instances/{instance_id}"
+                          .format(**ids))
+    return server.instances
+
+
+# each scenario returns amount of handled files
+SCENARIOS = {scenario.__name__: scenario for scenario in (
+    store, retrieve_root, retrieve_study, retrieve_bulk, retrieve_instance, search, delete)}
+
+
+def record_latencies(requests, latencies):
+    """Wraps send of requests to record seconds until response headers of each request"""
+    send = requests.send
+    lock = threading.Lock()
+
+    def timed_send(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return send(*args, **kwargs)
+        finally:
+            with lock:
+                latencies.append(time.perf_counter() - start)
+    requests.send = timed_send
+
+
+def percentile(values, share):
+    """Returns value of sorted values below which share of them is"""
+    if not values:
+        return None
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def peak_rss():
+    """Returns peak resident set size of the process in MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def run(arguments):
+    """Runs single scenario and returns measurements"""
+    workspace = tempfile.mkdtemp()
+    latencies = []
+    with mock_server.MockServer(
+            arguments.instance_size, arguments.latency, arguments.bandwidth,
+            arguments.error_rate, (arguments.studies, arguments.series, arguments.instances)
+    ) as server:
+        dcmweb_cli = dcmweb.Dcmweb(
+            server.url, arguments.m, None,
+            retry_policy=requests_util.RetryPolicy(backoff=arguments.backoff),
+            metrics=metrics.Metrics() if arguments.metrics else None)
+        record_latencies(dcmweb_cli.requests, latencies)
+        scenario = SCENARIOS[arguments.scenario]
+        start = time.perf_counter()
+        files = scenario(dcmweb_cli, server, workspace, arguments)
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        result = {"scenario": arguments.scenario, "seconds": round(elapsed, 3),
+                  "requests": server.requests, "errors": server.errors,
+                  "files": files, "files_per_second": round(files / elapsed, 1),
+                  "mb_per_second": round(
+                      (server.bytes_sent + server.bytes_received) / 2 ** 20 / elapsed, 2),
+                  "p50_ms": round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+                  "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+                  "peak_rss_mb": peak_rss()}
+    shutil.rmtree(workspace)
+    return result
+
+
+def parse_arguments():
+    """Parses command line of suite"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS),
+                        default=list(SCENARIOS))
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), help=argparse.SUPPRESS)
+    parser.add_argument("--studies", type=int, default=4)
+    parser.add_argument("--series", type=int, default=2)
+    parser.add_argument("--instances", type=int, default=50, help="instances per series")
+    parser.add_argument("--instance_size", type=int, default=65536)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--bandwidth", type=float, default=None,
+                        help="bytes per second of each connection")
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--backoff", type=float, default=0.05)
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--metrics", action="store_true",
+                        help="records request phases to measure overhead of metrics")
+    parser.add_argument("-m", action="store_true", help="transfers in parallel")
+    return parser.parse_args()
+
+
+def main():
+    """Prints json line of measurements per scenario, each runs in separate process"""
+    arguments = parse_arguments()
+    logging.getLogger().setLevel(logging.WARNING)
+    if arguments.scenario:
+        print(json.dumps(run(arguments)))
+        return
+    options = []
+    for name in ("studies", "series", "instances", "instance_size", "latency", "bandwidth",
+                 "error_rate", "backoff", "batch_size"):
+        if getattr(arguments, name) is not None:
+            options += ["--" + name, str(getattr(arguments, name))]
+    for flag in ("m", "metrics"):
+        if getattr(arguments, flag):
+            options.append("-" * min(len(flag), 2) + flag)
+    for scenario in arguments.scenarios:
+        sys.stdout.flush()
+        subprocess.run([sys.executable, "-m", "benchmarks.suite", "--scenario", scenario]
+                       + options, check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Compares amounts of worker threads on latency bound downloads
+
+Run from the repository root:
+    python -m benchmarks.workers [files] [latency_seconds]
+"""
+import sys
+import tempfile
+import time
+from dcmweb import dcmweb
+from dcmweb import requests_util
+from benchmarks import mock_server
+
+WORKERS = (dcmweb.worker_count(True), 64, 256)
+
+
+def run(server, files, workers):
+    """Downloads files with given amount of workers and returns measurements"""
+    server.reset()
+    requests = requests_util.Requests(server.url, None, workers)
+    output = tempfile.mkdtemp()
+    futures = ((requests.download_dicom_by_ids,
+                {"study_id": "1", "series_id": "1", "instance_id": str(i)}, output)
+               for i in range(files))
+    start = time.perf_counter()
+    transferred = dcmweb.execute_file_transfer_futures(
+        futures, True, workers, dcmweb.InflightLimit(max(dcmweb.QUEUE_LIMIT, workers)))
+    elapsed = time.perf_counter() - start
+    return {"workers": workers, "seconds": round(elapsed, 3),
+            "files_per_second": round(transferred["files"] / elapsed, 1)}
+
+
+def main():
+    """Prints results for each amount of workers"""
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    with mock_server.MockServer(latency=latency) as server:
+        for workers in WORKERS:
+            print(run(server, files, workers))
+
+
+if __name__ == "__main__":
+    main()
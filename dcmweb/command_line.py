@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
 """Wrapper for command line calls of dcmweb
 """
+import atexit
 import sys
-import fire
 from . import dcmweb
+from . import metrics as dcmweb_metrics
+from . import profiling
+from . import requests_util
+from . import token_cache as dcmweb_token_cache
+from . import trace
 
 CUSTOM_HELP = "DICOMweb command line tool is a command line utility for \
 interacting with DICOMweb servers.\n\
 \n\
-dcmweb [-m] <host> <store|retrieve|search|delete> [parameters]\n\
+dcmweb [-m] <host> [options] <store|retrieve|search|index|copy|sync|delete|batch> [parameters]\n\
 \n\
     -m \n\
 Whether to perform batch operations in parallel or sequentially, default is in sequentially\n\
@@ -16,11 +21,49 @@ Whether to perform batch operations in parallel or sequentially, default is in s
     host  \n\
 The full DICOMweb endpoint URL. E.g. `https://healthcare.googleapis.com/v1/projects/<project_id>/\
 locations/<location_id>/datasets/<dataset_id>/dicomStores/<dicom_store_id>/dicomWeb`\n\
+\n\
+    options  \n\
+ --pool_size int\n\
+Maximum amount of connections kept open to the host, defaults to the amount of transfer threads\n\
+ --keep_alive bool\n\
+Whether connections are reused between requests (defaults to True)\n\
+ --workers int\n\
+Amount of transfers performed at the same time by separate threads, overrides the -m flag, hundreds of workers suit latency bound transfers\n\
+ --max_inflight int\n\
+Maximum amount of transfers submitted and not yet finished (defaults to 100 or to the amount of workers if it is higher)\n\
+ --adaptive bool\n\
+Grows amount of transfers in flight from --workers up to --max_inflight and halves it on 429/503 responses or latency rise\n\
+ --attempts int\n\
+Amount of attempts for requests failed with 429, 5xx or connection errors (defaults to 5)\n\
+ --backoff float\n\
+Base delay in seconds between attempts, doubled on each retry unless Retry-After is sent (defaults to 1)\n\
+ --jitter bool\n\
+Whether delays between attempts are randomized (defaults to True)\n\
+ --token_cache bool|string\n\
+Shares access token between concurrent and repeated invocations by file ~/.cache/dcmweb/token.json or given path, token is refreshed 5 minutes before expiry\n\
+ --validate bool\n\
+Whether availability of the host is checked by extra request after the first failed request, so inaccessible host stops the command (defaults to True)\n\
+ --metrics bool|string\n\
+Records durations of connection setup, time to first byte, body transfer and disk writes of requests and prints their summary at exit, metrics are also written to given path as json if it ends with .json and in Prometheus text format otherwise\n\
+ --trace_file string\n\
+Writes event with url, status, bytes, timings, retry and worker of each HTTP exchange to given path in Chrome trace format, which can be opened by chrome://tracing or Perfetto UI\n\
+ --profile bool|string\n\
+Profiles the command by cProfile and prints functions with highest cumulative time of each phase at exit: discovery of files to store, listing of instances, transfers, finalization of their results and the rest of command, statistics of phases are also written to <given path>.<phase>.prof files\n\
 \n\
     store  \n\
 Stores one or more files by posting multiple StoreInstances requests. Requests will be sent in sequence or in parallel based on the -m flag.\n\
  --masks  string\n\
 Positional argument, contains list of file paths or masks to upload, mask support wildcard(*) and cross directory boundaries wildcard(**) char,\n\
+ --batch_size int\n\
+Maximum amount of files uploaded by single multipart request (defaults to 1, each file is uploaded by separate request)\n\
+ --batch_bytes int\n\
+Maximum size of files uploaded by single multipart request (defaults to 32MB), a bigger file is uploaded alone\n\
+ --scan_workers int\n\
+Amount of directories scanned in parallel while searching files matching masks (defaults to 1)\n\
+ --skip_existing bool\n\
+Skips files which instances are already stored on server, UIDs are read from file headers and checked by QIDO search per study\n\
+ --index string\n\
+Path to local index built by index command, used by --skip_existing instead of QIDO search\n\
 \n\
     retrieve  \n\
 Retrieves one or more studies, series, instances or frames from the server. Outputs the instances to the directory specified by the --output option.\n\
@@ -36,20 +79,97 @@ The following folder structure will be created:\n\
 - study_uid\n\
   - series_uid\n\
     - instance_uid[_frame_X].<ext>\n\
+ --resume bool\n\
+Skips instances recorded in .dcmweb_manifest file of the output folder by previous runs, with --bulk only missing instances of partially retrieved studies or series are downloaded one by one\n\
+ --bulk string\n\
+Retrieves all instances of each study or series (study|series) by single request, only application/dicom type is supported\n\
+ --index string\n\
+Path to local index built by index command, instances, studies or series are listed from it instead of QIDO search\n\
 \n\
     search\n\
 Performs a search over studies, series or instances and outputs the result to stdout, limited to 5000 items by default. You can specify limit/offset parameters to change this.\n\
  --path string\n\
 Positional argument, specifies a path (studies/[<uid>/series/[<uid>/instances/]]) to search on the server, default is \"/studies\"\n\
  --parameters string\n\
-QIDO search parameters formatted as URL query parameters."
+QIDO search parameters formatted as URL query parameters.\n\
+ --all bool\n\
+Follows offsets until all results are received and outputs each result as a separate json line (NDJSON)\n\
+\n\
+    index\n\
+Builds or refreshes local SQLite index of studies, series and instances on the server. Only new or changed studies are listed again.\n\
+ --database string\n\
+Path to index database file (defaults to .dcmweb_index.sqlite)\n\
+ --since string\n\
+Lists only studies with StudyDate since this date (YYYYMMDD), studies missing on the server aren't removed from index in this mode\n\
+\n\
+    copy\n\
+Copies one or more studies, series or instances to other DICOMweb server, instances are streamed from retrieve into store requests without saving to disk.\n\
+ --destination string\n\
+Positional argument, the full DICOMweb endpoint URL of destination\n\
+ --path string\n\
+Positional argument, can either be empty (indicates copying of all studies) or specify a resource path (studies/<uid>[/series/<uid>[/instances/<uid>]]) to copy\n\
+\n\
+    sync\n\
+Synchronizes output folder with the server by comparing sets of instance UIDs, instances missing on the server are stored and instances missing in output folder are retrieved.\n\
+ --path string\n\
+Positional argument, can either be empty (indicates all studies) or specify a resource path (studies/<uid>[/series/<uid>]) to synchronize\n\
+ --output string\n\
+Folder with instances saved as study_uid/series_uid/instance_uid.dcm (defaults to current directory)\n\
+ --upload bool\n\
+Whether instances missing on the server are stored (defaults to True)\n\
+ --download bool\n\
+Whether instances missing in output folder are retrieved (defaults to True)\n\
+ --index string\n\
+Path to local index built by index command, instances on the server are listed from it instead of QIDO search\n\
+\n\
+    batch\n\
+Runs commands read line by line, like \"retrieve studies/<uid> --output ./data\", in single process sharing connections and access token. Empty lines and lines starting with # are skipped, failed commands are reported and the rest continue.\n\
+ --file string\n\
+Positional argument, path to file with commands (defaults to - which reads standard input)"
 
 
-def host_wrapper(host, m):  # pylint: disable=invalid-name; disabled because m is also configuration for Fire library and it have to be one letter
+def host_wrapper(host, m, *, pool_size=None, keep_alive=True, workers=None, max_inflight=None,  # pylint: disable=invalid-name,too-many-arguments,too-many-locals; disabled because m is also configuration for Fire library and it have to be one letter, arguments are command line options
+                 adaptive=False,
+                 attempts=requests_util.ATTEMPTS, backoff=requests_util.BACKOFF, jitter=True,
+                 token_cache=False, validate=True, metrics=False, trace_file=None, profile=False):
     """host - url for dicomWeb
     m - whether to perform batch operations in parallel
-    or sequentially, default is in parallel"""
-    return dcmweb.Dcmweb(host, m == 1, dcmweb.GoogleAuthenticator())
+    or sequentially, default is in parallel
+    options are keyword only, so Fire doesn't fill them by positional arguments of command
+    pool_size - maximum amount of connections kept open to the host
+    keep_alive - whether connections are reused between requests
+    workers - amount of transfers performed at the same time
+    max_inflight - maximum amount of transfers submitted and not yet finished
+    adaptive - whether amount of transfers in flight adapts to server responses
+    attempts, backoff, jitter - retry policy of transient failures
+    token_cache - whether access token is shared with other processes by file,
+    path of the file may be given instead of True
+    validate - whether host is checked after the first failed request
+    metrics - whether phases of requests are summarized at exit,
+    path of metrics file may be given instead of True
+    trace_file - path of Chrome trace of HTTP exchanges
+    profile - whether command is profiled by phases,
+    path prefix of statistics files may be given instead of True"""
+    cache = None
+    if token_cache:
+        cache = dcmweb_token_cache.TokenCache(
+            dcmweb_token_cache.CACHE_PATH if token_cache is True else token_cache)
+    request_metrics = None
+    if metrics:
+        request_metrics = dcmweb_metrics.Metrics()
+        atexit.register(request_metrics.report, None if metrics is True else metrics)
+    tracer = None
+    if trace_file:
+        tracer = trace.Tracer(trace_file)
+        atexit.register(tracer.close)
+    profiler = None
+    if profile:
+        profiler = profiling.Profiler()
+        atexit.register(profiler.report, None if profile is True else profile)
+    return dcmweb.Dcmweb(host, m == 1, dcmweb.GoogleAuthenticator(cache), pool_size, keep_alive,
+                         workers, max_inflight, adaptive,
+                         requests_util.RetryPolicy(attempts, backoff, jitter), validate,
+                         request_metrics, tracer, profiler)
 
 
 def main():
@@ -63,4 +183,5 @@ def main():
         else:
             sys.argv.insert(1, "-m")
             sys.argv.insert(2, "0")
+    import fire  # pylint: disable=import-outside-toplevel; imported lazily to speed up start
     fire.Fire(host_wrapper)
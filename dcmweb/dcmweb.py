@@ -2,19 +2,32 @@
 """Module contains classes for interacting with DICOMweb
 """
 import logging
-import glob
+import calendar
 import os
 import re
+import shlex
 import sys
 import time
 import json
+import collections
+import functools
+import queue
+import threading
 import concurrent.futures
-import google.auth
-import google.auth.transport.requests
-from hurry.filesize import size
+try:
+    import orjson
+except ImportError:  # optional faster json backend
+    orjson = None
 
+from . import dicom_header
+from . import inventory
+from . import manifest
+from . import profiling
+from . import progress
 from . import requests_util
 from . import resources
+from . import token_cache as dcmweb_token_cache
+from . import walker
 
 logging.basicConfig(format='%(asctime)s -- %(message)s',
                     level=logging.INFO)
@@ -22,71 +35,308 @@ logging.basicConfig(format='%(asctime)s -- %(message)s',
 INDENT = 2
 SORT_KEYS = True
 QUEUE_LIMIT = 100
+QIDO_PREFETCH = 4
+STORE_BATCH_BYTES = 32 * 1024 * 1024
+STUDY_CACHE_SIZE = 64
 
+BULK_LEVELS = ("study", "series")
 
-def execute_file_transfer_futures(futures_arguments, multithreading):
-    """Executing features builded from futures_arguments set
+THROTTLE_STATUS_CODES = (429, 503)
+DECREASE_FACTOR = 0.5
+LATENCY_TOLERANCE = 2.0
+LATENCY_SMOOTHING = 0.1
+# baseline follows rising smoothed latency by this fraction, so noise doesn't keep it at minimum
+BASELINE_DECAY = 0.05
+# successes smoothed before baseline is set, so first sample alone doesn't define it
+LATENCY_WARMUP = 10
+
+
+def json_loads(text):
+    """Parses json text by the fastest available backend"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def json_line(value):
+    """Serializes value into single line of utf-8 encoded json ending by newline"""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(value, sort_keys=SORT_KEYS, separators=(",", ":")) + "\n").encode()
+
+
+def worker_count(multithreading):
+    """Returns amount of transfers performed at the same time
+    :param multithreading: flag for multithreading execution
+    """
+    if not multithreading:
+        return 1
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+class InflightLimit:
+    """Fixed limit of transfers in flight"""
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    @property
+    def value(self):
+        """Current amount of transfers allowed in flight"""
+        return self.limit
+
+    def wrap(self, function):  # pylint: disable=no-self-use; overridden by AdaptiveLimit
+        """Returns function to execute as transfer"""
+        return function
+
+
+class AdaptiveLimit(InflightLimit):  # pylint: disable=too-many-instance-attributes; state of controller
+    """Limit of transfers in flight controlled by additive increase and
+    multiplicative decrease: it grows by one per window of successful transfers
+    and is halved on 429/503 responses, retried transfers or when smoothed latency
+    rises over its baseline, slowly decaying minimum of smoothed latency"""
+
+    def __init__(self, initial, maximum, minimum=1):
+        super().__init__(float(max(minimum, initial)))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.base_latency = None
+        self.latency = None
+        self.samples = 0
+        self.hold = 0
+        self.lock = threading.Lock()
+
+    @property
+    def value(self):
+        """Current amount of transfers allowed in flight"""
+        return int(self.limit)
+
+    def wrap(self, function):
+        """Returns function which reports latency and throttling of transfer,
+        throttling also includes responses retried during transfer"""
+        def measured_function(*args):
+            start = time.monotonic()
+            try:
+                result = function(*args)
+            except requests_util.NetworkError as exception:
+                if exception.status_code in THROTTLE_STATUS_CODES or exception.retries:
+                    self.on_throttle()
+                raise
+            # 429/503 responses are retried by requests, so retried transfer was throttled
+            # and its latency includes backoff
+            if result.get("retries"):
+                self.on_throttle()
+            else:
+                self.on_success(time.monotonic() - start)
+            return result
+        return measured_function
+
+    def on_success(self, latency):
+        """Grows limit unless smoothed latency rose over tolerance of its baseline"""
+        with self.lock:
+            if self.latency is None:
+                self.latency = latency
+            self.latency += (latency - self.latency) * LATENCY_SMOOTHING
+            self.samples += 1
+            if self.samples >= LATENCY_WARMUP:
+                self._update_baseline()
+            if self.hold > 0:
+                self.hold -= 1
+            elif self.base_latency is not None and \
+                    self.latency > self.base_latency * LATENCY_TOLERANCE:
+                self._decrease()
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_throttle(self):
+        """Backs off once per window of transfers"""
+        with self.lock:
+            if self.hold > 0:
+                self.hold -= 1
+            else:
+                self._decrease()
+
+    def _update_baseline(self):
+        """Moves baseline down to lower smoothed latency, slowly up to higher one"""
+        if self.base_latency is None or self.latency < self.base_latency:
+            self.base_latency = self.latency
+        else:
+            self.base_latency += (self.latency - self.base_latency) * BASELINE_DECAY
+
+    def _decrease(self):
+        """Halves limit and ignores transfers started before it"""
+        self.hold = int(self.limit)
+        self.limit = max(self.minimum, self.limit * DECREASE_FACTOR)
+        self.latency = self.base_latency
+
+
+class StoredInstances:
+    """SOP Instance UIDs stored on server, listed once per study,
+    listings of recently used studies are cached"""
+
+    def __init__(self, list_study, cache_size=STUDY_CACHE_SIZE):
+        """
+        :param list_study: function returning instance UIDs of study by study UID
+        """
+        self.list_study = list_study
+        self.cache_size = cache_size
+        self.studies = collections.OrderedDict()
+        self.skipped = 0
+
+    def __contains__(self, ids):
+        study_id = ids[resources.STUDY_ID]
+        if study_id in self.studies:
+            self.studies.move_to_end(study_id)
+        else:
+            self.studies[study_id] = self.study_instances(study_id)
+            if len(self.studies) > self.cache_size:
+                self.studies.popitem(last=False)
+        return ids[resources.INSTANCE_ID] in self.studies[study_id]
+
+    def study_instances(self, study_id):
+        """Returns set of instance UIDs of study, empty if study can't be listed"""
+        try:
+            return set(self.list_study(study_id))
+        except requests_util.NetworkError as exception:
+            logging.error("Can't list instances of study %s: %s", study_id, exception)
+            return set()
+
+
+def account_future(done_future, transferred):
+    """Adds result of done transfer future to transferred dict
+    :param done_future: future which should return a dict {'transferred': <transferred bytes>,
+                        'files': <optional amount of files, defaults to 1>,
+                        'retries': <optional amount of retries>,
+                        'message': <optional string to be printed>}
+    :param transferred: a dict {'bytes': <amount of transferred bytes>,
+                        'files': <amount of transferred files>,
+                        'retries': <amount of retried requests>}
+    """
+    try:
+        future_result = done_future.result()
+        transferred['bytes'] += future_result["transferred"]
+        transferred['files'] += future_result.get("files", 1)
+        transferred['retries'] += future_result.get("retries", 0)
+        message = future_result.get("message")
+        if message:
+            logging.info(message)
+        for error in future_result.get("errors", ()):
+            logging.error('Transfer failure: %s', error)
+
+    except requests_util.NetworkError as exception:
+        transferred['retries'] += exception.retries
+        logging.error('Request failure: %s', exception)
+
+
+def execute_file_transfer_futures(futures_arguments, multithreading, workers=None,  # pylint: disable=too-many-arguments; options of single run
+                                  inflight_limit=None, account=account_future, total=None):
+    """Executing features builded from futures_arguments set,
+    done futures are queued by their callbacks, so a freed slot is refilled immediately
     :param futures_arguments: set of tuples to set up futures
     :param multithreading: flag for multithreading execution
-    :returns: a dict {'bytes':<amount of transferred bytes>, 'files':<amount of transferred files>}
+    :param workers: amount of threads, defaults to worker_count(multithreading)
+    :param inflight_limit: InflightLimit of futures submitted and not yet done,
+                           defaults to QUEUE_LIMIT
+    :param account: function adding result of done future to transferred dict
+    :param total: amount of transfers if known, used for ETA of progress
+    :returns: a dict {'bytes':<amount of transferred bytes>, 'files':<amount of transferred files>,
+              'retries':<amount of retried requests>}
     """
-    running_futures = set([])
-    transferred = {'bytes': 0, 'files': 0}
-    with concurrent.futures.ThreadPoolExecutor(max_workers=None if multithreading else 1)\
-            as executor:
+    done_futures = queue.Queue()
+    running = 0
+    transferred = {'bytes': 0, 'files': 0, 'retries': 0}
+    inflight_limit = inflight_limit or InflightLimit(QUEUE_LIMIT)
+    with progress.ProgressRenderer(transferred, total), concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers or worker_count(multithreading)) as executor:
         for future_arguments in futures_arguments:
-            running_futures, transferred = wait_for_futures_limit(
-                running_futures, transferred, QUEUE_LIMIT)
-            running_futures.add(executor.submit(*future_arguments))
-        wait_for_futures_limit(running_futures, transferred, 0)
-    if transferred['bytes'] > 0:
-        logging.info('')  # new line to avoid overlap by next output
+            running = wait_for_futures_limit(
+                done_futures, running, transferred, inflight_limit.value - 1, account)
+            executor.submit(inflight_limit.wrap(future_arguments[0]),
+                            *future_arguments[1:]).add_done_callback(done_futures.put)
+            running += 1
+        wait_for_futures_limit(done_futures, running, transferred, 0, account)
     return transferred
 
 
-def wait_for_futures_limit(running_futures, transferred, limit):
-    """Waits until running_futures set reaches size of limit
-    :param running_futures: set of futures awaited to be done,
-                            each future should return a dict {'transferred': <transferred bytes>,
-                            'message': <optional string to be printed>}
+def wait_for_futures_limit(done_futures, running, transferred, limit, account=account_future):  # pylint: disable=too-many-arguments; state of single run
+    """Accounts futures queued when done, futures done so far are accounted without blocking
+    and then it waits until amount of running futures reaches limit
+    :param done_futures: queue.Queue of done futures, each future should return a dict
+                         {'transferred': <transferred bytes>,
+                         'message': <optional string to be printed>,
+                         'errors': <optional list of failure messages>}
+    :param running: amount of futures submitted and not yet accounted
     :param transferred: a dict {'bytes': <amount of transferred bytes>,
                         'files': <amount of transferred files>}
-    :returns: updated transferred dict
+    :param account: function adding result of done future to transferred dict
+    :returns: amount of futures still running
     """
-    while len(running_futures) > limit:
-        done_futures, running_futures = concurrent.futures.wait(
-            running_futures, timeout=1)
-        for done_future in done_futures:
-            try:
-                future_result = done_future.result()
-                transferred['bytes'] += future_result["transferred"]
-                transferred['files'] += 1
-                message = future_result.get("message")
-                if message:
-                    logging.info(message)
+    while running:
+        try:
+            done_future = done_futures.get(block=running > limit)
+        except queue.Empty:
+            break
+        account(done_future, transferred)
+        running -= 1
+    return running
 
-            except requests_util.NetworkError as exception:
-                logging.error('Request failure: %s', exception)
-        # extra spaces to cover previous line if it has few charates
-        logging.info('Transferred %s in %s files     \x1b[1A\x1b[\x1b[80D', size(
-            transferred['bytes']), transferred['files'])
-    return running_futures, transferred
+
+def exit_if_host_unavailable(command):
+    """Decorates command to exit with error if host fails lazy validation"""
+    @functools.wraps(command)
+    def wrapper(*args, **kwargs):
+        try:
+            return command(*args, **kwargs)
+        except requests_util.HostUnavailableError as exception:
+            logging.error('%s', exception)
+            sys.exit(1)
+    return wrapper
 
 
-class Dcmweb:
+def profiled(command):
+    """Decorates command to profile it in command phase if profiler of Dcmweb is set"""
+    @functools.wraps(command)
+    def wrapper(self, *args, **kwargs):
+        if self.profiler is None:
+            return command(self, *args, **kwargs)
+        with self.profiler.phase(profiling.COMMAND):
+            return command(self, *args, **kwargs)
+    return wrapper
+
+
+class Dcmweb:  # pylint: disable=too-many-instance-attributes; keeps command line options to configure destination of copy
     """A command line utility for interacting with DICOMweb servers."""
 
-    def __init__(self, host_str, multithreading, authenticator):
+    def __init__(self, host_str, multithreading, authenticator, pool_size=None,  # pylint: disable=too-many-arguments; mirrors command line options
+                 keep_alive=True, workers=None, max_inflight=None, adaptive=False,
+                 retry_policy=None, validate=True, metrics=None, tracer=None, profiler=None):
         self.multithreading = multithreading
-        self.requests = requests_util.Requests(host_str, authenticator)
-        self._validate_request()
+        self.workers = workers or worker_count(multithreading)
+        # all workers are kept busy with default limit of transfers in flight
+        self.max_inflight = max_inflight or max(QUEUE_LIMIT, self.workers)
+        self.adaptive = adaptive
+        self.pool_size = pool_size or (
+            self.max_inflight if adaptive else self.workers) + QIDO_PREFETCH
+        self.keep_alive = keep_alive
+        self.validate = validate
+        self.profiler = profiler
+        self.requests = requests_util.Requests(
+            host_str, authenticator, self.pool_size, keep_alive, retry_policy, validate, metrics,
+            tracer)
 
-    def search(self, path="studies", parameters=""):
+    @exit_if_host_unavailable
+    @profiled
+    def search(self, path="studies", parameters="", all=False):  # pylint: disable=redefined-builtin; part of Fire lib configuration
         """Performs a search over studies, series or instances.
         :param path: Positional argument, specifies a path (studies/[<uid>/series/\
 [<uid>/instances/]]) to search on the server, default is \"/studies\"
         :param parameters: QIDO search parameters formatted as URL query parameters.
+        :param all: Follows offsets until all results are received and writes each result \
+as a separate json line (NDJSON) to stdout.
         """
+        if all:
+            self._search_all(path, parameters)
+            return None
         search_result = {}
         try:
             response = self.requests.request(
@@ -102,15 +352,57 @@ class Dcmweb:
  please use additional parameters (offset,limit) to get more', requests_util.PAGE_SIZE)
         return json.dumps(search_result, indent=INDENT, sort_keys=SORT_KEYS)
 
-    def store(self, *masks):
+    def _search_all(self, path, parameters):
+        """Streams all pages of search results to stdout as json lines"""
+        sys.stdout.flush()
+        try:
+            for results in self._search_pages(path, parameters.lstrip("?")):
+                sys.stdout.buffer.writelines(json_line(result) for result in results)
+        except requests_util.NetworkError as exception:
+            logging.error('Search failure: %s', exception)
+        sys.stdout.buffer.flush()
+
+    @exit_if_host_unavailable
+    @profiled
+    def store(self, *masks, batch_size=1, batch_bytes=STORE_BATCH_BYTES, scan_workers=1,  # pylint: disable=too-many-arguments; part of Fire lib configuration
+              skip_existing=False, index=None):
         """Stores one or more files by posting multiple StoreInstances requests.
         :param masks: Positional argument, contains list of file paths or masks to upload, \
 mask support wildcard(*) and cross directory boundaries wildcard(**) char
+        :param batch_size: Maximum amount of files uploaded by single multipart request, \
+default 1 uploads each file by separate request.
+        :param batch_bytes: Maximum size of files uploaded by single multipart request, \
+a file bigger than this limit is uploaded alone.
+        :param scan_workers: Amount of directories scanned in parallel while searching files.
+        :param skip_existing: Skips files which instances are already stored on server, \
+instance UIDs are read from file headers and checked by QIDO search per study.
+        :param index: Path to local index built by index command, used by skip_existing \
+instead of QIDO search.
         """
-        execute_file_transfer_futures(
-            self._files_to_upload(*masks), self.multithreading)
+        file_names = walker.find_files(masks, scan_workers)
+        stored = None
+        index_db = inventory.Inventory(index, self.requests.host) if index else None
+        try:
+            if skip_existing:
+                stored = StoredInstances(index_db.study_instances if index_db
+                                         else self._study_instance_uids)
+                file_names = self._files_not_stored(file_names, stored)
+            if batch_size > 1:
+                self._execute_transfers(
+                    self._batches_to_upload(file_names, batch_size, batch_bytes),
+                    profiling.DISCOVERY)
+            else:
+                self._execute_transfers(self._files_to_upload(file_names),
+                                        profiling.DISCOVERY)
+        finally:
+            if index_db is not None:
+                index_db.close()
+        if stored is not None:
+            logging.info('Skipped %s files already stored on server', stored.skipped)
 
-    def retrieve(self, path="", output="./", type=None):  # pylint: disable=redefined-builtin; part of Fire lib configuration
+    @exit_if_host_unavailable
+    @profiled
+    def retrieve(self, path="", output="./", type=None, resume=False, bulk=None, index=None):  # pylint: disable=redefined-builtin,too-many-arguments; part of Fire lib configuration
         """Retrieves one or more studies, series, instances or frames from the server.
          :param path: Positional argument, can either be empty \
 (indicates downloading of all studies) or specify a resource path (studies/<uid>[/series/<uid> \
@@ -119,7 +411,16 @@ mask support wildcard(*) and cross directory boundaries wildcard(**) char
 transfer-syntax=*). The tool will use this as the part content yype in the multipart accept header \
 being sent to the server.
          :param output: Controls where to write the files to (defaults to current directory).
+         :param resume: Skips instances recorded in completion manifest of output folder \
+by previous runs, with bulk only missing instances of studies or series retrieved partially \
+are downloaded one by one.
+         :param bulk: Retrieves all instances of each study or series (study|series) by single \
+request instead of request per instance, only application/dicom type is supported.
+         :param index: Path to local index built by index command, instances, studies or \
+series to download are listed from index instead of QIDO search.
         """
+        if bulk not in (None,) + BULK_LEVELS:
+            raise ValueError("bulk should be one of {}".format(BULK_LEVELS))
         ids = resources.ids_from_path(path)
         logging.info('Saving files into %s', output)
         if resources.get_path_level(ids) in ("instances", "frames"):
@@ -128,9 +429,119 @@ being sent to the server.
             except requests_util.NetworkError as exception:
                 logging.error('Retrieve failure: %s', exception)
             return
-        execute_file_transfer_futures(self._files_to_download(
-            ids, output, type), self.multithreading)
+        completed = manifest.Manifest(output, type) if resume else None
+        index_db = inventory.Inventory(index, self.requests.host) if index else None
+        try:
+            if bulk:
+                transfers = self._bulks_to_download(
+                    ids, output, type, bulk, completed,
+                    index_db.bulk_ids(ids, bulk) if index_db else None)
+            else:
+                transfers = self._files_to_download(
+                    index_db.instances(ids) if index_db else self._search_instances(ids),
+                    output, type, completed)
+            self._execute_transfers(transfers)
+        finally:
+            if index_db is not None:
+                index_db.close()
+            if completed is not None:
+                completed.close()
+                if completed.skipped:
+                    logging.info('Skipped %s instances retrieved by previous runs',
+                                 completed.skipped)
+
+    @exit_if_host_unavailable
+    @profiled
+    def index(self, database=inventory.INDEX_NAME, since=None):
+        """Builds or refreshes local SQLite index of studies, series and instances on the server.
+        :param database: Path to index database file (defaults to .dcmweb_index.sqlite).
+        :param since: Lists only studies with StudyDate since this date (YYYYMMDD), \
+studies missing on the server aren't removed from index in this mode.
+        """
+        parameters = "includefield={}&includefield={}&includefield={}".format(
+            resources.STUDY_DATE_TAG, resources.PATIENT_ID_TAG, resources.STUDY_INSTANCES_TAG)
+        if since:
+            parameters += "&StudyDate={}-".format(since)
+        with inventory.Inventory(database, self.requests.host) as index_db:
+            indexed = index_db.studies()
+            found = set()
+            changed = []
+            for results in self._search_pages("studies", parameters):
+                for result in results:
+                    study = inventory.study_from_json(result)
+                    found.add(study["study_uid"])
+                    # studies without instances count are listed on every refresh
+                    if study["instances"] is None or indexed.get(study["study_uid"]) != (
+                            study["study_date"], study["instances"]):
+                        changed.append(study)
+            refreshed = 0
+            for study, instances in self._list_studies_instances(changed):
+                index_db.replace_study(study, instances)
+                refreshed += 1
+            removed = [] if since else [uid for uid in indexed if uid not in found]
+            index_db.remove_studies(removed)
+            index_db.mark_refreshed()
+        logging.info('Indexed %s studies: %s refreshed, %s removed',
+                     len(found), refreshed, len(removed))
+
+    @exit_if_host_unavailable
+    @profiled
+    def copy(self, destination, path=""):
+        """Copies one or more studies, series or instances to other DICOMweb server, \
+instances are streamed from retrieve into store requests without saving to disk.
+        :param destination: Positional argument, the full DICOMweb endpoint URL of destination.
+        :param path: Positional argument, can either be empty (indicates copying of all studies) \
+or specify a resource path (studies/<uid>[/series/<uid>[/instances/<uid>]]) to copy.
+        """
+        ids = resources.ids_from_path(path)
+        if resources.get_path_level(ids) == "frames":
+            raise ValueError("frames can't be copied")
+        destination_requests = requests_util.Requests(
+            destination, self.requests.authenticator, self.pool_size, self.keep_alive,
+            self.requests.retry_policy, self.validate, self.requests.metrics,
+            self.requests.tracer)
+        logging.info('Copying into %s', destination_requests.host)
+        instances = [ids] if resources.get_path_level(ids) == "instances" \
+            else self._search_instances(ids)
+        self._execute_transfers(
+            (self.requests.copy_dicom, instance_ids, destination_requests)
+            for instance_ids in instances)
+
+    @exit_if_host_unavailable
+    @profiled
+    def sync(self, path="", output="./", upload=True, download=True, index=None):  # pylint: disable=too-many-arguments; part of Fire lib configuration
+        """Synchronizes output folder with the server, instances missing on the server \
+are stored and instances missing in output folder are retrieved.
+        :param path: Positional argument, can either be empty (indicates all studies) \
+or specify a resource path (studies/<uid>[/series/<uid>]) to synchronize.
+        :param output: Folder with instances saved as study_uid/series_uid/instance_uid.dcm \
+(defaults to current directory).
+        :param upload: Whether instances missing on the server are stored.
+        :param download: Whether instances missing in output folder are retrieved.
+        :param index: Path to local index built by index command, instances on the server \
+are listed from it instead of QIDO search.
+        """
+        ids = resources.ids_from_path(path)
+        if resources.get_path_level(ids) not in ("root", "studies", "series"):
+            raise ValueError("only studies or series can be synchronized")
+        local = {manifest.manifest_key(instance_ids)
+                 for instance_ids in walker.find_instances(output, ids)}
+        if index:
+            with inventory.Inventory(index, self.requests.host) as index_db:
+                remote = {manifest.manifest_key(instance_ids)
+                          for instance_ids in index_db.instances(ids)}
+        else:
+            remote = {manifest.manifest_key(instance_ids)
+                      for instance_ids in self._search_instances(ids)}
+        to_upload = sorted(local - remote) if upload else []
+        to_download = sorted(remote - local) if download else []
+        logging.info('Storing %s and retrieving %s instances, %s are in sync',
+                     len(to_upload), len(to_download), len(local & remote))
+        self._execute_transfers(self._instances_to_sync(output, to_upload, to_download),
+                                total=len(to_upload) + len(to_download))
 
+    @exit_if_host_unavailable
+    @profiled
     def delete(self, path):
         """Deletes the given study, series or instance from the server.
         :param path: Positional argument, specifies a path (studies/[<uid>/series/\
@@ -142,7 +553,8 @@ being sent to the server.
             if "name" in response_json:
                 operation_name = response_json["name"]
                 base_url = re.match('^.+//([^/]+/){2}', self.requests.host).group()
-                requests = requests_util.Requests(base_url, self.requests.authenticator)
+                requests = requests_util.Requests(base_url, self.requests.authenticator,
+                                                  retry_policy=self.requests.retry_policy)
                 is_done = False
                 while not is_done:
                     time.sleep(1)
@@ -158,58 +570,331 @@ being sent to the server.
             logging.error('Delete failure: %s', exception)
         return ""
 
-    def _files_to_upload(self, *masks):
-        """Generates set of argumets to run upload based on masks"""
-        for mask in masks:
-            mask = mask.replace("**", "**/*")
-            files_list = glob.glob(mask, recursive=True)
-            if len(files_list) < 1:
-                logging.error('No files found matching %s', mask)
-            for file_name in files_list:
-                if not os.path.isdir(file_name):
-                    yield (self.requests.upload_dicom, file_name)
-
-    def _files_to_download(self, ids, output, mime_type):
-        """Generates set of argumets to run download based on ids dict"""
-        page = 0
-        instances = []
-        while page == 0 or len(instances) > 0:
-            page_content = self.requests.search_instances_by_page(
-                ids, "includefield={}&includefield={}"
-                .format(resources.STUDY_TAG, resources.SERIES_TAG), page)
-            instances = json.loads(page_content)
+    def batch(self, file="-"):
+        """Runs commands read line by line from a file, all of them share connections \
+and credentials of this process. Empty lines and lines starting with # are skipped.
+        :param file: Positional argument, path to a file with commands like \
+"retrieve studies/<uid> --output ./data", default "-" reads standard input.
+        """
+        import fire  # pylint: disable=import-outside-toplevel; imported lazily to speed up start
+        commands = sys.stdin if file == "-" else open(file, "r")
+        failures = 0
+        try:
+            for line in commands:
+                if not self._run_batch_line(fire, line):
+                    failures += 1
+        finally:
+            if commands is not sys.stdin:
+                commands.close()
+        if failures:
+            logging.error('%s commands failed', failures)
+            sys.exit(1)
+
+    def _run_batch_line(self, fire, line):
+        """Runs single command line of batch by Fire
+        :returns: False if command failed
+        """
+        try:
+            arguments = shlex.split(line, comments=True)
+            if not arguments:
+                return True
+            if arguments[0] == "batch":
+                raise ValueError("batch can't be nested")
+            fire.Fire(self, command=arguments, name="dcmweb")
+        except fire.core.FireExit as exception:
+            return not exception.code
+        # commands fail separately, only inaccessible host stops the batch
+        except (ValueError, OSError, requests_util.NetworkError) as exception:
+            logging.error('Command %s failed: %s', line.strip(), exception)
+            return False
+        return True
+
+    def _execute_transfers(self, futures_arguments, phase=profiling.LISTING, total=None):
+        """Runs transfers by pool of worker threads,
+        in adaptive mode amount of transfers in flight grows from workers up to max_inflight
+        :param phase: profiling phase of generating futures_arguments, discovery or listing
+        :param total: amount of transfers if known, progress shows ETA then
+        """
+        account = account_future
+        if self.profiler is not None:
+            futures_arguments = self._profiled_transfers(futures_arguments, phase)
+            account = self.profiler.wrap(profiling.FINALIZATION, account_future)
+        workers = self.workers
+        inflight_limit = InflightLimit(self.max_inflight)
+        if self.adaptive:
+            workers = max(self.workers, self.max_inflight)
+            inflight_limit = AdaptiveLimit(self.workers, self.max_inflight)
+        return execute_file_transfer_futures(
+            futures_arguments, self.multithreading, workers, inflight_limit, account, total)
+
+    def _profiled_transfers(self, futures_arguments, phase):
+        """Generates futures_arguments, producing them is profiled in phase
+        and their transfer functions in transfer phase"""
+        for future_arguments in self.profiler.iterate(phase, futures_arguments):
+            yield (self.profiler.wrap(profiling.TRANSFER, future_arguments[0]),) + \
+                tuple(future_arguments[1:])
+
+    @staticmethod
+    def _files_not_stored(file_names, stored):
+        """Generates names of files which instances aren't found on server,
+        files with unreadable headers are uploaded as well
+        :param stored: StoredInstances, counts skipped files
+        """
+        for file_name in file_names:
+            try:
+                ids = dicom_header.read_file_ids(file_name)
+            except (ValueError, LookupError) as exception:
+                logging.debug("Can't read UIDs of %s: %s", file_name, exception)
+                yield file_name
+                continue
+            if ids in stored:
+                stored.skipped += 1
+            else:
+                yield file_name
+
+    def _files_to_upload(self, file_names):
+        """Generates set of argumets to run upload of each file"""
+        for file_name in file_names:
+            yield (self.requests.upload_dicom, file_name)
+
+    def _batches_to_upload(self, file_names, batch_size, batch_bytes):
+        """Generates set of argumets to run batch uploads of files,
+        each batch is limited by amount of files and their total size"""
+        batch = []
+        batch_length = 0
+        for file_name in file_names:
+            file_size = os.path.getsize(file_name)
+            if batch and (len(batch) >= batch_size or batch_length + file_size > batch_bytes):
+                yield (self.requests.upload_dicom_batch, batch)
+                batch = []
+                batch_length = 0
+            batch.append(file_name)
+            batch_length += file_size
+        if batch:
+            yield (self.requests.upload_dicom_batch, batch)
+
+    def _search_pages(self, path, parameters, prefetch=QIDO_PREFETCH):
+        """Generates lists of QIDO results page by page until page isn't full,
+        once first page is full, next pages are requested in parallel while current one
+        is consumed
+        :param prefetch: amount of pages requested at the same time
+        """
+        limit = requests_util.page_limit(parameters)
+        results = json_loads(self.requests.search_by_page(path, parameters, 0))
+        executor = None
+        pages = collections.deque()
+        next_page = 1
+        try:
+            while len(results) >= limit:
+                if executor is None:
+                    executor = concurrent.futures.ThreadPoolExecutor(max_workers=prefetch)
+                while len(pages) < prefetch:
+                    pages.append(executor.submit(
+                        self.requests.search_by_page, path, parameters, next_page))
+                    next_page += 1
+                yield results
+                results = json_loads(pages.popleft().result())
+            if results:
+                yield results
+        finally:
+            for page in pages:
+                page.cancel()
+            # pages beyond results or unneeded after generator was closed aren't waited for
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def _search_instances(self, ids, prefetch=QIDO_PREFETCH):
+        """Generates dicts of ids of instances inside study or series of ids listed by QIDO"""
+        for instances in self._search_pages(
+                resources.path_from_ids(ids) + "/instances", "includefield={}&includefield={}"
+                .format(resources.STUDY_TAG, resources.SERIES_TAG), prefetch):
             for instance in instances:
-                yield (self.requests.download_dicom_by_ids,
-                       resources.ids_from_json(instance), output, mime_type)
-            page += 1
+                yield resources.ids_from_json(instance)
 
-    def _validate_request(self):
-        """Performs request to check availability of service"""
+    def _search_bulk_ids(self, ids, bulk):
+        """Generates dicts of ids of studies or series (bulk is study|series)
+        inside study or series of ids listed by QIDO"""
+        level_path = "/studies" if bulk == "study" else "/series"
+        for results in self._search_pages(
+                resources.path_from_ids(ids) + level_path,
+                "includefield={}".format(resources.STUDY_TAG)):
+            for result in results:
+                study_id = ids.get(resources.STUDY_ID) or resources.get_dicom_tag(
+                    result, resources.STUDY_TAG)
+                bulk_ids = {resources.STUDY_ID: study_id}
+                if bulk == "series":
+                    bulk_ids[resources.SERIES_ID] = resources.get_dicom_tag(
+                        result, resources.SERIES_TAG)
+                yield bulk_ids
+
+    def _study_instances(self, study_id):
+        """Returns list of dicts of ids of study instances listed by QIDO,
+        empty if study isn't found"""
         try:
-            self.requests.request("studies", "limit=1", {})
+            return list(self._search_instances({resources.STUDY_ID: study_id}, prefetch=1))
         except requests_util.NetworkError as exception:
-            logging.error('host %s is inaccessible: %s',
-                          self.requests.host, exception)
-            sys.exit(1)
+            if exception.status_code == 404:
+                return []
+            raise
+
+    def _list_studies_instances(self, studies):
+        """Generates tuples of study and list of its instances ids, instances of several
+        studies are listed in parallel, studies which can't be listed are skipped"""
+        studies = iter(studies)
+        pending = collections.deque()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                for study in studies:
+                    pending.append((study, executor.submit(
+                        self._study_instances, study["study_uid"])))
+                    if len(pending) >= self.workers * 2:
+                        break
+                if not pending:
+                    return
+                study, listing = pending.popleft()
+                try:
+                    yield study, listing.result()
+                except requests_util.NetworkError as exception:
+                    logging.error("Can't list instances of study %s: %s",
+                                  study["study_uid"], exception)
+
+    def _study_instance_uids(self, study_id):
+        """Returns list of instance UIDs of study listed by QIDO"""
+        return [ids[resources.INSTANCE_ID] for ids in self._study_instances(study_id)]
+
+    def _files_to_download(self, instances, output, mime_type, completed=None):
+        """Generates set of argumets to run download of each instance of instances ids,
+        instances present in completed manifest are skipped"""
+        for instance_ids in instances:
+            if completed is None:
+                yield (self.requests.download_dicom_by_ids, instance_ids, output, mime_type)
+            elif instance_ids in completed:
+                completed.skipped += 1
+            else:
+                yield (self._download_to_manifest, instance_ids, output, mime_type,
+                       completed)
+
+    def _bulks_to_download(self, ids, output, mime_type, bulk, completed=None, bulks=None):  # pylint: disable=too-many-arguments; mirrors retrieve options
+        """Generates set of argumets to download every study or series of ids
+        by single request, downloaded instances are recorded in completed manifest,
+        studies or series retrieved partially by previous runs are listed and only
+        their missing instances are downloaded, one request per instance
+        :param bulks: optional ids of studies or series to download, listed by QIDO if omitted
+        """
+        on_instance = completed.add if completed is not None else None
+        level = resources.get_path_level(ids)
+        if level == "series" or (level == "studies" and bulk == "study"):
+            bulks = [ids]
+        elif bulks is None:
+            bulks = self._search_bulk_ids(ids, bulk)
+        for bulk_ids in bulks:
+            if completed is not None and completed.instances(bulk_ids):
+                yield from self._files_to_download(
+                    self._search_instances(bulk_ids), output, mime_type, completed)
+            else:
+                yield (self.requests.download_dicom_bulk, bulk_ids, output, mime_type,
+                       on_instance)
+
+    def _instances_to_sync(self, output, to_upload, to_download):
+        """Generates set of argumets to run uploads and downloads of instances
+        by their study_uid/series_uid/instance_uid keys"""
+        for key in to_upload:
+            yield (self.requests.upload_dicom,
+                   os.path.join(output, key + requests_util.DCM_EXTENSION))
+        for key in to_download:
+            yield (self.requests.download_dicom_by_ids,
+                   dict(zip((resources.STUDY_ID, resources.SERIES_ID, resources.INSTANCE_ID),
+                            key.split(resources.SPLIT_CHAR))), output, None)
+
+    def _download_to_manifest(self, ids, output, mime_type, completed):
+        """Downloads instance and records it in completed manifest"""
+        result = self.requests.download_dicom_by_ids(ids, output, mime_type)
+        completed.add(ids)
+        return result
 
 
 class GoogleAuthenticator:
-    """Handles authenticattion with Google"""
+    """Handles authenticattion with Google, authorization headers are precomputed
+    and shared by threads without locking until token is about to expire"""
 
-    def __init__(self):
+    def __init__(self, token_cache=None):
+        """
+        :param token_cache: optional TokenCache shared with other processes
+        """
         self.credentials = None
+        self.token_cache = token_cache
+        self.margin = token_cache.margin if token_cache else dcmweb_token_cache.REFRESH_MARGIN
+        # tuple of authorization headers and their expiry, replaced as a whole on refresh
+        self.header = None
+        self.refresh_lock = threading.Lock()
 
     def apply_credentials(self, headers):
         """Adds token to request"""
-        self.check_and_refresh_credentials()
-        self.credentials.apply(headers)
+        header = self.header
+        if header is None or header[1] - self.margin <= time.time():
+            header = self.refresh_header(header)
+        headers.update(header[0])
         return headers
 
-    def check_and_refresh_credentials(self):
-        """Updates credentials if not valid"""
+    def refresh_header(self, stale):
+        """Refreshes authorization headers by single thread, while refresh is in flight
+        other threads keep using stale token if it hasn't expired yet or wait otherwise
+        :param stale: headers tuple seen by caller as expiring
+        """
+        if stale is not None and stale[1] > time.time():
+            if not self.refresh_lock.acquire(blocking=False):
+                return stale
+        else:
+            self.refresh_lock.acquire()
+        try:
+            if self.header is not stale:  # refreshed by other thread meanwhile
+                return self.header
+            if self.token_cache is None:
+                self.check_and_refresh_credentials(self.margin)
+                headers = {}
+                self.credentials.apply(headers)  # changes headers in place, returns None
+                header = (headers, credentials_expiry(self.credentials))
+            else:
+                token, expiry = self.cached_token()
+                header = ({"authorization": "Bearer {}".format(token)}, expiry)
+            self.header = header
+            return header
+        finally:
+            self.refresh_lock.release()
+
+    def check_and_refresh_credentials(self, margin=0):
+        """Updates credentials if not valid or if they expire in less than margin seconds"""
+        # google.auth isn't imported at all while token is taken from token cache
+        import google.auth  # pylint: disable=import-outside-toplevel; imported lazily to speed up start
+        import google.auth.transport.requests  # pylint: disable=import-outside-toplevel; imported lazily to speed up start
         if self.credentials is None:
             self.credentials = google.auth.default(
                 scopes=['https://www.googleapis.com/auth/cloud-platform'])[0]
-        if not self.credentials.valid:
+        if not self.credentials.valid or credentials_expiry(self.credentials) - margin \
+                <= time.time():
             auth_req = google.auth.transport.requests.Request()
             self.credentials.refresh(auth_req)
+
+    def cached_token(self):
+        """Returns token and its expiry from token cache, token is refreshed and stored
+        in cache under lock if cached one expires soon
+        :returns: tuple of token and expiry in seconds since epoch
+        """
+        key = dcmweb_token_cache.credentials_key()
+        with self.token_cache.locked():
+            cached = self.token_cache.read(key)
+            if cached is not None:
+                return cached
+            self.check_and_refresh_credentials(self.margin)
+            if self.credentials.expiry is None:
+                return self.credentials.token, time.time() + 2 * self.margin
+            expiry = credentials_expiry(self.credentials)
+            self.token_cache.write(key, self.credentials.token, expiry)
+            return self.credentials.token, expiry
+
+
+def credentials_expiry(credentials):
+    """Returns expiry of credentials in seconds since epoch, infinity if they don't expire"""
+    if credentials.expiry is None:
+        return float("inf")
+    return calendar.timegm(credentials.expiry.timetuple())
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Module contains minimal reader of DICOM file headers,
+it reads elements up to Series Instance UID and never touches pixel data
+"""
+import struct
+
+from . import resources
+
+PREAMBLE_LENGTH = 128
+PREFIX = b"DICM"
+
+IMPLICIT_VR_LITTLE_ENDIAN = "1.2.840.10008.1.2"
+EXPLICIT_VR_BIG_ENDIAN = "1.2.840.10008.1.2.2"
+DEFLATED_EXPLICIT_VR_LITTLE_ENDIAN = "1.2.840.10008.1.2.1.99"
+
+META_GROUP = 0x0002
+TRANSFER_SYNTAX_TAG = (0x0002, 0x0010)
+TAG_IDS = {(0x0020, 0x000D): resources.STUDY_ID,
+           (0x0020, 0x000E): resources.SERIES_ID,
+           (0x0008, 0x0018): resources.INSTANCE_ID}
+LAST_TAG = max(TAG_IDS)
+
+ITEM = (0xFFFE, 0xE000)
+ITEM_END = (0xFFFE, 0xE00D)
+SEQUENCE_END = (0xFFFE, 0xE0DD)
+UNDEFINED_LENGTH = 0xFFFFFFFF
+LONG_LENGTH_VRS = (b"OB", b"OD", b"OF", b"OL", b"OV", b"OW", b"SQ", b"SV",
+                   b"UC", b"UN", b"UR", b"UT", b"UV")
+
+
+def read_ids(file):
+    """Reads study, series and instance UIDs from DICOM part 10 file
+    :param file: binary file object positioned at start of file
+    :returns: a dict of ids study_id:<uid>, series_id:<uid>, instance_id:<uid>
+    """
+    reader = HeaderReader(file)
+    if reader.read(PREAMBLE_LENGTH + len(PREFIX))[PREAMBLE_LENGTH:] != PREFIX:
+        raise ValueError("missing DICM prefix")
+    transfer_syntax = reader.read_meta()
+    if transfer_syntax == DEFLATED_EXPLICIT_VR_LITTLE_ENDIAN:
+        raise ValueError("unsupported transfer syntax {}".format(transfer_syntax))
+    reader.explicit = transfer_syntax != IMPLICIT_VR_LITTLE_ENDIAN
+    reader.byte_order = ">" if transfer_syntax == EXPLICIT_VR_BIG_ENDIAN else "<"
+    ids = reader.read_dataset()
+    for id_key in TAG_IDS.values():
+        if id_key not in ids:
+            raise LookupError("Can't find {} in file header".format(id_key))
+    return ids
+
+
+def read_file_ids(file_name):
+    """Reads study, series and instance UIDs from DICOM file in file system"""
+    with open(file_name, "rb") as file:
+        return read_ids(file)
+
+
+class HeaderReader:
+    """Reads data elements from file object"""
+
+    def __init__(self, file):
+        self.file = file
+        self.pending = b""
+        self.explicit = True
+        self.byte_order = "<"
+
+    def read(self, size):
+        """Reads exactly size bytes"""
+        data = self.pending[:size]
+        self.pending = self.pending[size:]
+        if len(data) < size:
+            data += self.file.read(size - len(data))
+        if len(data) < size:
+            raise ValueError("unexpected end of DICOM header")
+        return data
+
+    def skip(self, size):
+        """Skips size bytes of element value"""
+        while size > 0:
+            size -= len(self.read(min(size, 65536)))
+
+    def peek_group(self):
+        """Returns group of next element without consuming it"""
+        self.pending = self.read(2) + self.pending
+        return struct.unpack("<H", self.pending[:2])[0]
+
+    def read_element(self, explicit, byte_order):
+        """Reads element tag, VR and value length"""
+        tag = struct.unpack(byte_order + "HH", self.read(4))
+        if tag[0] == 0xFFFE:
+            return tag, None, struct.unpack(byte_order + "I", self.read(4))[0]
+        if not explicit:
+            return tag, None, struct.unpack(byte_order + "I", self.read(4))[0]
+        value_representation = self.read(2)
+        if value_representation in LONG_LENGTH_VRS:
+            self.read(2)
+            return tag, value_representation, struct.unpack(byte_order + "I", self.read(4))[0]
+        return tag, value_representation, struct.unpack(byte_order + "H", self.read(2))[0]
+
+    def read_meta(self):
+        """Reads file meta information group, always explicit VR little endian
+        :returns: transfer syntax uid of dataset
+        """
+        transfer_syntax = None
+        while self.peek_group() == META_GROUP:
+            tag, value_representation, length = self.read_element(True, "<")
+            if tag == TRANSFER_SYNTAX_TAG:
+                transfer_syntax = decode_uid(self.read(length))
+            else:
+                self.skip_value(value_representation, length, True)
+        if transfer_syntax is None:
+            raise LookupError("Can't find transfer syntax in file meta information")
+        return transfer_syntax
+
+    def read_dataset(self):
+        """Reads top level elements until Series Instance UID
+        :returns: a dict of ids found in dataset
+        """
+        ids = {}
+        while True:
+            tag, value_representation, length = self.read_element(
+                self.explicit, self.byte_order)
+            if tag > LAST_TAG:
+                return ids
+            if tag in TAG_IDS:
+                ids[TAG_IDS[tag]] = decode_uid(self.read(length))
+                if len(ids) == len(TAG_IDS):
+                    return ids
+            else:
+                self.skip_value(value_representation, length, self.explicit)
+
+    def skip_value(self, value_representation, length, explicit):
+        """Skips element value, undefined length values are sequences of items"""
+        if length != UNDEFINED_LENGTH:
+            self.skip(length)
+            return
+        # values of UN elements with undefined length are encoded as implicit VR
+        explicit = explicit and value_representation != b"UN"
+        while True:
+            tag, _, item_length = self.read_element(explicit, self.byte_order)
+            if tag == SEQUENCE_END:
+                return
+            if tag != ITEM:
+                raise ValueError("unexpected tag {} in sequence".format(tag))
+            if item_length != UNDEFINED_LENGTH:
+                self.skip(item_length)
+                continue
+            self.skip_item(explicit)
+
+    def skip_item(self, explicit):
+        """Skips elements of undefined length item"""
+        while True:
+            tag, value_representation, length = self.read_element(explicit, self.byte_order)
+            if tag == ITEM_END:
+                return
+            self.skip_value(value_representation, length, explicit)
+
+
+def decode_uid(value):
+    """Decodes UI value padded by null or space"""
+    return value.decode("ascii").strip("\0 ")
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Module contains local SQLite index of studies, series and instances stored on server
+"""
+import sqlite3
+import time
+
+from . import resources
+
+INDEX_NAME = ".dcmweb_index.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS studies (study_uid TEXT PRIMARY KEY, study_date TEXT,
+    patient_id TEXT, instances INTEGER);
+CREATE TABLE IF NOT EXISTS series (study_uid TEXT NOT NULL, series_uid TEXT NOT NULL,
+    PRIMARY KEY (study_uid, series_uid)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS instances (study_uid TEXT NOT NULL, series_uid TEXT NOT NULL,
+    instance_uid TEXT NOT NULL, PRIMARY KEY (study_uid, series_uid, instance_uid)) WITHOUT ROWID;
+"""
+
+COLUMN_IDS = (("study_uid", resources.STUDY_ID), ("series_uid", resources.SERIES_ID),
+              ("instance_uid", resources.INSTANCE_ID))
+
+
+def tag_value(json_dict, tag):
+    """Returns first value of tag in dicom json dict, None if tag has no value"""
+    values = json_dict.get(tag, {}).get("Value")
+    return values[0] if values else None
+
+
+def study_from_json(json_dict):
+    """Builds study row from QIDO study result"""
+    instances = tag_value(json_dict, resources.STUDY_INSTANCES_TAG)
+    return {"study_uid": resources.get_dicom_tag(json_dict, resources.STUDY_TAG),
+            "study_date": tag_value(json_dict, resources.STUDY_DATE_TAG),
+            "patient_id": tag_value(json_dict, resources.PATIENT_ID_TAG),
+            "instances": int(instances) if instances is not None else None}
+
+
+def ids_filter(ids, columns=COLUMN_IDS):
+    """Builds sql condition and its parameters selecting rows of ids"""
+    conditions = ["1"]
+    parameters = []
+    for column, id_key in columns:
+        if ids.get(id_key):
+            conditions.append("{} = ?".format(column))
+            parameters.append(ids[id_key])
+    return " AND ".join(conditions), parameters
+
+
+class Inventory:
+    """SQLite index of server contents, refreshed by index command
+    and queried instead of QIDO searches"""
+
+    def __init__(self, path, host):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'host'").fetchone()
+        if row is None:
+            with self.connection:
+                self.connection.execute("INSERT INTO meta VALUES ('host', ?)", (host,))
+        elif row[0] != host:
+            self.connection.close()
+            raise ValueError("index {} belongs to {}".format(path, row[0]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def studies(self):
+        """Returns dict {<study uid>: (<study date>, <amount of instances>)} of indexed studies"""
+        return {row[0]: (row[1], row[2]) for row in self.connection.execute(
+            "SELECT study_uid, study_date, instances FROM studies")}
+
+    def replace_study(self, study, instances):
+        """Replaces study and its series and instances
+        :param study: dict with study row, see study_from_json
+        :param instances: list of dicts of ids of study instances
+        """
+        rows = [(ids[resources.STUDY_ID], ids[resources.SERIES_ID], ids[resources.INSTANCE_ID])
+                for ids in instances]
+        with self.connection:
+            self.remove_studies([study["study_uid"]], commit=False)
+            self.connection.execute(
+                "INSERT INTO studies VALUES (:study_uid, :study_date, :patient_id, :instances)",
+                study)
+            self.connection.executemany("INSERT OR IGNORE INTO series VALUES (?, ?)",
+                                        {row[:2] for row in rows})
+            self.connection.executemany("INSERT OR IGNORE INTO instances VALUES (?, ?, ?)", rows)
+
+    def remove_studies(self, study_uids, commit=True):
+        """Removes studies with their series and instances"""
+        for table in ("instances", "series", "studies"):
+            self.connection.executemany(
+                "DELETE FROM {} WHERE study_uid = ?".format(table),
+                ((study_uid,) for study_uid in study_uids))
+        if commit:
+            self.connection.commit()
+
+    def mark_refreshed(self):
+        """Records time of finished refresh"""
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('refreshed', ?)",
+                                    (time.strftime("%Y-%m-%dT%H:%M:%S"),))
+
+    def instances(self, ids):
+        """Generates dicts of ids of indexed instances inside study or series of ids"""
+        condition, parameters = ids_filter(ids)
+        for row in self.connection.execute(
+                "SELECT study_uid, series_uid, instance_uid FROM instances WHERE {} "
+                "ORDER BY study_uid, series_uid".format(condition), parameters):
+            yield dict(zip((id_key for _, id_key in COLUMN_IDS), row))
+
+    def bulk_ids(self, ids, bulk):
+        """Generates dicts of ids of indexed studies or series (bulk is study|series)
+        inside study or series of ids"""
+        columns = COLUMN_IDS[:1] if bulk == "study" else COLUMN_IDS[:2]
+        condition, parameters = ids_filter(ids, columns)
+        table = "studies" if bulk == "study" else "series"
+        for row in self.connection.execute("SELECT {} FROM {} WHERE {} ORDER BY 1".format(
+                ", ".join(column for column, _ in columns), table, condition), parameters):
+            yield dict(zip((id_key for _, id_key in columns), row))
+
+    def study_instances(self, study_uid):
+        """Returns list of instance UIDs of indexed study"""
+        return [row[0] for row in self.connection.execute(
+            "SELECT instance_uid FROM instances WHERE study_uid = ?", (study_uid,))]
+
+    def close(self):
+        """Closes database"""
+        self.connection.close()
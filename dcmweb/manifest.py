@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Module contains completion manifest used to resume retrieve
+"""
+import collections
+import os
+import re
+from threading import Lock
+
+from . import resources
+
+MANIFEST_NAME = ".dcmweb_manifest"
+
+
+def manifest_key(ids):
+    """Builds manifest line from dict of ids"""
+    return resources.SPLIT_CHAR.join(
+        (ids[resources.STUDY_ID], ids[resources.SERIES_ID], ids[resources.INSTANCE_ID]))
+
+
+def manifest_path(output, mime_type=None):
+    """Builds path of manifest, files of different types are tracked separately"""
+    name = MANIFEST_NAME
+    if mime_type:
+        name += "_" + re.sub("[^0-9A-Za-z.]+", "_", mime_type)
+    return os.path.join(output, name)
+
+
+class Manifest:
+    """Append only list of instances retrieved into output folder,
+    one study_uid/series_uid/instance_uid line per instance"""
+
+    def __init__(self, output, mime_type=None):
+        self.path = manifest_path(output, mime_type)
+        self.done = set()
+        # amounts of recorded instances by study_uid and study_uid/series_uid
+        self.counts = collections.Counter()
+        self.skipped = 0
+        self.lock = Lock()
+        interrupted = False
+        if os.path.isfile(self.path):
+            with open(self.path, "r") as file:
+                for line in file:
+                    # line without new line char is leftover of interrupted write
+                    interrupted = not line.endswith("\n")
+                    uids = line[:-1].split(resources.SPLIT_CHAR)
+                    if not interrupted and len(uids) == 3 and all(uids):
+                        self._record(line[:-1])
+        os.makedirs(output, exist_ok=True)
+        self.file = open(self.path, "a")
+        if interrupted:
+            self.file.write("\n")
+
+    def __contains__(self, ids):
+        return manifest_key(ids) in self.done
+
+    def instances(self, ids):
+        """Returns amount of recorded instances inside study or series of ids"""
+        return self.counts[resources.SPLIT_CHAR.join(
+            ids[key] for key in (resources.STUDY_ID, resources.SERIES_ID) if key in ids)]
+
+    def add(self, ids):
+        """Records instance as retrieved"""
+        key = manifest_key(ids)
+        with self.lock:
+            self._record(key)
+            self.file.write(key + "\n")
+            self.file.flush()
+
+    def _record(self, key):
+        """Adds manifest key to done instances and counts it in its study and series"""
+        if key in self.done:
+            return
+        self.done.add(key)
+        study, series, _ = key.split(resources.SPLIT_CHAR)
+        self.counts[study] += 1
+        self.counts[study + resources.SPLIT_CHAR + series] += 1
+
+    def close(self):
+        """Closes manifest file"""
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
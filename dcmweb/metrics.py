@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""Module contains histograms of request phases: connection setup, time to first byte,
+body transfer and disk writes, reported as summary, Prometheus text format or json
+"""
+import json
+import logging
+import math
+import threading
+import time
+
+PHASES = ("connect", "ttfb", "body", "disk_write")
+# upper bounds of buckets in seconds from 1ms to about a minute, doubling
+BUCKETS = tuple(0.001 * 2 ** power for power in range(17))
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def bucket_index(seconds):
+    """Returns index of first bucket which upper bound isn't less than seconds"""
+    if seconds <= BUCKETS[0]:
+        return 0
+    return min(math.ceil(math.log2(seconds / BUCKETS[0])), len(BUCKETS))
+
+
+class Histogram:
+    """Counts observations by exponential buckets, last bucket counts values above BUCKETS"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        """Adds observation, caller keeps histogram locked"""
+        self.buckets[bucket_index(seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, share):
+        """Returns upper bound of bucket containing share of observations,
+        infinity if it is above last bucket"""
+        rank = share * self.count
+        cumulative = 0
+        for index, count in enumerate(self.buckets):
+            cumulative += count
+            if count and cumulative >= rank:
+                return BUCKETS[index] if index < len(BUCKETS) else float("inf")
+        return 0.0
+
+    def cumulative(self):
+        """Returns list of tuples of upper bound label and count of observations below it"""
+        bounds = ["{:g}".format(bound) for bound in BUCKETS] + ["+Inf"]
+        counts = []
+        total = 0
+        for count in self.buckets:
+            total += count
+            counts.append(total)
+        return list(zip(bounds, counts))
+
+
+class Metrics:
+    """Thread safe histograms of request phases and counters of transferred bytes"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {phase: Histogram() for phase in PHASES}
+        self.received = 0
+        self.written = 0
+        self.start = time.monotonic()
+
+    def observe(self, phase, seconds, received=0, written=0):
+        """Records duration of phase of single request and bytes transferred by it"""
+        with self.lock:
+            self.histograms[phase].observe(seconds)
+            self.received += received
+            self.written += written
+
+    def observe_response(self, response, seconds, stream):
+        """Records time to first byte of response and body transfer of not streamed response
+        :param seconds: duration of whole request
+        """
+        ttfb = response.elapsed.total_seconds()
+        self.observe("ttfb", ttfb)
+        if not stream:
+            self.observe("body", max(seconds - ttfb, 0.0), len(response.content))
+
+    def transfer(self):
+        """Returns timer of streamed response body"""
+        return TransferTimer(self)
+
+    def to_json(self):
+        """Returns dict with quantiles and cumulative buckets of phases"""
+        with self.lock:
+            return {"seconds": round(time.monotonic() - self.start, 3),
+                    "received_bytes": self.received, "written_bytes": self.written,
+                    "phases": {phase: {
+                        "count": histogram.count, "sum": round(histogram.sum, 6),
+                        "quantiles": {str(share): histogram.quantile(share)
+                                      for share in QUANTILES},
+                        "buckets": dict(histogram.cumulative())}
+                               for phase, histogram in self.histograms.items()}}
+
+    def to_prometheus(self):
+        """Returns metrics in Prometheus text exposition format"""
+        lines = ["# HELP dcmweb_phase_seconds Duration of request phases.",
+                 "# TYPE dcmweb_phase_seconds histogram"]
+        with self.lock:
+            for phase, histogram in self.histograms.items():
+                lines += ['dcmweb_phase_seconds_bucket{{phase="{}",le="{}"}} {}'.format(
+                    phase, bound, count) for bound, count in histogram.cumulative()]
+                lines.append('dcmweb_phase_seconds_sum{{phase="{}"}} {}'.format(
+                    phase, histogram.sum))
+                lines.append('dcmweb_phase_seconds_count{{phase="{}"}} {}'.format(
+                    phase, histogram.count))
+            lines += ["# HELP dcmweb_received_bytes_total Bytes of response bodies.",
+                      "# TYPE dcmweb_received_bytes_total counter",
+                      "dcmweb_received_bytes_total {}".format(self.received),
+                      "# HELP dcmweb_written_bytes_total Bytes written to disk.",
+                      "# TYPE dcmweb_written_bytes_total counter",
+                      "dcmweb_written_bytes_total {}".format(self.written)]
+        return "\n".join(lines) + "\n"
+
+    def report(self, path=None):
+        """Logs summary of phases and writes metrics to path if given,
+        as json if path ends with .json and in Prometheus text format otherwise"""
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        with self.lock:
+            for phase, histogram in self.histograms.items():
+                if histogram.count:
+                    logging.info('%s: %s requests, mean %.1fms, p50 <= %gms, p99 <= %gms, '
+                                 'total %.2fs', phase, histogram.count,
+                                 histogram.sum / histogram.count * 1000,
+                                 histogram.quantile(0.5) * 1000, histogram.quantile(0.99) * 1000,
+                                 histogram.sum)
+            logging.info('Received %.1f MB (%.2f MB/s), written %.1f MB to disk',
+                         self.received / 2 ** 20, self.received / 2 ** 20 / elapsed,
+                         self.written / 2 ** 20)
+        if path:
+            with open(path, "w") as file:
+                if path.endswith(".json"):
+                    json.dump(self.to_json(), file, indent=2)
+                else:
+                    file.write(self.to_prometheus())
+
+
+class TransferTimer:
+    """Accumulates time spent reading body and writing it to disk for single
+    streamed response, so each phase is observed once per request"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.body = 0.0
+        self.disk_write = 0.0
+        self.received = 0
+        self.written = 0
+
+    def chunks(self, chunks):
+        """Generates chunks of iterable measuring time spent waiting for them"""
+        chunks = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            self.body += time.perf_counter() - start
+            if chunk is None:
+                return
+            self.received += len(chunk)
+            yield chunk
+
+    def write(self, file, chunk):
+        """Writes chunk to file measuring time of write"""
+        start = time.perf_counter()
+        written = file.write(chunk)
+        self.disk_write += time.perf_counter() - start
+        self.written += written
+        return written
+
+    def finish(self):
+        """Records accumulated phases"""
+        self.metrics.observe("body", self.body, self.received)
+        self.metrics.observe("disk_write", self.disk_write, written=self.written)
+
+
+class NoTimer:
+    """Stand-in for TransferTimer when metrics are disabled"""
+
+    @staticmethod
+    def chunks(chunks):
+        """Returns chunks unchanged"""
+        return chunks
+
+    @staticmethod
+    def write(file, chunk):
+        """Writes chunk to file"""
+        return file.write(chunk)
+
+    def finish(self):
+        """Does nothing"""
+
+
+NO_TIMER = NoTimer()
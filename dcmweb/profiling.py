@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Module contains profiler of commands, cProfile statistics are collected separately
+per phase: discovery of files to store, listing of instances, transfers and finalization
+of transfer results, the rest of command is profiled as command phase.
+Python 3.12+ allows single active cProfile in process which profiles all threads,
+so there the profile of the most specific running phase is enabled for whole process,
+e.g. while any transfer runs, concurrent listing and finalization are counted in transfers
+"""
+import contextlib
+import functools
+import io
+import logging
+import sys
+import threading
+
+COMMAND = "command"
+DISCOVERY = "discovery"
+LISTING = "listing"
+TRANSFER = "transfer"
+FINALIZATION = "finalization"
+PHASES = (COMMAND, DISCOVERY, LISTING, TRANSFER, FINALIZATION)
+# phases from least to most specific, running phase later in order wins the shared profile
+SHARED_PRIORITY = (COMMAND, DISCOVERY, LISTING, FINALIZATION, TRANSFER)
+SHARED_PROFILE = sys.version_info >= (3, 12)
+TOP_FUNCTIONS = 15
+_END = object()
+
+
+class Profiler:
+    """Thread safe collection of cProfile profiles of phases, each thread has own profile
+    of a phase, nested phase pauses profile of enclosing one, so time is counted once.
+    With shared profile (Python 3.12+) single profile of each phase is shared by threads"""
+
+    def __init__(self, top=TOP_FUNCTIONS):
+        """
+        :param top: amount of functions with highest cumulative time reported per phase
+        """
+        self.top = top
+        self.lock = threading.Lock()
+        self.profiles = {phase: [] for phase in PHASES}
+        self.local = threading.local()
+        self.unprofiled = 0
+        self.running = {phase: 0 for phase in PHASES}
+        self.shared = None
+
+    @contextlib.contextmanager
+    def phase(self, phase):
+        """Profiles block in phase in current thread"""
+        if SHARED_PROFILE:
+            with self._shared_phase(phase):
+                yield
+            return
+        stack = self._stack()
+        profile = self._profile(phase)
+        if stack and stack[-1] is not None:
+            stack[-1].disable()
+        try:
+            profile.enable()
+        except ValueError:  # Python 3.12+ allows single active profiler in process
+            with self.lock:
+                self.unprofiled += 1
+            profile = None
+        stack.append(profile)
+        try:
+            yield
+        finally:
+            stack.pop()
+            if profile is not None:
+                profile.disable()
+            if stack and stack[-1] is not None:
+                stack[-1].enable()
+
+    def wrap(self, phase, function):
+        """Returns function profiled in phase"""
+        @functools.wraps(function)
+        def profiled_function(*args, **kwargs):
+            with self.phase(phase):
+                return function(*args, **kwargs)
+        return profiled_function
+
+    def iterate(self, phase, iterable):
+        """Generates items of iterable, producing each of them is profiled in phase"""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(phase):
+                item = next(iterator, _END)
+            if item is _END:
+                return
+            yield item
+
+    def stats(self, phase):
+        """Returns pstats.Stats of phase merged from all threads, None if phase didn't run"""
+        import pstats  # pylint: disable=import-outside-toplevel; imported lazily to speed up start
+        with self.lock:
+            profiles = list(self.profiles[phase])
+        stats = None
+        for profile in profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        return stats
+
+    def report(self, path=None):
+        """Logs functions with highest cumulative time of each phase,
+        statistics of phases are written to <path>.<phase>.prof if path is given,
+        they can be explored by python -m pstats or snakeviz"""
+        for phase in PHASES:
+            stats = self.stats(phase)
+            if stats is None:
+                continue
+            output = io.StringIO()
+            stats.stream = output
+            stats.sort_stats("cumulative").print_stats(self.top)
+            logging.info('Profile of %s phase:%s', phase, output.getvalue().rstrip())
+            if path:
+                stats.dump_stats("{}.{}.prof".format(path, phase))
+        if self.unprofiled:
+            logging.warning('%s blocks weren\'t profiled because other profiler was active '
+                            'in the process', self.unprofiled)
+
+    @contextlib.contextmanager
+    def _shared_phase(self, phase):
+        """Counts running block of phase, so shared profile follows the most specific one"""
+        with self.lock:
+            self.running[phase] += 1
+            self._switch_shared()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.running[phase] -= 1
+                self._switch_shared()
+
+    def _switch_shared(self):
+        """Enables shared profile of the most specific running phase, called under lock"""
+        phase = next((phase for phase in reversed(SHARED_PRIORITY) if self.running[phase]), None)
+        if phase == self.shared:
+            return
+        if self.shared is not None:
+            self.profiles[self.shared][0].disable()
+        self.shared = None
+        if phase is None:
+            return
+        import cProfile  # pylint: disable=import-outside-toplevel; imported lazily to speed up start
+        if not self.profiles[phase]:
+            self.profiles[phase].append(cProfile.Profile())
+        try:
+            self.profiles[phase][0].enable()
+            self.shared = phase
+        except ValueError:  # other profiler is active in the process
+            self.unprofiled += 1
+
+    def _stack(self):
+        """Returns stack of profiles of current thread"""
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+            self.local.profiles = {}
+        return stack
+
+    def _profile(self, phase):
+        """Returns profile of phase of current thread"""
+        import cProfile  # pylint: disable=import-outside-toplevel; imported lazily to speed up start
+        profile = self.local.profiles.get(phase)
+        if profile is None:
+            profile = self.local.profiles[phase] = cProfile.Profile()
+            with self.lock:
+                self.profiles[phase].append(profile)
+        return profile
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Module contains renderer of transfer progress running in its own thread,
+so accounting and dispatching of transfers never waits for terminal output
+"""
+import datetime
+import sys
+import threading
+import time
+
+RENDER_INTERVAL = 0.5
+# moves cursor back to start of progress line, so next output overwrites it
+OVERWRITE = "\x1b[K\n\x1b[1A"
+
+
+class ProgressRenderer:  # pylint: disable=too-many-instance-attributes; state of rendering thread
+    """Renders transferred bytes and files, rate and ETA over single terminal line
+    at most once per interval, terminal isn't touched if nothing changed since last render"""
+
+    def __init__(self, transferred, total=None, interval=RENDER_INTERVAL, stream=None):
+        """
+        :param transferred: a dict {'bytes': <amount of transferred bytes>,
+                            'files': <amount of transferred files>,
+                            'retries': <amount of retried requests>} updated by dispatcher
+        :param total: amount of files to transfer if known, ETA is rendered only with it
+        :param interval: seconds between renders
+        :param stream: output stream, defaults to standard error used by logging
+        """
+        self.transferred = transferred
+        self.total = total
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.start = time.monotonic()
+        self.rendered = (0, 0, 0)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="progress", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def line(self):
+        """Returns progress line of current state"""
+        from hurry.filesize import size  # pylint: disable=import-outside-toplevel; imported lazily to speed up start
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        files = self.transferred['files']
+        line = 'Transferred {} in {} files'.format(size(self.transferred['bytes']), files)
+        if self.transferred['retries']:
+            line += ', {} retries'.format(self.transferred['retries'])
+        line += ', {}/s, {:.1f} files/s'.format(
+            size(int(self.transferred['bytes'] / elapsed)), files / elapsed)
+        if self.total and files:
+            remaining = max(self.total - files, 0) * elapsed / files
+            line += ', ETA {}'.format(datetime.timedelta(seconds=round(remaining)))
+        return line
+
+    def render(self, final=False):
+        """Writes progress line if state changed, final line is kept on screen"""
+        state = (self.transferred['bytes'], self.transferred['files'],
+                 self.transferred['retries'])
+        if state == self.rendered and not final:
+            return
+        self.rendered = state
+        ending = "\n"
+        if self.stream.isatty():
+            ending = "\x1b[K\n" if final else OVERWRITE
+        self.stream.write(self.line() + ending)
+        self.stream.flush()
+
+    def close(self):
+        """Stops rendering and writes final line if anything was transferred"""
+        self.stopped.set()
+        if self.thread.ident is not None:
+            self.thread.join()
+        if self.transferred['bytes'] > 0:
+            self.render(final=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.render()
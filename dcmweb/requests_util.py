@@ -4,14 +4,26 @@
 
 import logging
 import os
-from threading import Lock
+import random
+import tempfile
+import threading
+import time
+import uuid
+import email.utils
 import urllib.parse as urlparse
 import xml.etree.ElementTree as ElementTree
-import requests
 
+from . import dicom_header
+from . import metrics as dcmweb_metrics
 from . import resources
 
 PAGE_SIZE = 5000
+POOL_SIZE = 10
+
+ATTEMPTS = 5
+BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
 
 DCM_EXTENSION = ".dcm"
 JPEG_EXTENSION = ".jpg"
@@ -21,6 +33,16 @@ RAW_EXTENSION = ".raw"
 CONTENT_TYPE = "Content-Type"
 MULTIPART = "multipart/related"
 TRANSFER_SYNTAX = "transfer-syntax="
+DICOM_TYPE = "application/dicom; " + TRANSFER_SYNTAX + "*"
+PART_PREFIX = ".part-"
+
+CHUNK_SIZE = 1024 * 1024
+MULTIPART_CRLF = b"\r\n"
+MAX_PART_HEADERS_SIZE = 65536
+
+# 202 is returned when some of instances failed, 409 when all of them failed
+STOW_STATUS_CODES = (200, 202, 409)
+PREAMBLE, DELIMITER, HEADERS, BODY, EPILOGUE = range(5)
 
 
 def filter_urllib3_logging():
@@ -54,6 +76,22 @@ def add_limit_if_not_present(parameters, limit=PAGE_SIZE):
     return parameters
 
 
+def page_limit(parameters):
+    """Returns amount of QIDO results per page, limit of parameters or PAGE_SIZE
+    :raises ValueError: if offset is specified or limit is more than PAGE_SIZE
+    """
+    limit = PAGE_SIZE
+    par = urlparse.parse_qs(parameters)
+    if "offset" in par:
+        raise ValueError("offset shouldnt be specified")
+    if "limit" in par:
+        limit = int(par["limit"][0])
+    if limit > PAGE_SIZE:
+        raise ValueError("limit can\'t be more than {}".format(
+            PAGE_SIZE))
+    return limit
+
+
 def extension_by_headers(content_type):
     """Generates extension string and multipart flag"""
     if "dicom" in content_type:
@@ -70,9 +108,11 @@ def extension_by_headers(content_type):
 
 def parse_boundary(content_type):
     """Returns boundary from content type"""
-    boundary_start = content_type.find("boundary=")+9
-    return bytes(content_type[boundary_start:content_type.find(
-        ";", boundary_start)], "utf-8")
+    for parameter in content_type.split(";"):
+        name, _, value = parameter.strip().partition("=")
+        if name.lower() == "boundary":
+            return bytes(value.strip('"'), "utf-8")
+    raise ValueError("missing boundary in {}".format(content_type))
 
 
 def adjust_mime_type(mime_type):
@@ -100,37 +140,328 @@ def build_multipart_file_name(file_name, frame_index, extension):
     return file_name + extension
 
 
+def open_part(file_name):
+    """Opens temporary file in folder of file_name, finish_part renames it to file_name,
+    so interrupted downloads never leave incomplete files under final names"""
+    folder, name = os.path.split(file_name)
+    return open(os.path.join(folder, PART_PREFIX + name), 'wb')
+
+
+def finish_part(file):
+    """Closes file opened by open_part and moves it to its final name"""
+    file.close()
+    folder, name = os.path.split(file.name)
+    os.replace(file.name, os.path.join(folder, name[len(PART_PREFIX):]))
+
+
+def discard_part(file):
+    """Closes and removes file opened by open_part"""
+    file.close()
+    os.remove(file.name)
+
+
+def create_session(pool_size=POOL_SIZE, keep_alive=True, metrics=None):
+    """Creates http session with connection pool shared between threads
+    :param pool_size: maximum amount of connections kept open to the host,
+                      should match amount of threads performing requests
+    :param keep_alive: whether connections should be reused between requests
+    :param metrics: optional Metrics recording duration of connection setup
+    """
+    import requests.adapters  # pylint: disable=import-outside-toplevel; imported lazily to speed up start
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size)
+    if metrics is not None:
+        pool_manager = adapter.poolmanager
+        pool_manager.pool_classes_by_scheme = {
+            scheme: type(pool_class.__name__, (pool_class,), {
+                "ConnectionCls": timed_connection(pool_class.ConnectionCls, metrics)})
+            for scheme, pool_class in pool_manager.pool_classes_by_scheme.items()}
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def timed_connection(connection_class, metrics):
+    """Returns subclass of urllib3 connection class recording duration of
+    name resolution, connection and TLS handshake as connect phase"""
+    class TimedConnection(connection_class):  # pylint: disable=too-few-public-methods; adds timing only
+        """Connection recording its setup time"""
+
+        def connect(self):
+            """Opens connection and records time it took"""
+            start = time.perf_counter()
+            super().connect()
+            metrics.observe("connect", time.perf_counter() - start)
+    return TimedConnection
+
+
+def parse_retry_after(response):
+    """Returns delay in seconds from Retry-After header or None if not present"""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if not retry_after:
+        return None
+    if retry_after.isdigit():
+        return float(retry_after)
+    try:
+        retry_date = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_date.timestamp() - time.time())
+
+
+class RetryPolicy:  # pylint: disable=too-few-public-methods; keeps retry configuration
+    """Retries of transient failures with exponential backoff and jitter"""
+
+    def __init__(self, attempts=ATTEMPTS, backoff=BACKOFF, jitter=True,
+                 max_backoff=MAX_BACKOFF):
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+
+    def delay(self, retry, response=None):
+        """Returns seconds to wait before retry number retry (starting from 0),
+        Retry-After header of response takes precedence over backoff"""
+        retry_after = parse_retry_after(response)
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.max_backoff, self.backoff * 2 ** retry)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+def read_body(response):
+    """Generates chunks of streamed response body, failure of connection while body
+    is received and body shorter than its Content-Length are raised
+    as TransferInterruptedError"""
+    import requests  # pylint: disable=import-outside-toplevel; imported lazily to speed up start
+    try:
+        yield from response.iter_content(chunk_size=CHUNK_SIZE)
+    except requests.exceptions.RequestException as exception:
+        raise TransferInterruptedError("receiving of {} interrupted: {}".format(
+            response.url, exception)) from exception
+    content_length = response.headers.get("Content-Length")
+    # raw position counts received bytes before content decoding
+    if content_length is not None and response.raw.tell() < int(content_length):
+        raise TransferInterruptedError("received {} of {} bytes of {}".format(
+            response.raw.tell(), content_length, response.url))
+
+
+def save_instance_part(part_name, output, on_instance=None):
+    """Moves downloaded part to output/study_uid/series_uid/instance_uid.dcm
+    :param part_name: path to temporary file with DICOM instance
+    :param on_instance: optional function called with ids of saved instance
+    """
+    try:
+        ids = dicom_header.read_file_ids(part_name)
+    except (ValueError, LookupError) as exception:
+        os.remove(part_name)
+        raise NetworkError("can't read UIDs of received instance: {}".format(exception))
+    folder, file_name = resources.file_system_full_path_by_ids(ids, output)
+    os.makedirs(folder, exist_ok=True)
+    os.replace(part_name, folder + file_name + DCM_EXTENSION)
+    if on_instance:
+        on_instance(ids)
+    return ids
+
+
+def read_instance_uid(file_name):
+    """Reads SOP Instance UID of DICOM file, None if header can't be parsed"""
+    try:
+        return dicom_header.read_file_ids(file_name)[resources.INSTANCE_ID]
+    except (ValueError, LookupError):
+        return None
+
+
+def parse_stow_response(text):
+    """Parses per instance statuses of STOW-RS xml response
+    :returns: tuple of dicts {<instance uid>: <retrieve url>} of stored instances
+              and {<instance uid>: <failure reason>} of failed instances
+    """
+    root = ElementTree.fromstring(text)
+    return (parse_stow_sequence(root, "ReferencedSOPSequence", "RetrieveURL"),
+            parse_stow_sequence(root, "FailedSOPSequence", "FailureReason"))
+
+
+def parse_stow_sequence(root, sequence, keyword):
+    """Returns dict {<instance uid>: <value of keyword>} of items of sequence of STOW-RS response"""
+    return {item.findtext("*[@keyword='ReferencedSOPInstanceUID']/Value"):
+                item.findtext("*[@keyword='{}']/Value".format(keyword))
+            for item in root.findall("*[@keyword='{}']/Item".format(sequence))}
+
+
 class NetworkError(Exception):
     """exception for unexpected responses"""
 
+    def __init__(self, message, status_code=None, retries=0):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retries = retries
+
+
+class TransferInterruptedError(NetworkError):
+    """exception for response body which wasn't received completely,
+    the transfer is repeated from start"""
+
+
+class SourceError(NetworkError):
+    """exception for failed retrieve of copied instance, the request was retried
+    already, so the copy isn't repeated"""
+
+
+def is_interrupted(exception):
+    """Returns True if transfer failed because its response body wasn't received"""
+    return isinstance(exception, TransferInterruptedError)
+
+
+def is_retriable(exception):
+    """Returns True if transfer failed without response or with transient status code"""
+    return exception.status_code in (None,) + RETRY_STATUS_CODES
 
-class Requests:
+
+def is_repeatable(exception):
+    """Returns True if copy failed in a way its requests couldn't retry:
+    by interrupted source body or by failure of destination receiving streamed body"""
+    return not isinstance(exception, SourceError) and is_retriable(exception)
+
+
+class HostUnavailableError(Exception):
+    """exception for host failing validation request, unlike NetworkError
+    it isn't handled per transfer and stops the command"""
+
+
+class Requests:  # pylint: disable=too-many-instance-attributes; session state shared by threads
     """Class keep state of credentials
      and performs request to dicomWeb"""
 
-    def __init__(self, host_str, authenticator):
+    def __init__(self, host_str, authenticator, pool_size=POOL_SIZE, keep_alive=True,  # pylint: disable=too-many-arguments; connection configuration
+                 retry_policy=None, validate=False, metrics=None, tracer=None):
+        """
+        :param validate: checks availability of host by validation request
+        after first failed request, unless some request succeeded before
+        :param metrics: optional Metrics recording phases of requests
+        :param tracer: optional Tracer writing event per HTTP exchange
+        """
         self.host = resources.validate_host_str(host_str)
         self.authenticator = authenticator
-        self.authenticator_lock = Lock()
+        self.metrics = metrics
+        self.tracer = tracer
+        self.session = create_session(pool_size, keep_alive, metrics)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.host_checked = not validate
+        self.host_lock = threading.Lock()
+        self.unavailable = None
 
     def apply_credentials(self, headers):
         """Applyes credentials from authenticator to headers"""
+        # authenticator is thread safe and doesn't block while token is fresh
         if self.authenticator:
-            with self.authenticator_lock:
-                self.authenticator.apply_credentials(headers)
+            self.authenticator.apply_credentials(headers)
         return headers
 
+    def send(self, method, url, headers, **kwargs):
+        """Performs http request, transient failures are retried according to retry_policy
+        :returns: response with amount of performed retries in retries attribute
+        """
+        import requests  # pylint: disable=import-outside-toplevel; imported lazily to speed up start
+        if self.unavailable is not None:
+            raise HostUnavailableError(self.unavailable)
+        body = kwargs.get("data")
+        # streamed bodies like generators can't be sent again
+        attempts = self.retry_policy.attempts if body is None or hasattr(body, "seek") \
+            or isinstance(body, (bytes, str)) else 1
+        retry = 0
+        while True:
+            response = None
+            try:
+                start = time.perf_counter()
+                response = self.session.request(
+                    method, url, headers=self.apply_credentials(dict(headers)), **kwargs)
+                response.retries = retry
+                response.started = start
+                if self.metrics is not None:
+                    self.metrics.observe_response(
+                        response, time.perf_counter() - start, kwargs.get("stream", False))
+                final = response.status_code not in RETRY_STATUS_CODES or retry + 1 >= attempts
+                # streamed responses are traced when their body is read or by request if failed
+                if not (final and kwargs.get("stream")):
+                    self.trace_response(response, None if final else 0)
+                if final:
+                    if not self.host_checked:
+                        self.check_host(response.status_code < 400)
+                    return response
+                logging.debug('retrying %s %s after %s', method, url, response.status_code)
+                response.close()
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as exception:
+                if self.tracer is not None:
+                    self.tracer.exchange(method, url, start, None,
+                                         {"retry": retry, "error": str(exception)})
+                if retry + 1 >= attempts:
+                    if not self.host_checked:
+                        self.check_host(False)
+                    raise NetworkError("{} {} failed: {}".format(method, url, exception),
+                                       retries=retry) from exception
+                logging.debug('retrying %s %s after %s', method, url, exception)
+            time.sleep(self.retry_policy.delay(retry, response))
+            retry += 1
+            if hasattr(body, "seek"):
+                body.seek(0)
+
+    def trace_response(self, response, received=None):
+        """Writes trace event of exchange finished by reading body of response
+        :param received: amount of body bytes, length of read body by default
+        """
+        if self.tracer is None:
+            return
+        self.tracer.exchange(response.request.method, response.url, response.started,
+                             response.status_code, {
+                                 "sent_bytes": int(response.request.headers.get(
+                                     "Content-Length", 0)),
+                                 "received_bytes": len(response.content)
+                                                   if received is None else received,
+                                 "ttfb_us": round(response.elapsed.total_seconds() * 1e6),
+                                 "retry": response.retries})
+
+    def check_host(self, succeeded):
+        """Validates host lazily instead of request before each command: first successful
+        response confirms the host, first failure before that is checked once
+        by validation request
+        :raises HostUnavailableError: if validation request fails too
+        """
+        if succeeded:
+            self.host_checked = True
+            return
+        with self.host_lock:
+            if self.host_checked:
+                return
+            # validation request goes through send too and mustn't check host again
+            self.host_checked = True
+            try:
+                self.request("studies", "limit=1", {})
+            except NetworkError as exception:
+                self.unavailable = "host {} is inaccessible: {}".format(self.host, exception)
+                raise HostUnavailableError(self.unavailable) from exception
+
     def request(self, path, parameters, headers, stream=False):
         """Performs request to dicomWeb"""
         url = self.build_url(path, parameters)
         logging.debug('requesting %s', url)
-        response = requests.get(url,
-                                headers=self.apply_credentials(headers), stream=stream)
+        response = self.send("GET", url, headers, stream=stream)
         status_code = response.status_code
         if status_code < 200 or status_code >= 300:
-            raise NetworkError("Unexpected return code {}\n {}".format(
+            error = NetworkError("Unexpected return code {}\n {}".format(
                 response.status_code, resources.pretty_format(
-                    response.text, response.headers[CONTENT_TYPE])))
+                    response.text, response.headers[CONTENT_TYPE])), status_code,
+                                 response.retries)
+            if stream:
+                # body of failed streamed response isn't read by reader which traces it
+                self.trace_response(response)
+            raise error
 
         return response
 
@@ -139,51 +470,144 @@ class Requests:
            :param file_name: path to dicom file in file system
            :returns: amount of bytes transferred during upload"""
         with open(file_name, 'rb') as file:
-            headers = self.apply_credentials(
-                {CONTENT_TYPE: 'application/dicom'})
-            response = requests.post(self.build_url(
-                "studies", ""), headers=headers, data=file)
+            response = self.send("POST", self.build_url(
+                "studies", ""), {CONTENT_TYPE: 'application/dicom'}, data=file)
             if response.status_code != 200:
                 raise NetworkError("uploading file: {}\n response: {}".format(
                     file_name, resources.pretty_format(
-                        response.text, response.headers[CONTENT_TYPE])))
+                        response.text, response.headers[CONTENT_TYPE])), response.status_code,
+                                   response.retries)
             retrieve_url = ElementTree.fromstring(response.text).find(
                 "*[@keyword='ReferencedSOPSequence']//*[@keyword='RetrieveURL']*").text
-            return {"transferred": file.tell(), "message": "{} uploaded as {}"\
-            .format(file_name, retrieve_url)}
+            return {"transferred": file.tell(), "retries": response.retries,
+                    "message": "{} uploaded as {}".format(file_name, retrieve_url)}
+
+    def upload_dicom_batch(self, file_names):
+        """Uploads several files to dicomWeb by single multipart/related request
+           :param file_names: paths to dicom files in file system
+           :returns: dict with amount of bytes transferred and amount of stored files,
+                     status of each file is reported in message and errors"""
+        instance_uids = [read_instance_uid(file_name) for file_name in file_names]
+        boundary = uuid.uuid4().hex
+        with MultipartFilesBody(file_names, boundary) as body:
+            response = self.send("POST", self.build_url("studies", ""), {
+                CONTENT_TYPE: '{}; type="application/dicom"; boundary={}'.format(
+                    MULTIPART, boundary)}, data=body)
+        if response.status_code not in STOW_STATUS_CODES:
+            raise NetworkError("uploading files: {}\n response: {}".format(
+                ", ".join(file_names), resources.pretty_format(
+                    response.text, response.headers[CONTENT_TYPE])), response.status_code,
+                               response.retries)
+        stored, failed = parse_stow_response(response.text)
+        messages = []
+        errors = []
+        for file_name, instance_uid in zip(file_names, instance_uids):
+            if instance_uid in stored:
+                messages.append("{} uploaded as {}".format(file_name, stored[instance_uid]))
+            elif instance_uid in failed:
+                errors.append("{} failed with reason {}".format(file_name, failed[instance_uid]))
+            else:
+                errors.append("{} has no status in response".format(file_name))
+        return {"transferred": len(body), "files": len(messages), "retries": response.retries,
+                "message": "\n".join(messages), "errors": errors}
+
+    def copy_dicom(self, ids, destination):
+        """Copies instance to other dicomWeb by streaming retrieve response into store request,
+        attempts failed by destination or interrupted body are repeated from retrieve
+        as streamed body can't be sent again, failed retrieve is retried by send only
+           :param ids: a dict of ids of instance
+           :param destination: Requests of destination dicomWeb
+           :returns: amount of bytes transferred"""
+        return self.retry_transfer(is_repeatable, self.copy_dicom_once, ids, destination)
+
+    def retry_transfer(self, retriable, transfer, *args):
+        """Calls transfer with args, repeats it according to retry_policy
+        while it fails with NetworkError accepted by retriable
+           :returns: result of transfer with retries increased by repeated attempts
+                     and retries of requests of failed attempts"""
+        attempt = 0
+        retries = 0
+        while True:
+            try:
+                result = transfer(*args)
+                result["retries"] += retries
+                return result
+            except NetworkError as exception:
+                exception.retries += retries
+                if not retriable(exception) or attempt + 1 >= self.retry_policy.attempts:
+                    raise
+                retries = exception.retries + 1
+                logging.debug('repeating %s of %s after %s', transfer.__name__, args[0],
+                              exception)
+            time.sleep(self.retry_policy.delay(attempt))
+            attempt += 1
+
+    def copy_dicom_once(self, ids, destination):
+        """Performs single attempt of instance copy, verifies that destination
+        reports the instance as stored"""
+        path = resources.path_from_ids(ids)
+        try:
+            response = self.request(path, "", {'Accept': DICOM_TYPE}, stream=True)
+        except NetworkError as exception:
+            raise SourceError(str(exception), exception.status_code,
+                              exception.retries) from exception
+        body = InstanceStream(response)
+        try:
+            stored_response = destination.send("POST", destination.build_url("studies", ""), {
+                CONTENT_TYPE: 'application/dicom'}, data=iter(body))
+        except NetworkError as exception:
+            exception.retries += response.retries
+            raise
+        finally:
+            response.close()
+            self.trace_response(response, body.transferred)
+        if stored_response.status_code not in STOW_STATUS_CODES:
+            raise NetworkError("copying instance: {}\n response: {}".format(
+                path, resources.pretty_format(stored_response.text,
+                                              stored_response.headers[CONTENT_TYPE])),
+                               stored_response.status_code, response.retries)
+        stored, failed = parse_stow_response(stored_response.text)
+        instance_uid = ids[resources.INSTANCE_ID]
+        if instance_uid not in stored:
+            raise NetworkError("copying instance: {} failed with reason {}".format(
+                path, failed.get(instance_uid, "unknown")), stored_response.status_code,
+                               response.retries)
+        return {"transferred": body.transferred, "retries": response.retries,
+                "message": "{} copied as {}".format(path, stored[instance_uid])}
 
     def delete_dicom(self, path):
         """ Deletes single dicom object by sending DELETE http request"""
         path = resources.validate_path(path)
-        response = requests.delete(self.build_url(
-            path, ""), headers=self.apply_credentials({}))
+        response = self.send("DELETE", self.build_url(path, ""), {})
         if response.status_code != 200:
             raise NetworkError("sending http delete request: {}\n response: {}".format(
-                path, resources.pretty_format(response.text, response.headers[CONTENT_TYPE])))
+                path, resources.pretty_format(response.text, response.headers[CONTENT_TYPE])),
+                               response.status_code, response.retries)
         return response.text
 
     def search_instances_by_page(self, ids, parameters, page):
         """Performs page request"""
-        limit = PAGE_SIZE
-        par = urlparse.parse_qs(parameters)
-        if "offset" in par:
-            raise ValueError("offset shouldnt be specified")
-        if "limit" in par:
-            limit = int(par["limit"][0])
-        if limit > PAGE_SIZE:
-            raise ValueError("limit can\'t be more than {}".format(
-                PAGE_SIZE))
+        return self.search_by_page(resources.path_from_ids(ids)+"/instances", parameters, page)
+
+    def search_by_page(self, path, parameters, page):
+        """Performs QIDO request of single page
+        :param path: path to search on, e.g. studies, studies/<uid>/series
+        :param parameters: QIDO parameters without offset, limit defaults to PAGE_SIZE
+        :param page: number of page starting from 0
+        :returns: response text, "[]" for empty page
+        """
+        limit = page_limit(parameters)
         text = "[]"
         response = self.request(
-            resources.path_from_ids(
-                ids)+"/instances", add_limit_if_not_present(parameters, limit)
+            path, add_limit_if_not_present(parameters, limit)
             + "&offset={}".format(limit*page), {})
         if response.status_code == 200:
             text = response.text
         return text
 
     def download_dicom(self, url, folder, file_name, mime_type):
-        """Downloads dicom object or frames from this dicom object according to mime_type
+        """Downloads dicom object or frames from this dicom object according to mime_type,
+        interrupted downloads are repeated according to retry_policy
         :param url: url to dicom object
         :param folder: folder in local file system to store files,
                        would be created if not exist
@@ -191,36 +615,44 @@ class Requests:
                                    extension and frame number added based on response headers
         :param mime_type: mime_type to request (image/png, image/jpeg)
         """
-        mime_type = adjust_mime_type(mime_type)
-
         os.makedirs(folder, exist_ok=True)
+        return self.retry_transfer(is_interrupted, self.download_dicom_once, url,
+                                   folder + file_name, adjust_mime_type(mime_type))
 
+    def download_dicom_once(self, url, file_name, mime_type):
+        """Performs single attempt of download, files are written under temporary names
+        and only complete ones are moved to their final names"""
         response = self.request(url, "", {'Accept': mime_type}, stream=True)
         content_type = response.headers[CONTENT_TYPE].lower()
         extension = extension_by_headers(content_type)
-        is_multipart = content_type.startswith(MULTIPART)
-        file_name = folder + file_name
         boundary = None
-        if is_multipart:
+        if content_type.startswith(MULTIPART):
             frame_index = 0
             file = None
-            boundary = parse_boundary(content_type)
+            boundary = parse_boundary(response.headers[CONTENT_TYPE])
         else:
-            file = open(file_name+extension, 'wb')
+            file = open_part(file_name+extension)
         transferred = 0
-        for chunk, new_file in MultipartChunksReader(
-                response.iter_content(chunk_size=8192), boundary).read_chunks():
-            if new_file:
-                if file:
-                    file.close()
-                frame_index += 1
-                file = open(build_multipart_file_name(
-                    file_name, frame_index, extension), 'wb')
-            transferred += file.write(chunk)
-
-        if not file.closed:
-            file.close()
-        return {"transferred": transferred}
+        timer = self.transfer_timer()
+        try:
+            for chunk, new_file in MultipartChunksReader(
+                    timer.chunks(read_body(response)),
+                    boundary).read_chunks():
+                if new_file:
+                    if file:
+                        finish_part(file)
+                    frame_index += 1
+                    file = open_part(build_multipart_file_name(
+                        file_name, frame_index, extension))
+                transferred += timer.write(file, chunk)
+            if file:
+                finish_part(file)
+        finally:
+            self.trace_response(response, transferred)
+            if file and not file.closed:
+                discard_part(file)
+        timer.finish()
+        return {"transferred": transferred, "retries": response.retries}
 
     def download_dicom_by_ids(self, ids, output="./", mime_type=None):
         """Downloads instance based on ids dict object"""
@@ -228,6 +660,66 @@ class Requests:
         folder, file_name = resources.file_system_full_path_by_ids(ids, output)
         return self.download_dicom(url, folder, file_name, mime_type)
 
+    def download_dicom_bulk(self, ids, output="./", mime_type=None, on_instance=None):
+        """Downloads all instances of study or series by single request,
+        parts of multipart response are saved as study_uid/series_uid/instance_uid.dcm
+        using UIDs from DICOM header of each part, interrupted download is repeated
+        according to retry_policy
+        :param ids: a dict of ids study_id:<uid>, [series_id:<uid>]
+        :param output: folder in local file system to store files
+        :param mime_type: application/dicom type with optional transfer-syntax
+        :param on_instance: optional function called with ids of each saved instance
+        """
+        accept = adjust_mime_type(mime_type or DICOM_TYPE)
+        if extension_by_headers(accept) != DCM_EXTENSION:
+            raise ValueError("bulk retrieve supports only application/dicom type")
+        return self.retry_transfer(is_interrupted, self.download_dicom_bulk_once, ids, output,
+                                   accept, on_instance)
+
+    def download_dicom_bulk_once(self, ids, output, accept, on_instance):
+        """Performs single attempt of bulk download, instances saved before interruption
+        are kept and saved again by next attempt"""
+        response = self.request(resources.path_from_ids(ids), "", {'Accept': accept},
+                                stream=True)
+        content_type = response.headers[CONTENT_TYPE].lower()
+        if not content_type.startswith(MULTIPART):
+            raise NetworkError("expected multipart response for {}, received {}".format(
+                resources.path_from_ids(ids), content_type))
+        os.makedirs(output, exist_ok=True)
+        transferred = 0
+        files = 0
+        part_file = None
+        timer = self.transfer_timer()
+        try:
+            for chunk, new_file in MultipartChunksReader(
+                    timer.chunks(read_body(response)),
+                    parse_boundary(response.headers[CONTENT_TYPE])).read_chunks():
+                if new_file and part_file:
+                    part_file.close()
+                    save_instance_part(part_file.name, output, on_instance)
+                    part_file = None
+                    files += 1
+                if not part_file:
+                    part_file = tempfile.NamedTemporaryFile(
+                        dir=output, prefix=PART_PREFIX, delete=False)
+                transferred += timer.write(part_file, chunk)
+            if part_file:
+                part_file.close()
+                save_instance_part(part_file.name, output, on_instance)
+                part_file = None
+                files += 1
+        finally:
+            self.trace_response(response, transferred)
+            if part_file:
+                part_file.close()
+                os.remove(part_file.name)
+        timer.finish()
+        return {"transferred": transferred, "files": files, "retries": response.retries}
+
+    def transfer_timer(self):
+        """Returns timer of streamed response body, which does nothing if metrics are disabled"""
+        return self.metrics.transfer() if self.metrics is not None else dcmweb_metrics.NO_TIMER
+
     def build_url(self, path, parameters):
         """Builds url from host and path"""
         path_str = str(path)
@@ -238,20 +730,204 @@ class Requests:
         return self.host+path_str+parameters
 
 
+class InstanceStream:  # pylint: disable=too-few-public-methods; iterable wrapper of response
+    """Iterates over bytes of single DICOM instance of retrieve response,
+    response is read by chunks while they are consumed"""
+
+    def __init__(self, response):
+        self.response = response
+        self.transferred = 0
+
+    def __iter__(self):
+        content_type = self.response.headers[CONTENT_TYPE]
+        boundary = parse_boundary(content_type) \
+            if content_type.lower().startswith(MULTIPART) else None
+        for chunk, new_file in MultipartChunksReader(
+                read_body(self.response), boundary).read_chunks():
+            if new_file and self.transferred:
+                raise NetworkError("retrieve response contains several instances")
+            self.transferred += len(chunk)
+            yield bytes(chunk)
+
+
+class MultipartFilesBody:
+    """Readable multipart/related body of DICOM files, files are read lazily
+    and body may be rewound to start for retries"""
+
+    def __init__(self, file_names, boundary):
+        self.parts = []
+        self.length = 0
+        for file_name in file_names:
+            self.add_part("--{}\r\nContent-Type: application/dicom\r\n\r\n".format(
+                boundary).encode())
+            self.parts.append(file_name)
+            self.length += os.path.getsize(file_name)
+            self.add_part(MULTIPART_CRLF)
+        self.add_part("--{}--\r\n".format(boundary).encode())
+        self.index = 0
+        self.offset = 0
+        self.position = 0
+        self.file = None
+
+    def add_part(self, data):
+        """Adds bytes part of body"""
+        self.parts.append(data)
+        self.length += len(data)
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def tell(self):
+        """Returns current position in body"""
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """Rewinds body to start, other positions are not supported"""
+        if offset != 0 or whence != os.SEEK_SET:
+            raise ValueError("multipart body can be rewound to start only")
+        self.close()
+        self.index = 0
+        self.offset = 0
+        self.position = 0
+
+    def read(self, size=-1):
+        """Reads up to size bytes, whole rest of body if size is negative"""
+        chunks = []
+        while size != 0 and self.index < len(self.parts):
+            part = self.parts[self.index]
+            if isinstance(part, bytes):
+                end = len(part) if size < 0 else self.offset + size
+                chunk = part[self.offset:end]
+            else:
+                if self.file is None:
+                    self.file = open(part, "rb")
+                chunk = self.file.read(size)
+            if not chunk:
+                self.close()
+                self.index += 1
+                self.offset = 0
+                continue
+            chunks.append(chunk)
+            self.offset += len(chunk)
+            self.position += len(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b"".join(chunks)
+
+    def close(self):
+        """Closes currently read file"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
 class MultipartChunksReader:  # pylint: disable=too-few-public-methods; need for readability
-    """Class keep state of multipart stream"""
+    """Incremental parser of multipart/related stream, keeps state between chunks
+    so boundaries and part headers may be split at any position"""
 
     def __init__(self, chunks, boundary):
         self.chunks = chunks
         self.boundary = boundary
+        self.headers = {}
 
     def read_chunks(self):
-        """Streaming  flag of new file and chunks and except boundary chunks"""
+        """Streams part bodies as pairs of memoryview and flag of new part,
+        views are valid until next iteration, headers of current part are kept
+        in headers attribute with lower case names"""
+        if not self.boundary:
+            for chunk in self.chunks:
+                yield chunk, False
+            return
+        delimiter = MULTIPART_CRLF + b"--" + self.boundary
+        # delimiter of first part isn't preceded by CRLF
+        data = MULTIPART_CRLF
+        position = 0
+        state = PREAMBLE
         new_file = False
         for chunk in self.chunks:
-            if self.boundary and self.boundary in chunk:
-                if bytes(CONTENT_TYPE, "utf-8") in chunk:
+            data = data[position:] + chunk if position < len(data) else chunk
+            view = memoryview(data)
+            position = 0
+            while state != EPILOGUE:
+                if state in (PREAMBLE, BODY):
+                    index = data.find(delimiter, position)
+                    end = index if index != -1 else hold_back_position(
+                        data, position, len(delimiter))
+                    if state == BODY and (end > position or (new_file and index != -1)):
+                        yield view[position:end], new_file
+                        new_file = False
+                    position = end
+                    if index == -1:
+                        break
+                    position += len(delimiter)
+                    state = DELIMITER
+                elif state == DELIMITER:
+                    next_position = self._read_delimiter(data, position)
+                    if next_position == -1:
+                        break
+                    state = EPILOGUE if next_position == position else HEADERS
+                    position = next_position
+                else:
+                    next_position = self._read_headers(data, position)
+                    if next_position == -1:
+                        break
+                    position = next_position
+                    state = BODY
                     new_file = True
-            else:
-                yield chunk, new_file
-                new_file = False
+        if state != EPILOGUE:
+            # content of last part can't be told from truncated one
+            raise TransferInterruptedError("multipart response ended without closing delimiter")
+
+    @staticmethod
+    def _read_delimiter(data, position):
+        """Reads rest of delimiter line starting at position
+        :returns: position of part headers, unchanged position for closing delimiter
+                  or -1 if more data is needed"""
+        if len(data) - position < 2:
+            return -1
+        if data[position:position + 2] == b"--":
+            return position
+        line_end = find_limited(data, MULTIPART_CRLF, position)
+        return line_end if line_end == -1 else line_end + len(MULTIPART_CRLF)
+
+    def _read_headers(self, data, position):
+        """Reads part headers starting at position into headers attribute
+        :returns: position of part body or -1 if more data is needed"""
+        headers_end = position if data.startswith(MULTIPART_CRLF, position) \
+            else find_limited(data, MULTIPART_CRLF * 2, position)
+        if headers_end == -1:
+            return -1
+        self.headers = parse_part_headers(data[position:headers_end])
+        return headers_end + (len(MULTIPART_CRLF) if headers_end == position
+                              else 2 * len(MULTIPART_CRLF))
+
+
+def hold_back_position(data, position, delimiter_length):
+    """Returns end of data which can't be start of delimiter split between chunks"""
+    tail_start = max(position, len(data) - delimiter_length + 1)
+    carriage_return = data.find(MULTIPART_CRLF[:1], tail_start)
+    return carriage_return if carriage_return != -1 else len(data)
+
+
+def find_limited(data, separator, position):
+    """Finds separator of part headers, fails if headers are too long"""
+    index = data.find(separator, position)
+    if index == -1 and len(data) - position > MAX_PART_HEADERS_SIZE:
+        raise NetworkError("multipart headers exceed {} bytes".format(MAX_PART_HEADERS_SIZE))
+    return index
+
+
+def parse_part_headers(headers_bytes):
+    """Parses part headers into dict with lower case names"""
+    headers = {}
+    for line in headers_bytes.decode("latin-1").split("\r\n"):
+        name, separator, value = line.partition(":")
+        if separator:
+            headers[name.strip().lower()] = value.strip()
+    return headers
@@ -2,13 +2,12 @@
 """Module contains helper fuctions to validate and trasform dicom paths and ids
 """
 
-import xml.dom.minidom
-import validators
-
-
 STUDY_TAG = "0020000D"
 SERIES_TAG = "0020000E"
 INSTANCE_TAG = "00080018"
+STUDY_DATE_TAG = "00080020"
+PATIENT_ID_TAG = "00100020"
+STUDY_INSTANCES_TAG = "00201208"
 
 STUDY_ID = "study_id"
 SERIES_ID = "series_id"
@@ -24,6 +23,7 @@ DICOM_XML_CONTENT_TYPE = "application/dicom+xml"
 
 def validate_host_str(host):
     """Function to check host url"""
+    import validators  # pylint: disable=import-outside-toplevel; imported lazily to speed up start
     if not validators.url(host):
         raise ValueError('Invalid url')
     if host[-1] != SPLIT_CHAR:
@@ -152,5 +152,6 @@ def file_system_full_path_by_ids(ids, base_dir="./"):
 def pretty_format(body, content_type):
     """Function to format response body by content_type"""
     if content_type.lower() == DICOM_XML_CONTENT_TYPE:
+        import xml.dom.minidom  # pylint: disable=import-outside-toplevel; imported lazily to speed up start
         body = xml.dom.minidom.parseString(body).toprettyxml(indent='    ')
     return body
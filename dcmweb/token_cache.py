@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Module contains on disk cache of access tokens shared by concurrent processes
+"""
+import contextlib
+import json
+import os
+import tempfile
+import time
+try:
+    import fcntl
+except ImportError:  # file locking isn't available on Windows
+    fcntl = None
+
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "dcmweb", "token.json")
+REFRESH_MARGIN = 300
+DEFAULT_KEY = "default"
+
+
+def application_credentials_path():
+    """Returns path of credentials file found by google.auth.default: key file set by
+    GOOGLE_APPLICATION_CREDENTIALS or application default credentials of gcloud"""
+    path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
+    if path:
+        return path
+    config = os.environ.get("CLOUDSDK_CONFIG")
+    if not config:
+        config = os.path.join(os.environ.get("APPDATA", ""), "gcloud") if os.name == "nt" \
+            else os.path.join(os.path.expanduser("~"), ".config", "gcloud")
+    return os.path.join(config, "application_default_credentials.json")
+
+
+def credentials_key():
+    """Returns cache key of credentials of google.auth.default without loading them,
+    key consists of path and modification time of credentials file, so tokens aren't
+    shared by different accounts or kept after login, DEFAULT_KEY is used without file
+    as credentials of the machine come from metadata server then"""
+    path = application_credentials_path()
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except OSError:
+        return DEFAULT_KEY
+    return "{}@{}".format(os.path.abspath(path), modified)
+
+
+class TokenCache:
+    """Access tokens with their expiry stored in json file by credentials key,
+    file is locked while token is refreshed, so concurrent processes wait for single refresh"""
+
+    def __init__(self, path=CACHE_PATH, margin=REFRESH_MARGIN):
+        """
+        :param path: path to cache file, lock file is created next to it
+        :param margin: seconds before expiry when token is refreshed
+        """
+        self.path = path
+        self.margin = margin
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Holds exclusive lock of cache file"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def expires_soon(self, expiry):
+        """Checks if token with expiry (seconds since epoch) should be refreshed"""
+        return expiry - self.margin <= time.time()
+
+    def read(self, key):
+        """Returns tuple of token and expiry of key, None if token is missing or expires soon"""
+        entry = self.load().get(key)
+        if not entry or self.expires_soon(entry["expiry"]):
+            return None
+        return entry["token"], entry["expiry"]
+
+    def write(self, key, token, expiry):
+        """Stores token of key, file is replaced atomically and readable by owner only"""
+        entries = self.load()
+        entries[key] = {"token": token, "expiry": expiry}
+        folder = os.path.dirname(os.path.abspath(self.path))
+        handle, temporary_name = tempfile.mkstemp(dir=folder, prefix=".token-")
+        try:
+            with os.fdopen(handle, "w") as file:
+                json.dump(entries, file)
+            os.replace(temporary_name, self.path)
+        except OSError:
+            os.remove(temporary_name)
+            raise
+
+    def load(self):
+        """Reads all entries of cache file, empty dict if file is missing or broken"""
+        try:
+            with open(self.path, "r") as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
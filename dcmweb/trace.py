@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Module contains trace of HTTP exchanges written as Chrome trace events,
+trace file can be opened by chrome://tracing or Perfetto UI to see timeline of transfers
+"""
+import json
+import os
+import threading
+import time
+import urllib.parse as urlparse
+
+
+class Tracer:
+    """Writes complete events of HTTP exchanges in Chrome trace JSON array format,
+    one event per line, so file written up to a crash is still readable by trace viewers"""
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(b"[\n")
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.pid = os.getpid()
+        self.workers = {}
+
+    def exchange(self, method, url, start, status=None, details=None):  # pylint: disable=too-many-arguments; fields of trace event
+        """Writes event of exchange which started at start (time.perf_counter) and ends now,
+        each thread performing requests is shown as separate worker track
+        :param details: dict of values shown as arguments of event
+        """
+        end = time.perf_counter()
+        thread = threading.current_thread()
+        arguments = {"url": url, "status": status, "worker": thread.name}
+        arguments.update(details or {})
+        with self.lock:
+            if self.file.closed:
+                return
+            worker = self.workers.get(thread.ident)
+            if worker is None:
+                worker = self.workers[thread.ident] = len(self.workers) + 1
+                self.write({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": worker,
+                            "args": {"name": thread.name}})
+            self.write({"name": "{} {}".format(method, urlparse.urlparse(url).path),
+                        "cat": "http", "ph": "X", "pid": self.pid, "tid": worker,
+                        "ts": round((start - self.start) * 1e6, 1),
+                        "dur": round((end - start) * 1e6, 1), "args": arguments})
+
+    def write(self, event):
+        """Writes event line, caller keeps tracer locked"""
+        self.file.write(json.dumps(event, separators=(",", ":")).encode() + b",\n")
+
+    def close(self):
+        """Replaces comma after last event by closing bracket, so file is valid json"""
+        with self.lock:
+            if self.file.closed:
+                return
+            if self.workers:
+                self.file.seek(-2, os.SEEK_END)
+                self.file.truncate()
+                self.file.write(b"\n")
+            self.file.write(b"]\n")
+            self.file.close()
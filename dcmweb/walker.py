@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Module contains streaming search of files by glob like masks and of instances saved
+by retrieve, directories are read by os.scandir and files are generated while scanning continues
+"""
+import collections
+import concurrent.futures
+import fnmatch
+import logging
+import os
+import re
+
+from . import requests_util
+from . import resources
+
+RECURSIVE = "**"
+MAGIC = re.compile("[*?[]")
+
+
+def find_files(masks, workers=1):
+    """Generates names of files matching masks, a file matched by several masks is generated once
+    :param masks: list of file paths or masks, mask support wildcard(*) and \
+cross directory boundaries wildcard(**) char
+    :param workers: amount of directories scanned at the same time
+    """
+    seen = set() if len(masks) > 1 else None
+    for mask in masks:
+        mask = mask.replace(RECURSIVE, RECURSIVE + "/*")
+        found = False
+        for file_name in match_mask(mask, workers):
+            found = True
+            if seen is not None:
+                key = os.path.normcase(os.path.abspath(file_name))
+                if key in seen:
+                    continue
+                seen.add(key)
+            yield file_name
+        if not found:
+            logging.error('No files found matching %s', mask)
+
+
+def match_mask(mask, workers=1):
+    """Generates names of files matching single mask, like glob hidden files and
+    directories are matched only by patterns starting with dot"""
+    if os.altsep:
+        mask = mask.replace(os.altsep, os.sep)
+    components = mask.split(os.sep)
+    index = next((index for index, component in enumerate(components)
+                  if MAGIC.search(component)), None)
+    if index is None:
+        if os.path.isfile(mask):
+            yield mask
+        return
+    base = os.sep.join(components[:index])
+    if index and not base:
+        base = os.sep
+    yield from walk(base, frozenset([tuple(components[index:])]), workers)
+
+
+def walk(directory, patterns, workers=1):
+    """Generates matched files of directory tree, subtrees are scanned in parallel
+    if workers is more than 1
+    :param patterns: set of alternative tuples of path components to match
+    """
+    if workers <= 1:
+        directories = [(directory, patterns)]
+        while directories:
+            files, subdirectories = scan(*directories.pop())
+            directories.extend(reversed(subdirectories))
+            yield from files
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque([executor.submit(scan, directory, patterns)])
+        waiting = collections.deque()
+        try:
+            while pending:
+                files, subdirectories = pending.popleft().result()
+                waiting.extend(subdirectories)
+                while waiting and len(pending) < workers * 2:
+                    pending.append(executor.submit(scan, *waiting.popleft()))
+                yield from files
+        finally:
+            for scan_future in pending:
+                scan_future.cancel()
+
+
+def scan(directory, patterns):
+    """Matches entries of single directory, recursive wildcard descends only
+    into real directories to avoid symlink loops
+    :returns: tuple of list of matched files and list of (subdirectory, patterns) to scan
+    """
+    alternatives = set()
+    for pattern in patterns:
+        alternatives.update(expand_recursive(pattern))
+    entries = list_entries(directory)
+    files = []
+    subdirectories = collections.OrderedDict()
+    for entry in entries:
+        path = os.path.join(directory, entry.name)
+        is_dir = entry.is_dir()
+        matched = False
+        for alternative in alternatives:
+            if entry.name.startswith(".") and not alternative[0].startswith("."):
+                continue
+            if alternative[0] == RECURSIVE:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.setdefault(path, set()).add(alternative)
+            elif fnmatch.fnmatch(entry.name, alternative[0]):
+                if len(alternative) > 1:
+                    if is_dir:
+                        subdirectories.setdefault(path, set()).add(alternative[1:])
+                elif not is_dir:
+                    matched = True
+        if matched:
+            files.append(path)
+    return files, [(path, frozenset(alternatives))
+                   for path, alternatives in subdirectories.items()]
+
+
+def expand_recursive(pattern):
+    """Returns alternatives of pattern, recursive wildcard matches zero or more directories"""
+    if pattern[0] != RECURSIVE:
+        return [pattern]
+    if len(pattern) == 1:
+        return [pattern, ("*",)]
+    return [pattern] + expand_recursive(pattern[1:])
+
+
+def find_instances(output, ids=None):
+    """Generates dicts of ids of instances saved in output folder
+    as study_uid/series_uid/instance_uid.dcm, hidden and temporary files are skipped
+    :param ids: optional dict of ids of study or series to search in
+    """
+    ids = ids or {}
+    studies = [ids[resources.STUDY_ID]] if resources.STUDY_ID in ids \
+        else list_directories(output)
+    for study_id in studies:
+        series = [ids[resources.SERIES_ID]] if resources.SERIES_ID in ids \
+            else list_directories(os.path.join(output, study_id))
+        for series_id in series:
+            for entry in list_entries(os.path.join(output, study_id, series_id)):
+                name, extension = os.path.splitext(entry.name)
+                if extension == requests_util.DCM_EXTENSION and not name.startswith(".") \
+                        and entry.is_file():
+                    yield {resources.STUDY_ID: study_id, resources.SERIES_ID: series_id,
+                           resources.INSTANCE_ID: name}
+
+
+def list_directories(directory):
+    """Returns names of visible subdirectories"""
+    return [entry.name for entry in list_entries(directory)
+            if not entry.name.startswith(".") and entry.is_dir()]
+
+
+def list_entries(directory):
+    """Returns entries of directory, empty list if it can't be read"""
+    try:
+        return list(os.scandir(directory or os.curdir))
+    except OSError as exception:
+        logging.debug("Can't scan %s: %s", directory, exception)
+        return []
@@ -36,6 +36,10 @@ setuptools.setup(
         'hurry.filesize'
     ],
 
+    extras_require={
+        'fast': ['orjson'],
+    },
+
     classifiers=[
 
         "Programming Language :: Python :: 3",
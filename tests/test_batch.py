@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Batch method tests
+"""
+import io
+import os
+import shutil
+import sys
+import httpretty
+import pytest
+import pytest_check as check
+from dcmweb import dcmweb
+
+URL = "https://dicom.com/"
+OUTPUT = "./testData/batch/"
+
+
+@httpretty.activate
+def test_batch(capsys, monkeypatch):
+    """commands should be run by single client and failed ones should be reported"""
+    httpretty.register_uri(httpretty.GET, URL + "studies?limit=5000", body='[{"1": 1}]',
+                           match_querystring=True)
+    httpretty.register_uri(
+        httpretty.GET, URL + "studies/1/series/2/instances/3", body="3.dcm",
+        adding_headers={'Content-Type': 'application/dicom'})
+    monkeypatch.setattr(sys, "stdin", io.StringIO(
+        "search\n"
+        "# comment\n"
+        "\n"
+        "retrieve studies/1/series/2/instances/3 --output {}\n"
+        "unknown\n"
+        "batch\n".format(OUTPUT)))
+    dcmweb_cli = dcmweb.Dcmweb(URL, False, None)
+    session = dcmweb_cli.requests.session
+    try:
+        with pytest.raises(SystemExit):
+            dcmweb_cli.batch()
+        check.equal([request.path for request in httpretty.latest_requests()],
+                    ["/studies?limit=5000", "/studies/1/series/2/instances/3"])
+        check.is_true('"1": 1' in capsys.readouterr().out)
+        check.is_true(os.path.isfile(OUTPUT + "1/2/3.dcm"))
+        check.is_true(dcmweb_cli.requests.session is session)
+    finally:
+        shutil.rmtree(OUTPUT)
+
+
+@httpretty.activate
+def test_batch_file():
+    """commands should be read from file"""
+    httpretty.register_uri(httpretty.DELETE, URL + "studies/1", body="{}")
+    os.makedirs(OUTPUT, exist_ok=True)
+    with open(OUTPUT + "commands", "w") as file:
+        file.write("delete studies/1\n")
+    try:
+        dcmweb.Dcmweb(URL, False, None).batch(OUTPUT + "commands")
+        check.equal(httpretty.last_request().method, "DELETE")
+    finally:
+        shutil.rmtree(OUTPUT)
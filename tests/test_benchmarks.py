@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite smoke tests
+"""
+import argparse
+import pytest_check as check
+from benchmarks import suite
+
+
+def test_suite_scenarios():
+    """every scenario should handle whole catalog of mock server"""
+    arguments = argparse.Namespace(
+        studies=1, series=2, instances=2, instance_size=1024, latency=0.0, bandwidth=None,
+        error_rate=0.0, backoff=0.0, batch_size=3, metrics=True, m=True)
+    for scenario in suite.SCENARIOS:
+        arguments.scenario = scenario
+        result = suite.run(arguments)
+        check.equal(result["files"], 4, scenario)
+        check.equal(result["errors"], 0, scenario)
+        check.is_true(result["p99_ms"] >= result["p50_ms"], scenario)
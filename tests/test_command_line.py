@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Command line wrapper tests
+"""
+import contextlib
+import io
+import subprocess
+import sys
+import fire
+import httpretty
+import pytest_check as check
+from dcmweb import command_line
+
+HEAVY_MODULES = ("fire", "google.auth", "requests", "validators", "hurry.filesize",
+                 "xml.dom.minidom", "cProfile", "pstats")
+
+
+def imported_modules(code):
+    """Runs code in new interpreter with -X importtime and returns names of imported modules"""
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return {line.split("|")[-1].strip() for line in output.stderr.decode().splitlines()
+            if line.startswith("import time:")}
+
+
+def test_import_time():
+    """heavy modules should be imported only when they are used"""
+    modules = imported_modules("import dcmweb.command_line")
+    check.is_true("dcmweb.dcmweb" in modules)
+    for module in HEAVY_MODULES:
+        check.is_false(module in modules, module)
+
+
+def test_help_import_time():
+    """custom help should be printed without importing heavy modules"""
+    modules = imported_modules(
+        "import sys; sys.argv = ['dcmweb', '--help']\n"
+        "from dcmweb import command_line\n"
+        "try:\n    command_line.main()\nexcept SystemExit:\n    pass")
+    for module in HEAVY_MODULES:
+        check.is_false(module in modules, module)
+
+
+@httpretty.activate
+def test_command_positional_arguments(monkeypatch):
+    """positional arguments after host options should be left to command"""
+    # credentials aren't needed to parse command line
+    monkeypatch.setattr(command_line.dcmweb, "GoogleAuthenticator", lambda *args: None)
+    httpretty.register_uri(httpretty.GET, "https://dicom.example.com/dicomWeb/studies")
+    with contextlib.redirect_stdout(io.StringIO()):
+        check.equal(fire.Fire(command_line.host_wrapper, command=[
+            "https://dicom.example.com/dicomWeb", "0", "--pool_size=3", "requests", "host"]),
+                    "https://dicom.example.com/dicomWeb/")
+        check.equal(fire.Fire(command_line.host_wrapper, command=[
+            "https://dicom.example.com/dicomWeb", "1", "--keep_alive=False", "requests", "host"]),
+                    "https://dicom.example.com/dicomWeb/")
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Copy method tests
+"""
+import pytest_check as check
+from dcmweb import dcmweb
+from dcmweb import requests_util
+from benchmarks import mock_server
+
+INSTANCES = {"/studies/1/series/2/instances/3": ("application/dicom", b"instance 3"),
+             "/studies/1/series/2/instances/4": (
+                 'multipart/related; type="application/dicom"; boundary=b',
+                 b"--b\r\nContent-Type: application/dicom\r\n\r\ninstance 4\r\n--b--\r\n")}
+
+
+def stow_response(instance_uid, stored=True):
+    """builds STOW-RS response with single instance status"""
+    if stored:
+        return '<NativeDicomModel><DicomAttribute keyword="ReferencedSOPSequence"><Item>\
+<DicomAttribute keyword="ReferencedSOPInstanceUID"><Value>{0}</Value></DicomAttribute>\
+<DicomAttribute keyword="RetrieveURL"><Value>studies/1/series/2/instances/{0}</Value>\
+</DicomAttribute></Item></DicomAttribute></NativeDicomModel>'.format(instance_uid)
+    return '<NativeDicomModel><DicomAttribute keyword="FailedSOPSequence"><Item>\
+<DicomAttribute keyword="ReferencedSOPInstanceUID"><Value>{}</Value></DicomAttribute>\
+<DicomAttribute keyword="FailureReason"><Value>272</Value></DicomAttribute></Item>\
+</DicomAttribute></NativeDicomModel>'.format(instance_uid)
+
+
+def test_copy():
+    """instances should be streamed from source to destination and verified"""
+    bodies = []
+    responses = [(503, ""), (200, stow_response("3")), (409, stow_response("4", False))]
+    with mock_server.LocalServer(StoreHandler, bodies=bodies, responses=responses) as server:
+        url = server.url
+        dcmweb_cli = dcmweb.Dcmweb(url, False, None,
+                                   retry_policy=requests_util.RetryPolicy(2, 0))
+        dcmweb_cli.copy(url, "studies/1/series/2/instances/3")
+        check.equal(bodies, [b"instance 3", b"instance 3"])
+        try:
+            dcmweb_cli.requests.copy_dicom(
+                {"study_id": "1", "series_id": "2", "instance_id": "4"}, dcmweb_cli.requests)
+        except requests_util.NetworkError as exception:
+            check.equal(str(exception), "copying instance: /studies/1/series/2/instances/4 "
+                        "failed with reason 272")
+        else:
+            check.is_true(False, "NetworkError expected")
+        check.equal(bodies[-1], b"instance 4")
+
+
+def test_copy_source_retries():
+    """failed source request is retried only by send, retries of all attempts are counted"""
+    gets = []
+    statuses = [503]
+    responses = [(503, ""), (200, stow_response("3"))]
+    with mock_server.LocalServer(SourceHandler, bodies=[], responses=responses, gets=gets,
+                                 statuses=statuses) as server:
+        requests = requests_util.Requests(server.url, None,
+                                          retry_policy=requests_util.RetryPolicy(3, 0))
+        ids = {"study_id": "1", "series_id": "2", "instance_id": "3"}
+        # source retry, repeat after destination failure
+        check.equal(requests.copy_dicom(ids, requests)["retries"], 2)
+        check.equal(len(gets), 3)
+        statuses.extend([503] * 3)
+        try:
+            requests.copy_dicom(ids, requests)
+        except requests_util.NetworkError as exception:
+            check.equal(exception.status_code, 503)
+            check.equal(exception.retries, 2)
+        else:
+            check.is_true(False, "NetworkError expected")
+        check.equal(len(gets), 6)
+
+
+class StoreHandler(mock_server.LocalHandler):
+    """Serves instances and records chunked store requests"""
+
+    def do_GET(self):  # pylint: disable=invalid-name; name required by BaseHTTPRequestHandler
+        """Returns instance by path or empty json"""
+        content_type, body = INSTANCES.get(self.path, ("application/dicom+json", b"[]"))
+        self.respond(200, content_type, body)
+
+    def do_POST(self):  # pylint: disable=invalid-name; name required by BaseHTTPRequestHandler
+        """Reads chunked body and answers with next response"""
+        body = b""
+        size = int(self.rfile.readline(), 16)
+        while size:
+            body += self.rfile.read(size)
+            self.rfile.readline()
+            size = int(self.rfile.readline(), 16)
+        self.rfile.readline()
+        self.server.bodies.append(body)
+        status, response = self.server.responses.pop(0)
+        self.respond(status, "application/dicom+xml" if response else "text/plain",
+                     response.encode())
+
+
+class SourceHandler(StoreHandler):
+    """Answers GET requests with scripted statuses before serving instances"""
+
+    def do_GET(self):  # pylint: disable=invalid-name; name required by BaseHTTPRequestHandler
+        """Returns next scripted status or instance"""
+        self.server.gets.append(self.path)
+        if self.server.statuses:
+            self.respond(self.server.statuses.pop(0), "text/plain", b"busy")
+        else:
+            super().do_GET()
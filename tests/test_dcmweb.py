@@ -3,9 +3,16 @@
 """
 import unittest
 import time
+import queue
+import threading
+import random
 import concurrent.futures
+from urllib.parse import urlparse, parse_qs
 import httpretty
+import pytest
 from dcmweb import dcmweb
+from dcmweb import requests_util
+from benchmarks import mock_server
 
 
 class DcmwebTests(unittest.TestCase):
@@ -17,15 +24,37 @@ class DcmwebTests(unittest.TestCase):
 
     @httpretty.activate
     def test_fail_validation(self):
-        """validation should fail"""
+        """validation should fail on first failed request and stop further requests"""
         httpretty.register_uri(
             httpretty.GET,
             "https://dicom.com/studies?limit=1",
             match_querystring=True,
             status=404
         )
+        httpretty.register_uri(httpretty.GET, "https://dicom.com/studies/1", status=404)
+        dcmweb_cli = dcmweb.Dcmweb("https://dicom.com/", False, None)
+        self.assertEqual(len(httpretty.latest_requests()), 0)
         with self.assertRaises(SystemExit):
-            dcmweb.Dcmweb("https://dicom.com/", False, None)
+            dcmweb_cli.search("studies/1")
+        self.assertEqual([request.path for request in httpretty.latest_requests()],
+                         ["/studies/1?limit=5000", "/studies?limit=1"])
+        with self.assertRaises(requests_util.HostUnavailableError):
+            dcmweb_cli.requests.request("studies/1", "", {})
+        self.assertEqual(len(httpretty.latest_requests()), 2)
+
+    @httpretty.activate
+    def test_pass_validation(self):
+        """successful validation should keep error of failed request"""
+        httpretty.register_uri(httpretty.GET, "https://dicom.com/studies?limit=1",
+                               match_querystring=True)
+        httpretty.register_uri(httpretty.GET, "https://dicom.com/studies/1", status=404)
+        dcmweb_cli = dcmweb.Dcmweb("https://dicom.com/", False, None)
+        with self.assertRaises(requests_util.NetworkError):
+            dcmweb_cli.requests.request("studies/1", "", {})
+        with self.assertRaises(requests_util.NetworkError):
+            dcmweb_cli.requests.request("studies/1", "", {})
+        self.assertEqual([request.path for request in httpretty.latest_requests()],
+                         ["/studies/1", "/studies?limit=1", "/studies/1"])
 
     def test_execute_file_transfer_futures(self):
         """all generated futures should be executed"""
@@ -33,7 +62,7 @@ class DcmwebTests(unittest.TestCase):
         transferred = dcmweb.execute_file_transfer_futures(
             generate_futures(self.sum_future, 10), True)
         assert self.global_sum == 45
-        assert transferred == {'bytes': 165, 'files': 10}
+        assert transferred == {'bytes': 165, 'files': 10, 'retries': 0}
 
     def sum_future(self, number):
         """adds number to global variable"""
@@ -42,30 +71,203 @@ class DcmwebTests(unittest.TestCase):
 
 
 def test_wait_for_futures_limit():
-    """method should wait until specified limit of set"""
-    running_futures = set([])
-    transferred = {'files': 0, 'bytes': 0}
+    """method should account done futures and wait until specified limit of running ones"""
+    done_futures = queue.Queue()
+    transferred = {'files': 0, 'bytes': 0, 'retries': 0}
+    release = threading.Event()
     with concurrent.futures.ThreadPoolExecutor() as executor:
         for i in range(5):
-            running_futures.add(executor.submit(sleep_future, i))
-        running_futures, transferred = dcmweb.wait_for_futures_limit(
-            running_futures, transferred, 2)
-        assert len(running_futures) == 2
+            executor.submit(blocked_future, i, release if i > 2 else None) \
+                .add_done_callback(done_futures.put)
+        running = dcmweb.wait_for_futures_limit(done_futures, 5, transferred, 2)
+        assert running == 2
         assert transferred['files'] == 3
         assert transferred['bytes'] == 3
-        running_futures, transferred = dcmweb.wait_for_futures_limit(
-            running_futures, transferred, 0)
+        # done futures are accounted without waiting for running ones
+        assert dcmweb.wait_for_futures_limit(done_futures, running, transferred, 5) == 2
+        release.set()
+        running = dcmweb.wait_for_futures_limit(done_futures, running, transferred, 0)
+        assert running == 0
         assert transferred['files'] == 5
         assert transferred['bytes'] == 10
 
 
+def test_slot_refilled_immediately():
+    """next transfer should start as soon as one of running transfers is done"""
+    starts = []
+
+    def transfer(duration):
+        starts.append(time.monotonic())
+        time.sleep(duration)
+        return {"transferred": 1}
+    start = time.monotonic()
+    dcmweb.execute_file_transfer_futures(
+        ((transfer, duration) for duration in (0.05, 2, 0.05)), True, 2,
+        dcmweb.InflightLimit(2))
+    assert starts[2] - start < 0.5
+
+
+def blocked_future(number, release):
+    """returns number after release event is set"""
+    if release is not None:
+        release.wait()
+    return {"transferred": number}
+
+
+def test_inflight_default():
+    """default limit of transfers in flight should keep all workers busy"""
+    for workers, max_inflight in ((None, dcmweb.QUEUE_LIMIT), (4, dcmweb.QUEUE_LIMIT),
+                                  (256, 256)):
+        dcmweb_cli = dcmweb.Dcmweb("https://dicom.com/", True, None, workers=workers)
+        assert dcmweb_cli.max_inflight == max_inflight
+
+
+def test_host_unavailable():
+    """unavailable host should stop transfers"""
+    def unavailable(_):
+        raise requests_util.HostUnavailableError("host is inaccessible")
+    with pytest.raises(requests_util.HostUnavailableError):
+        dcmweb.execute_file_transfer_futures(generate_futures(unavailable, 5), True, 2)
+
+
+class ConcurrencyCounter:  # pylint: disable=too-few-public-methods; simple callback of transfers
+    """Tracks maximum amount of simultaneously running calls"""
+
+    def __init__(self):
+        self.running = 0
+        self.maximum = 0
+        self.lock = threading.Lock()
+
+    def run(self, number):
+        """sleeps while counted as running"""
+        with self.lock:
+            self.running += 1
+            self.maximum = max(self.maximum, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        return {"transferred": number}
+
+
+def test_adaptive_limit():
+    """limit should grow on success and halve on throttling"""
+    limit = dcmweb.AdaptiveLimit(4, 8)
+    for _ in range(8):
+        limit.on_success(1)
+    assert limit.value == 5
+    limit.on_throttle()
+    assert limit.value == 2
+    # transfers started before decrease are ignored
+    for _ in range(5):
+        limit.on_throttle()
+    assert limit.value == 2
+    limit.on_throttle()
+    assert limit.value == 1
+    for _ in range(100):
+        limit.on_success(1)
+    assert limit.value == 8
+
+
+def test_adaptive_limit_latency():
+    """limit should decrease when latency rises"""
+    limit = dcmweb.AdaptiveLimit(10, 20)
+    for _ in range(dcmweb.LATENCY_WARMUP):
+        limit.on_success(1)
+    for _ in range(30):
+        limit.on_success(10)
+    assert limit.value < 10
+
+
+def test_adaptive_limit_noisy_latency():
+    """limit should grow with latency varying around stable level"""
+    limit = dcmweb.AdaptiveLimit(8, 64)
+    latencies = random.Random(0)
+    for _ in range(5000):
+        limit.on_success(latencies.uniform(0.03, 0.15))
+    assert limit.value == 64
+
+
+def test_adaptive_limit_wrap():
+    """wrapped function should report throttling"""
+    limit = dcmweb.AdaptiveLimit(4, 8)
+
+    def throttled():
+        raise requests_util.NetworkError("throttled", 429)
+    with pytest.raises(requests_util.NetworkError):
+        limit.wrap(throttled)()
+    assert limit.value == 2
+    assert limit.wrap(lambda number: {"transferred": number})(3) == {"transferred": 3}
+
+
+@httpretty.activate
+def test_adaptive_limit_retried_throttling():
+    """throttled response retried during transfer should decrease limit"""
+    httpretty.register_uri(
+        httpretty.GET, "https://dicom.com/studies/1",
+        responses=[httpretty.Response(body="busy", status=429),
+                   httpretty.Response(body="[]", status=200)])
+    requests = requests_util.Requests("https://dicom.com/", None,
+                                      retry_policy=requests_util.RetryPolicy(2, 0))
+    limit = dcmweb.AdaptiveLimit(4, 8)
+
+    def transfer():
+        response = requests.request("studies/1", "", {})
+        return {"transferred": len(response.content), "retries": response.retries}
+    assert limit.wrap(transfer)() == {"transferred": 2, "retries": 1}
+    assert limit.value == 2
+
+
+def test_execute_with_adaptive_limit():
+    """all futures should be executed under adaptive limit"""
+    counter = ConcurrencyCounter()
+    transferred = dcmweb.execute_file_transfer_futures(
+        generate_futures(counter.run, 20), True, 8, dcmweb.AdaptiveLimit(2, 8))
+    assert transferred == {'bytes': 190, 'files': 20, 'retries': 0}
+    assert counter.maximum <= 8
+
+
+def test_search_pages_prefetch():
+    """pages should be requested in parallel and yielded in order"""
+    with mock_server.LocalServer(SlowPagesHandler, paths=[]) as server:
+        dcmweb_cli = dcmweb.Dcmweb(server.url, False, None)
+        start = time.time()
+        pages = list(dcmweb_cli._search_pages("instances", "limit=1"))  # pylint: disable=protected-access; internal paginator
+        assert pages == [[0], [1], [2], [3], [4], [5]]
+        assert time.time() - start < 1.0
+
+
+def test_search_pages_single():
+    """page with less results than limit should be the last one requested"""
+    paths = []
+    with mock_server.LocalServer(SlowPagesHandler, paths=paths) as server:
+        dcmweb_cli = dcmweb.Dcmweb(server.url, False, None)
+        assert list(dcmweb_cli._search_pages("instances", "")) == [[0]]  # pylint: disable=protected-access; internal paginator
+        assert len(paths) == 1
+        pages = dcmweb_cli._search_pages("instances", "limit=1")  # pylint: disable=protected-access; internal paginator
+        start = time.time()
+        assert next(pages) == [0]
+        pages.close()
+        assert time.time() - start < 0.35
+
+
+class SlowPagesHandler(mock_server.LocalHandler):
+    """Answers instance search with page number after delay, six pages total"""
+
+    def do_GET(self):  # pylint: disable=invalid-name; name required by BaseHTTPRequestHandler
+        """Returns json array with page number"""
+        body = b"[]"
+        url = urlparse(self.path)
+        self.server.paths.append(self.path)
+        if url.path == "/instances":
+            time.sleep(0.2)
+            query = parse_qs(url.query)
+            page = int(query["offset"][0]) // int(query["limit"][0])
+            if page < 6:
+                body = "[{}]".format(page).encode()
+        self.respond(200, "application/dicom+json", body)
+
+
 def generate_futures(function, number_of_futures):
     """generates futures for test"""
     for i in range(number_of_futures):
         yield (function, i)
-
-
-def sleep_future(seconds):
-    """sleeps for specified amount of seconds"""
-    time.sleep(seconds)
-    return {"transferred": seconds}
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""DICOM header reader tests
+"""
+import io
+import struct
+import unittest
+import pytest_check as check
+from dcmweb import dicom_header
+
+EXPLICIT_VR_LITTLE_ENDIAN = "1.2.840.10008.1.2.1"
+IDS = {'study_id': '1.2.3', 'series_id': '1.2.3.4', 'instance_id': '1.2.3.4.5'}
+
+
+class DicomHeaderTests(unittest.TestCase):
+    """class is needed to handle exceptions"""
+
+    def test_missing_prefix(self):
+        """file without DICM prefix should be rejected"""
+        with self.assertRaises(ValueError):
+            dicom_header.read_ids(io.BytesIO(b"\0" * 200))
+
+    def test_missing_tag(self):
+        """file without instance uid should be rejected"""
+        with self.assertRaises(LookupError):
+            dicom_header.read_ids(io.BytesIO(build_file(
+                EXPLICIT_VR_LITTLE_ENDIAN, [
+                    explicit((0x0020, 0x000D), b"UI", uid("1.2.3")),
+                    explicit((0x0020, 0x000E), b"UI", uid("1.2.3.4")),
+                    explicit((0x7FE0, 0x0010), b"OB", b"\0" * 4)])))
+
+    def test_truncated(self):
+        """truncated header should be rejected"""
+        with self.assertRaises(ValueError):
+            dicom_header.read_ids(io.BytesIO(build_file(
+                EXPLICIT_VR_LITTLE_ENDIAN, [
+                    explicit((0x0008, 0x0018), b"UI", uid("1.2.3.4.5"))])))
+
+
+def test_read_file_ids():
+    """ids should be read from test files"""
+    check.equal(dicom_header.read_file_ids("./cloudBuild/dcms/1.dcm"),
+                {'study_id': '111', 'series_id': '111', 'instance_id': '111'})
+
+
+def test_explicit_with_sequences():
+    """sequences of defined and undefined length should be skipped"""
+    item = explicit((0x0008, 0x0100), b"SH", b"CODE")
+    elements = [
+        explicit((0x0008, 0x0018), b"UI", uid(IDS["instance_id"])),
+        explicit((0x0008, 0x1032), b"SQ", b"", undefined=True) + undefined_item(item, "<")
+        + struct.pack("<HHI", 0xFFFE, 0xE0DD, 0),
+        explicit((0x0008, 0x1115), b"SQ", struct.pack("<HHI", 0xFFFE, 0xE000, len(item)) + item),
+        explicit((0x0009, 0x0010), b"UN", b"", undefined=True)
+        + undefined_item(implicit((0x0009, 0x1001), b"1.2"), "<")
+        + struct.pack("<HHI", 0xFFFE, 0xE0DD, 0),
+        explicit((0x0010, 0x0010), b"PN", b"Doe^John"),
+        explicit((0x0020, 0x000D), b"UI", uid(IDS["study_id"])),
+        explicit((0x0020, 0x000E), b"UI", uid(IDS["series_id"])),
+        explicit((0x7FE0, 0x0010), b"OB", b"", undefined=True)]
+    check.equal(dicom_header.read_ids(io.BytesIO(build_file(
+        EXPLICIT_VR_LITTLE_ENDIAN, elements))), IDS)
+
+
+def test_implicit():
+    """implicit VR little endian dataset should be read"""
+    elements = [
+        implicit((0x0008, 0x0018), uid(IDS["instance_id"])),
+        implicit((0x0008, 0x1032), b"", undefined=True)
+        + undefined_item(implicit((0x0008, 0x0100), b"CODE"), "<")
+        + struct.pack("<HHI", 0xFFFE, 0xE0DD, 0),
+        implicit((0x0020, 0x000D), uid(IDS["study_id"])),
+        implicit((0x0020, 0x000E), uid(IDS["series_id"]))]
+    check.equal(dicom_header.read_ids(io.BytesIO(build_file(
+        dicom_header.IMPLICIT_VR_LITTLE_ENDIAN, elements))), IDS)
+
+
+def test_big_endian():
+    """explicit VR big endian dataset should be read"""
+    elements = [
+        explicit((0x0008, 0x0018), b"UI", uid(IDS["instance_id"]), byte_order=">"),
+        explicit((0x0020, 0x000D), b"UI", uid(IDS["study_id"]), byte_order=">"),
+        explicit((0x0020, 0x000E), b"UI", uid(IDS["series_id"]), byte_order=">")]
+    check.equal(dicom_header.read_ids(io.BytesIO(build_file(
+        dicom_header.EXPLICIT_VR_BIG_ENDIAN, elements))), IDS)
+
+
+def uid(value):
+    """pads uid to even length"""
+    value = value.encode("ascii")
+    return value + b"\0" * (len(value) % 2)
+
+
+def explicit(tag, value_representation, value, undefined=False, byte_order="<"):
+    """encodes explicit VR element"""
+    length = 0xFFFFFFFF if undefined else len(value)
+    header = struct.pack(byte_order + "HH", *tag) + value_representation
+    if value_representation in dicom_header.LONG_LENGTH_VRS:
+        return header + b"\0\0" + struct.pack(byte_order + "I", length) + value
+    return header + struct.pack(byte_order + "H", length) + value
+
+
+def implicit(tag, value, undefined=False):
+    """encodes implicit VR little endian element"""
+    length = 0xFFFFFFFF if undefined else len(value)
+    return struct.pack("<HHI", tag[0], tag[1], length) + value
+
+
+def undefined_item(content, byte_order):
+    """encodes item of undefined length"""
+    return struct.pack(byte_order + "HHI", 0xFFFE, 0xE000, 0xFFFFFFFF) + content \
+        + struct.pack(byte_order + "HHI", 0xFFFE, 0xE00D, 0)
+
+
+def build_file(transfer_syntax, elements):
+    """encodes part 10 file with meta group and elements"""
+    meta = explicit((0x0002, 0x0001), b"OB", b"\0\1") \
+        + explicit((0x0002, 0x0010), b"UI", uid(transfer_syntax))
+    return b"\0" * 128 + b"DICM" + explicit((0x0002, 0x0000), b"UL", struct.pack("<I", len(meta))) \
+        + meta + b"".join(elements)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Index method tests
+"""
+import os
+import json
+import httpretty
+import pytest_check as check
+from dcmweb import dcmweb
+from dcmweb import inventory
+
+URL = "https://dicom.com/"
+DATABASE = "./testData/index.sqlite"
+STUDY_PARAMETERS = "includefield=00080020&includefield=00100020&includefield=00201208"
+INSTANCE_PARAMETERS = "includefield=0020000D&includefield=0020000E"
+
+
+def register_page(path, parameters, results):
+    """registers single page with results"""
+    httpretty.register_uri(
+        httpretty.GET,
+        "{}{}?{}&limit=5000&offset=0".format(URL, path, parameters),
+        body=json.dumps(results),
+        match_querystring=True
+    )
+
+
+def study_json(study_id, instances):
+    """builds QIDO study result"""
+    return {"0020000D": {"Value": [study_id]}, "00080020": {"Value": ["20200101"]},
+            "00201208": {"Value": [instances]}}
+
+
+def instance_json(study_id, series_id, instance_id):
+    """builds QIDO instance result"""
+    return {"0020000D": {"Value": [study_id]}, "0020000E": {"Value": [series_id]},
+            "00080018": {"Value": [instance_id]}}
+
+
+@httpretty.activate
+def test_index():
+    """index should be built and refreshed by changed studies only"""
+    httpretty.register_uri(httpretty.GET, URL + "studies?limit=1", match_querystring=True)
+    register_page("studies", STUDY_PARAMETERS, [study_json("1", 2), study_json("2", 1)])
+    register_page("studies/1/instances", INSTANCE_PARAMETERS,
+                  [instance_json("1", "3", "4"), instance_json("1", "3", "5")])
+    register_page("studies/2/instances", INSTANCE_PARAMETERS, [instance_json("2", "6", "7")])
+    os.makedirs(os.path.dirname(DATABASE), exist_ok=True)
+    try:
+        dcmweb_cli = dcmweb.Dcmweb(URL, True, None)
+        dcmweb_cli.index(DATABASE)
+        with inventory.Inventory(DATABASE, URL) as index:
+            check.equal(index.studies(), {"1": ("20200101", 2), "2": ("20200101", 1)})
+            check.equal(len(list(index.instances({}))), 3)
+
+        register_page("studies", STUDY_PARAMETERS, [study_json("1", 2)])
+        requests_before = len(httpretty.latest_requests())
+        dcmweb_cli.index(DATABASE)
+        # unchanged study isn't listed again
+        check.is_false(any("/instances" in request.path
+                           for request in httpretty.latest_requests()[requests_before:]))
+        with inventory.Inventory(DATABASE, URL) as index:
+            check.equal(index.studies(), {"1": ("20200101", 2)})
+            check.equal(sorted(index.study_instances("1")), ["4", "5"])
+    finally:
+        os.remove(DATABASE)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Local index tests
+"""
+import os
+import pytest
+import pytest_check as check
+from dcmweb import inventory
+
+DATABASE = "./testData/inventory.sqlite"
+HOST = "https://dicom.com/"
+STUDY = {"study_uid": "1", "study_date": "20200101", "patient_id": "p", "instances": 3}
+
+
+def instance_ids(study_id, series_id, instance_id):
+    """builds dict of instance ids"""
+    return {"study_id": study_id, "series_id": series_id, "instance_id": instance_id}
+
+
+def test_inventory():
+    """indexed instances should be queried by ids"""
+    os.makedirs(os.path.dirname(DATABASE), exist_ok=True)
+    try:
+        with inventory.Inventory(DATABASE, HOST) as index:
+            index.replace_study(STUDY, [instance_ids("1", "2", "3"), instance_ids("1", "2", "4"),
+                                        instance_ids("1", "5", "6")])
+            index.replace_study(dict(STUDY, study_uid="7", instances=1),
+                                [instance_ids("7", "8", "9")])
+        with inventory.Inventory(DATABASE, HOST) as index:
+            check.equal(index.studies(), {"1": ("20200101", 3), "7": ("20200101", 1)})
+            check.equal(len(list(index.instances({}))), 4)
+            check.equal(list(index.instances({"study_id": "1", "series_id": "5"})),
+                        [instance_ids("1", "5", "6")])
+            check.equal(list(index.bulk_ids({}, "study")), [{"study_id": "1"}, {"study_id": "7"}])
+            check.equal(list(index.bulk_ids({"study_id": "1"}, "series")),
+                        [{"study_id": "1", "series_id": "2"}, {"study_id": "1", "series_id": "5"}])
+            check.equal(sorted(index.study_instances("1")), ["3", "4", "6"])
+            index.replace_study(dict(STUDY, instances=1), [instance_ids("1", "2", "3")])
+            index.remove_studies(["7"])
+            check.equal(list(index.instances({})), [instance_ids("1", "2", "3")])
+            check.equal(list(index.bulk_ids({}, "series")), [{"study_id": "1", "series_id": "2"}])
+    finally:
+        os.remove(DATABASE)
+
+
+def test_other_host():
+    """index of other host should be rejected"""
+    os.makedirs(os.path.dirname(DATABASE), exist_ok=True)
+    try:
+        inventory.Inventory(DATABASE, HOST).close()
+        with pytest.raises(ValueError):
+            inventory.Inventory(DATABASE, "https://other.com/")
+    finally:
+        os.remove(DATABASE)
+
+
+def test_study_from_json():
+    """missing attributes should be None"""
+    check.equal(inventory.study_from_json({"0020000D": {"vr": "UI", "Value": ["1"]},
+                                           "00080020": {"vr": "DA"},
+                                           "00201208": {"vr": "IS", "Value": [5]}}),
+                {"study_uid": "1", "study_date": None, "patient_id": None, "instances": 5})
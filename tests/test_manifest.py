@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Completion manifest tests
+"""
+import os
+import shutil
+import pytest_check as check
+from dcmweb import manifest
+
+OUTPUT = "./testData/manifest/"
+IDS = {'study_id': '1', 'series_id': '2', 'instance_id': '3'}
+
+
+def test_manifest():
+    """added instances should be found after reopening"""
+    with manifest.Manifest(OUTPUT) as completed:
+        check.is_false(IDS in completed)
+        completed.add(IDS)
+        check.is_true(IDS in completed)
+    with manifest.Manifest(OUTPUT) as completed:
+        check.is_true(IDS in completed)
+        check.is_false({'study_id': '1', 'series_id': '2', 'instance_id': '4'} in completed)
+    with manifest.Manifest(OUTPUT, "image/png") as completed:
+        check.is_false(IDS in completed)
+    shutil.rmtree(OUTPUT)
+
+
+def test_interrupted_line():
+    """line without new line char should be ignored"""
+    os.makedirs(OUTPUT, exist_ok=True)
+    with open(manifest.manifest_path(OUTPUT), "w") as file:
+        file.write("1/2/3\n1/2/")
+    with manifest.Manifest(OUTPUT) as completed:
+        check.equal(completed.done, {"1/2/3"})
+        completed.add(IDS)
+    with manifest.Manifest(OUTPUT) as completed:
+        check.equal(completed.done, {"1/2/3"})
+    with open(manifest.manifest_path(OUTPUT)) as file:
+        check.equal(file.read(), "1/2/3\n1/2/\n1/2/3\n")
+    shutil.rmtree(OUTPUT)
+
+
+def test_instances():
+    """recorded instances should be counted once by study and series"""
+    with manifest.Manifest(OUTPUT) as completed:
+        for instance_id in ("3", "4", "3"):
+            completed.add(dict(IDS, instance_id=instance_id))
+        completed.add({'study_id': '1', 'series_id': '5', 'instance_id': '6'})
+    with manifest.Manifest(OUTPUT) as completed:
+        check.equal(completed.instances({'study_id': '1'}), 3)
+        check.equal(completed.instances({'study_id': '1', 'series_id': '2'}), 2)
+        check.equal(completed.instances({'study_id': '7'}), 0)
+    shutil.rmtree(OUTPUT)
+
+
+def test_manifest_path():
+    """type should be part of manifest name"""
+    check.equal(manifest.manifest_path("out"), os.path.join("out", ".dcmweb_manifest"))
+    check.equal(manifest.manifest_path("out", "image/png"),
+                os.path.join("out", ".dcmweb_manifest_image_png"))
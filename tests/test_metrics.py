@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Metrics tests
+"""
+import os
+import json
+import shutil
+import pytest_check as check
+from dcmweb import dcmweb
+from dcmweb import metrics
+from benchmarks import mock_server
+
+OUTPUT = "./testData/metrics/"
+
+
+def test_histogram():
+    """observations should be counted by buckets"""
+    histogram = metrics.Histogram()
+    for seconds in (0.0005, 0.003, 0.003, 0.02, 1000):
+        histogram.observe(seconds)
+    check.equal(histogram.count, 5)
+    check.equal(histogram.quantile(0.5), 0.004)
+    check.equal(histogram.quantile(0.8), 0.032)
+    check.equal(histogram.quantile(1), float("inf"))
+    cumulative = histogram.cumulative()
+    check.equal(cumulative[0], ("0.001", 1))
+    check.equal(cumulative[-1], ("+Inf", 5))
+
+
+def test_request_phases():
+    """phases of retrieve should be recorded and exported"""
+    request_metrics = metrics.Metrics()
+    try:
+        with mock_server.MockServer(catalog=(1, 1, 2)) as server:
+            dcmweb_cli = dcmweb.Dcmweb(server.url, False, None, metrics=request_metrics)
+            dcmweb_cli.retrieve("studies/1", OUTPUT)
+        histograms = request_metrics.histograms
+        check.equal(histograms["connect"].count, server.connections)
+        # search pages and two instances
+        check.equal(histograms["ttfb"].count, server.requests)
+        check.equal(histograms["disk_write"].count, 2)
+        check.equal(request_metrics.written, 2 * 8192)
+        request_metrics.report(OUTPUT + "metrics.json")
+        with open(OUTPUT + "metrics.json") as file:
+            check.equal(json.load(file)["phases"]["disk_write"]["count"], 2)
+        request_metrics.report(OUTPUT + "metrics.prom")
+        with open(OUTPUT + "metrics.prom") as file:
+            text = file.read()
+        check.is_true('dcmweb_phase_seconds_count{phase="disk_write"} 2\n' in text)
+        check.is_true("dcmweb_written_bytes_total 16384\n" in text)
+    finally:
+        if os.path.isdir(OUTPUT):
+            shutil.rmtree(OUTPUT)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Profiling tests
+"""
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import pytest
+import pytest_check as check
+from dcmweb import dcmweb
+from dcmweb import profiling
+from benchmarks import mock_server
+
+OUTPUT = "./testData/profiling/"
+# interpreter with single profile per process, current one or one given by PYTHON_312 variable
+PYTHON_312 = sys.executable if sys.version_info >= (3, 12) else os.environ.get("PYTHON_312")
+# profiles command with listing in main thread and transfers in worker threads
+SHARED_SCRIPT = """
+import json, threading
+from dcmweb import profiling
+profiler = profiling.Profiler()
+def listed():
+    return [1]
+def transferred():
+    return sum(range(1000))
+def transfer():
+    with profiler.phase(profiling.TRANSFER):
+        transferred()
+with profiler.phase(profiling.COMMAND):
+    list(profiler.iterate(profiling.LISTING, (listed() for _ in range(3))))
+    threads = [threading.Thread(target=transfer) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+print(json.dumps({"shared": profiling.SHARED_PROFILE, "unprofiled": profiler.unprofiled,
+                  **{phase: sorted({function[2] for function in profiler.stats(phase).stats})
+                     for phase in (profiling.COMMAND, profiling.LISTING, profiling.TRANSFER)}}))
+"""
+
+
+def function_names(stats):
+    """Returns names of functions profiled in stats"""
+    return {function[2] for function in stats.stats}
+
+
+def test_retrieve_phases():
+    """listing, transfers and their finalization should be profiled separately"""
+    profiler = profiling.Profiler()
+    try:
+        with mock_server.MockServer(catalog=(1, 2, 2)) as server:
+            dcmweb_cli = dcmweb.Dcmweb(server.url, True, None, profiler=profiler)
+            dcmweb_cli.retrieve("studies/1", OUTPUT)
+            dcmweb_cli.retrieve("studies/1", OUTPUT, bulk="series")
+        check.is_in("json_loads", function_names(profiler.stats(profiling.LISTING)))
+        transfer = function_names(profiler.stats(profiling.TRANSFER))
+        check.is_in("download_dicom", transfer)
+        check.is_in("read_chunks", transfer)
+        check.is_not_in("json_loads", transfer)
+        check.is_in("account_future", function_names(profiler.stats(profiling.FINALIZATION)))
+        check.is_in("_execute_transfers", function_names(profiler.stats(profiling.COMMAND)))
+        check.is_none(profiler.stats(profiling.DISCOVERY))
+        profiler.report(OUTPUT + "retrieve")
+        for phase in (profiling.COMMAND, profiling.LISTING, profiling.TRANSFER,
+                      profiling.FINALIZATION):
+            stats = pstats.Stats("{}retrieve.{}.prof".format(OUTPUT, phase))
+            check.is_true(stats.total_calls > 0)
+        check.is_false(os.path.exists(OUTPUT + "retrieve.discovery.prof"))
+    finally:
+        shutil.rmtree(OUTPUT)
+
+
+def test_store_phases():
+    """search of files to store should be profiled as discovery"""
+    profiler = profiling.Profiler()
+    os.makedirs(OUTPUT, exist_ok=True)
+    try:
+        with mock_server.MockServer() as server:
+            for instance in ("1", "2"):
+                with open(OUTPUT + instance + ".dcm", "wb") as file:
+                    file.write(mock_server.dicom_instance(dict(
+                        server.catalog[0], instance_id=instance), 1024))
+            dcmweb_cli = dcmweb.Dcmweb(server.url, False, None, profiler=profiler)
+            dcmweb_cli.store(OUTPUT + "*.dcm")
+            check.equal(server.instances, 2)
+        check.is_in("find_files", function_names(profiler.stats(profiling.DISCOVERY)))
+        check.is_in("upload_dicom", function_names(profiler.stats(profiling.TRANSFER)))
+        check.is_none(profiler.stats(profiling.LISTING))
+    finally:
+        shutil.rmtree(OUTPUT)
+
+
+def test_nested_phases():
+    """time of nested phase shouldn't be counted in enclosing one"""
+    profiler = profiling.Profiler()
+
+    def listed():
+        return [1]
+
+    with profiler.phase(profiling.COMMAND):
+        items = list(profiler.iterate(profiling.LISTING, (listed() for _ in range(3))))
+    check.equal(items, [[1]] * 3)
+    check.is_in("listed", function_names(profiler.stats(profiling.LISTING)))
+    check.is_not_in("listed", function_names(profiler.stats(profiling.COMMAND)))
+
+
+@pytest.mark.skipif(not PYTHON_312, reason="requires Python 3.12+ or PYTHON_312 variable")
+def test_shared_profile():
+    """Python 3.12+ allows single profile in process, phases should be still profiled"""
+    output = subprocess.run([PYTHON_312, "-c", SHARED_SCRIPT], check=True, stdout=subprocess.PIPE,
+                            env=dict(os.environ, PYTHONPATH=os.getcwd())).stdout
+    result = json.loads(output.decode())
+    check.is_true(result["shared"])
+    check.equal(result["unprofiled"], 0)
+    check.is_in("listed", result[profiling.LISTING])
+    check.is_in("transferred", result[profiling.TRANSFER])
+    check.is_not_in("listed", result[profiling.COMMAND])
+    check.is_not_in("transferred", result[profiling.COMMAND])
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Progress tests
+"""
+import io
+import time
+import pytest_check as check
+from dcmweb import progress
+
+
+class TerminalStream(io.StringIO):
+    """Captures output written to terminal"""
+
+    def isatty(self):  # pylint: disable=no-self-use; mirrors terminal stream
+        return True
+
+
+def test_render_changes():
+    """progress should be rendered by own thread only when it changes"""
+    transferred = {'bytes': 0, 'files': 0, 'retries': 0}
+    stream = io.StringIO()
+    with progress.ProgressRenderer(transferred, interval=0.01, stream=stream):
+        time.sleep(0.05)
+        check.equal(stream.getvalue(), "")
+        transferred.update(bytes=2048, files=2, retries=1)
+        time.sleep(0.05)
+    lines = stream.getvalue().splitlines()
+    # single line while running and final one on close
+    check.equal(len(lines), 2)
+    for line in lines:
+        check.is_true(line.startswith("Transferred 2K in 2 files, 1 retries, "), line)
+        check.is_true(line.endswith(" files/s"), line)
+
+
+def test_eta():
+    """ETA should be estimated by rate of files when total is known"""
+    renderer = progress.ProgressRenderer({'bytes': 100, 'files': 1, 'retries': 0}, total=3)
+    renderer.start -= 10
+    check.is_true(renderer.line().endswith(", 0.1 files/s, ETA 0:00:20"), renderer.line())
+
+
+def test_terminal_overwrite():
+    """progress on terminal should be overwritten by next output except final line"""
+    transferred = {'bytes': 1, 'files': 1, 'retries': 0}
+    stream = TerminalStream()
+    renderer = progress.ProgressRenderer(transferred, stream=stream)
+    renderer.render()
+    check.is_true(stream.getvalue().endswith(progress.OVERWRITE))
+    renderer.close()
+    check.is_true(stream.getvalue().endswith("files/s\x1b[K\n"))
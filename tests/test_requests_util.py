@@ -4,10 +4,14 @@
 import os
 import unittest
 import random
+import shutil
+import pytest
 import pytest_check as check
 import httpretty
+from requests import Response
 from dcmweb import requests_util
 from dcmweb import resources
+from benchmarks import mock_server
 
 URL = "https://dicom.com"
 
@@ -122,7 +126,7 @@ def test_upload():
         URL + "/studies",
         body=request_callback
     )
-    assert requests.upload_dicom("./cloudBuild/dcms/1.dcm") == {'transferred': 8706,\
+    assert requests.upload_dicom("./cloudBuild/dcms/1.dcm") == {'transferred': 8706, 'retries': 0,\
 'message': './cloudBuild/dcms/1.dcm uploaded as https://healthcare.googleapis.com/v1beta1/\
 projects/healthcare/locations/europe-west2/datasets/exampl/dicomStores/store/dicomWeb/studies/1'}
 
@@ -140,6 +144,65 @@ healthcare/locations/europe-west2/datasets/exampl/dicomStores/store/dicomWeb/stu
 </DicomAttribute></DicomAttribute></NativeDicomModel>']
 
 
+STOW_BATCH_RESPONSE = '<NativeDicomModel><DicomAttribute tag="00081199" vr="SQ" \
+keyword="ReferencedSOPSequence"><Item number="1"><DicomAttribute tag="00081155" vr="UI" \
+keyword="ReferencedSOPInstanceUID"><Value number="1">111</Value></DicomAttribute><DicomAttribute \
+tag="00081190" vr="UR" keyword="RetrieveURL"><Value number="1">https://dicom.com/studies/111/\
+series/111/instances/111</Value></DicomAttribute></Item></DicomAttribute><DicomAttribute \
+tag="00081198" vr="SQ" keyword="FailedSOPSequence"><Item number="1"><DicomAttribute \
+tag="00081155" vr="UI" keyword="ReferencedSOPInstanceUID"><Value number="1">112</Value>\
+</DicomAttribute><DicomAttribute tag="00081197" vr="US" keyword="FailureReason"><Value \
+number="1">272</Value></DicomAttribute></Item></DicomAttribute></NativeDicomModel>'
+
+
+@httpretty.activate
+def test_upload_batch():
+    """files should be uploaded by single multipart request with status per file"""
+    httpretty.register_uri(
+        httpretty.POST,
+        URL + "/studies",
+        status=202,
+        body=STOW_BATCH_RESPONSE
+    )
+    requests = requests_util.Requests(URL, None)
+    file_names = ["./cloudBuild/dcms/1.dcm", "./cloudBuild/dcms/testFolder1/2.dcm",
+                  "./cloudBuild/dcms/testFolder1/testFolder2/3.dcm"]
+    result = requests.upload_dicom_batch(file_names)
+    check.equal(result["files"], 1)
+    check.equal(result["message"], "./cloudBuild/dcms/1.dcm uploaded as \
+https://dicom.com/studies/111/series/111/instances/111")
+    check.equal(result["errors"], [
+        "./cloudBuild/dcms/testFolder1/2.dcm failed with reason 272",
+        "./cloudBuild/dcms/testFolder1/testFolder2/3.dcm has no status in response"])
+    content_type = httpretty.last_request().headers.get("Content-Type")
+    check.is_true(content_type.startswith('multipart/related; type="application/dicom"'))
+    check.equal(httpretty.last_request().headers.get("Content-Length"),
+                str(result["transferred"]))
+
+
+def test_multipart_files_body():
+    """body should be read by any chunk size and rewound"""
+    file_names = ["./cloudBuild/dcms/1.dcm", "./cloudBuild/dcms/testFolder1/2.dcm"]
+    expected = b""
+    for file_name in file_names:
+        with open(file_name, "rb") as file:
+            expected += b"--b\r\nContent-Type: application/dicom\r\n\r\n" + file.read() + b"\r\n"
+    expected += b"--b--\r\n"
+    with requests_util.MultipartFilesBody(file_names, "b") as body:
+        check.equal(len(body), len(expected))
+        check.equal(body.read(), expected)
+        for size in (1, 7, 4096):
+            body.seek(0)
+            chunks = []
+            chunk = body.read(size)
+            while chunk:
+                check.is_true(len(chunk) <= size)
+                chunks.append(chunk)
+                chunk = body.read(size)
+            check.equal(b"".join(chunks), expected)
+            check.equal(body.tell(), len(expected))
+
+
 @httpretty.activate
 def test_download_dicom():
     """should download correct file"""
@@ -220,14 +283,13 @@ def test_download_dicom_by_ids():
 @httpretty.activate
 def test_download_multipart():
     """should download correct file by json based dict"""
-    mock_data = [b'1C\r\n--123 Content-Type:image/png\r\n4\r\ndata\r\n1C\r\n\
---123 Content-Type:image/png\r\n5\r\ndata2\r\n5\r\n--123\r\n0\r\n\r\n']
     httpretty.register_uri(
         httpretty.GET,
         URL + "/studies/6/series/7/instances/8",
-        body=(l for l in mock_data),
+        body=[to_chunked([b'--123\r\nContent-Type: image/png\r\n\r\ndata', b'\r\n--123\r\n\
+Content-Type: image/png\r\n\r\ndata2', b'\r\n--123--\r\n'])],
         adding_headers={
-            'Content-Type': 'multipart/related; type="image/png"; boundary=123;',
+            'Content-Type': 'multipart/related; type="image/png"; boundary=123',
             'transfer-encoding': 'chunked'},
         streaming=True
     )
@@ -257,13 +319,13 @@ def test_extension_by_headers():
 
 @httpretty.activate
 def test_multipart_reader():
-    """should download correct file by json based dict"""
-    mock_data = [b'1C\r\n--321 Content-Type:image/png\r\n4\r\ndata\r\n4\r\ndata\r\n1C\r\n\
---321 Content-Type:image/png\r\n5\r\ndata2\r\n5\r\n--321\r\n0\r\n\r\n']
+    """should stream part bodies and headers from response"""
     httpretty.register_uri(
         httpretty.GET,
         URL + "/studies/6/series/7/instances/8",
-        body=(l for l in mock_data),
+        body=[to_chunked([b'--321\r\nContent-Type: image/png\r\n\r\ndata', b'data',
+                          b'\r\n--321\r\nContent-Type: image/png\r\nContent-Location: /frames/2\
+\r\n\r\ndata2\r\n--321--'])],
         adding_headers={
             'Content-Type': 'multipart/related; type="image/png"; boundary=321;',
             'transfer-encoding': 'chunked'},
@@ -273,9 +335,226 @@ def test_multipart_reader():
     requests = requests_util.Requests(URL, None)
     response = requests.request("/studies/6/series/7/instances/8", "", {}, True)
     chunks = requests_util.MultipartChunksReader(
-        response.iter_content(chunk_size=8192), bytes("--321", "utf-8"))
+        response.iter_content(chunk_size=8192), bytes("321", "utf-8"))
     chunks_expected = [(b'data', True), (b'data', False), (b'data2', True)]
     i = 0
-    for chunk in chunks.read_chunks():
-        assert chunk == chunks_expected[i]
+    for chunk, new_file in chunks.read_chunks():
+        assert (bytes(chunk), new_file) == chunks_expected[i]
         i += 1
+    assert i == 3
+    assert chunks.headers == {"content-type": "image/png", "content-location": "/frames/2"}
+
+
+MULTIPART_BODY = b'preamble\r\n--b0undary\r\nContent-Type: application/dicom\r\n\
+Content-Location: /instances/1\r\n\r\nfirst\r\n--b0undar\r\n\r\r\n--b0undary \t\r\n\r\n\
+\r\n--b0undary\r\nContent-Type: application/dicom\r\n\r\n--b0undary\r\n\r\nlast\r\n\
+--b0undary--\r\nepilogue'
+MULTIPART_PARTS = [b'first\r\n--b0undar\r\n\r', b'', b'--b0undary\r\n\r\nlast']
+
+
+def read_parts(chunks):
+    """joins chunks of parts read from chunks"""
+    parts = []
+    for chunk, new_file in requests_util.MultipartChunksReader(chunks, b"b0undary").read_chunks():
+        if new_file:
+            parts.append(b"")
+        parts[-1] += bytes(chunk)
+    return parts
+
+
+def test_multipart_split_everywhere():
+    """parts should be same for any split of stream into chunks"""
+    check.equal(read_parts([MULTIPART_BODY]), MULTIPART_PARTS)
+    for first in range(len(MULTIPART_BODY) + 1):
+        check.equal(read_parts([MULTIPART_BODY[:first], MULTIPART_BODY[first:]]),
+                    MULTIPART_PARTS, "split at {}".format(first))
+    randomizer = random.Random(7)
+    for _ in range(200):
+        first, second = sorted(randomizer.sample(range(len(MULTIPART_BODY) + 1), 2))
+        check.equal(read_parts([MULTIPART_BODY[:first], MULTIPART_BODY[first:second],
+                                MULTIPART_BODY[second:]]), MULTIPART_PARTS,
+                    "split at {} and {}".format(first, second))
+    check.equal(read_parts([MULTIPART_BODY[i:i + 1] for i in range(len(MULTIPART_BODY))]),
+                MULTIPART_PARTS)
+
+
+def test_multipart_headers_limit():
+    """endless part headers should be rejected"""
+    chunks = [b'--b0undary\r\nX-Header: '] + [b'a' * 8192] * 10
+    with pytest.raises(requests_util.NetworkError):
+        read_parts(chunks)
+
+
+def test_parse_boundary():
+    """boundary should be parsed with and without quotes"""
+    check.equal(requests_util.parse_boundary('multipart/related; boundary=Ab1'), b'Ab1')
+    check.equal(requests_util.parse_boundary(
+        'multipart/related; boundary="Ab 1"; type="application/dicom"'), b'Ab 1')
+
+
+def to_chunked(chunks):
+    """encodes chunks with chunked transfer encoding"""
+    return b"".join(b"%x\r\n%s\r\n" % (len(chunk), chunk) for chunk in chunks) + b"0\r\n\r\n"
+
+
+@httpretty.activate
+def test_retry():
+    """transient failures should be retried"""
+    httpretty.register_uri(
+        httpretty.GET,
+        URL + "/studies",
+        responses=[httpretty.Response(body="busy", status=503),
+                   httpretty.Response(body="slow down", status=429),
+                   httpretty.Response(body="[]", status=200)]
+    )
+    requests = requests_util.Requests(URL, None, retry_policy=requests_util.RetryPolicy(3, 0))
+    response = requests.request("studies", "", {})
+    check.equal(response.text, "[]")
+    check.equal(response.retries, 2)
+
+
+@httpretty.activate
+def test_retry_exhausted():
+    """request should fail when attempts are exhausted"""
+    httpretty.register_uri(
+        httpretty.GET,
+        URL + "/studies",
+        body="busy",
+        status=503
+    )
+    requests = requests_util.Requests(URL, None, retry_policy=requests_util.RetryPolicy(2, 0))
+    try:
+        requests.request("studies", "", {})
+    except requests_util.NetworkError as exception:
+        check.equal(exception.status_code, 503)
+        check.equal(exception.retries, 1)
+    else:
+        check.is_true(False, "NetworkError expected")
+
+
+@httpretty.activate
+def test_retry_upload():
+    """file should be sent again on retry"""
+    httpretty.register_uri(
+        httpretty.POST,
+        URL + "/studies",
+        responses=[httpretty.Response(body="busy", status=503),
+                   httpretty.Response(body=request_callback)]
+    )
+    requests = requests_util.Requests(URL, None, retry_policy=requests_util.RetryPolicy(2, 0))
+    result = requests.upload_dicom("./cloudBuild/dcms/1.dcm")
+    check.equal(result["retries"], 1)
+    check.equal(httpretty.last_request().headers.get("Content-Length"), "8706")
+
+
+def test_retry_delay():
+    """delay should grow exponentially and respect Retry-After"""
+    policy = requests_util.RetryPolicy(5, 1, False, 5)
+    check.equal([policy.delay(retry) for retry in range(4)], [1, 2, 4, 5])
+    response = Response()
+    response.headers["Retry-After"] = "7"
+    check.equal(policy.delay(0, response), 7)
+    jittered = requests_util.RetryPolicy(5, 1, True).delay(3)
+    check.is_true(0 <= jittered <= 8)
+
+
+def test_session_pool():
+    """connection pool should be sized by pool_size"""
+    requests = requests_util.Requests(URL, None, 7)
+    adapter = requests.session.get_adapter(URL)
+    check.equal(adapter._pool_maxsize, 7)  # pylint: disable=protected-access; no public accessor
+
+
+def test_connection_reuse():
+    """keep-alive session should reuse single connection"""
+    with mock_server.LocalServer(KeepAliveHandler) as server:
+        for keep_alive, connections in ((True, 1), (False, 3)):
+            server.connections = 0
+            requests = requests_util.Requests(server.url, None, 1, keep_alive)
+            for _ in range(3):
+                check.equal(requests.request("studies", "", {}).text, "[]")
+            check.equal(server.connections, connections)
+
+
+class KeepAliveHandler(mock_server.LocalHandler):
+    """Counts connections and answers with empty json"""
+
+    def setup(self):
+        """Counts new connection"""
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):  # pylint: disable=invalid-name; name required by BaseHTTPRequestHandler
+        """Returns empty json"""
+        self.respond(200, "application/json", b"[]")
+
+
+def test_interrupted_download():
+    """download interrupted while body is streamed should be repeated without leftovers"""
+    instance = mock_server.dicom_instance(
+        {"study_id": "1", "series_id": "2", "instance_id": "3"}, 4096)
+    bodies = {"/studies/1/series/2/instances/3": ("application/dicom", instance),
+              "/studies/1": ('multipart/related; type="application/dicom"; boundary=b',
+                             b"--b\r\nContent-Type: application/dicom\r\n\r\n" + instance
+                             + b"\r\n--b--\r\n")}
+    output = "./testData/interrupted/"
+    try:
+        with mock_server.LocalServer(InterruptingHandler, bodies=bodies) as server:
+            for attempts, chunked in ((2, True), (1, True), (2, False), (1, False)):
+                server.chunked = chunked
+                requests = requests_util.Requests(
+                    server.url, None, retry_policy=requests_util.RetryPolicy(attempts, 0))
+                for download, arguments in (
+                        (requests.download_dicom_by_ids,
+                         ({"study_id": "1", "series_id": "2", "instance_id": "3"}, output)),
+                        (requests.download_dicom_bulk, ({"study_id": "1"}, output))):
+                    server.interruptions = 1
+                    try:
+                        result = download(*arguments)
+                    except requests_util.TransferInterruptedError:
+                        check.equal(attempts, 1)
+                        check.equal(list_files(output), [])
+                    else:
+                        check.equal(result["retries"], 1)
+                        check.equal(result["transferred"], len(instance))
+                        check.equal(list_files(output), ["3.dcm"])
+                    shutil.rmtree(output, ignore_errors=True)
+    finally:
+        shutil.rmtree(output, ignore_errors=True)
+
+
+def test_missing_closing_delimiter():
+    """multipart response without closing delimiter should be treated as truncated"""
+    chunks = [b"--b0undary\r\n\r\nfirst\r\n--b0undary\r\n\r\nlast"]
+    with pytest.raises(requests_util.TransferInterruptedError):
+        read_parts(chunks)
+    check.equal(read_parts(chunks + [b"\r\n--b0undary--"]), [b"first", b"last"])
+
+
+def list_files(folder):
+    """Returns sorted names of all files in folder and its subfolders"""
+    return sorted(name for _, _, names in os.walk(folder) for name in names)
+
+
+class InterruptingHandler(mock_server.LocalHandler):
+    """Serves bodies by path, while server has interruptions left it drops connection
+    in the middle of chunked body or of body with Content-Length"""
+
+    def do_GET(self):  # pylint: disable=invalid-name; name required by BaseHTTPRequestHandler
+        """Returns body of path or its first half"""
+        content_type, body = self.server.bodies[self.path]
+        if not self.server.interruptions:
+            self.respond(200, content_type, body)
+            return
+        self.server.interruptions -= 1
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if self.server.chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.write(b"%x\r\n" % len(body))
+        else:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+        self.wfile.write(body[:len(body) // 2])
+        self.close_connection = True  # pylint: disable=attribute-defined-outside-init; attribute of BaseHTTPRequestHandler
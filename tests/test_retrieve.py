@@ -2,11 +2,14 @@
 """Retrieve method tests
 """
 import os
+import filecmp
 import shutil
 import unittest
 import httpretty
 import pytest_check as check
 from dcmweb import dcmweb
+from dcmweb import inventory
+from dcmweb import manifest
 
 URL = "https://dicom.com/"
 
@@ -25,20 +28,8 @@ class RetrieveTests(unittest.TestCase):
         httpretty.register_uri(
             httpretty.GET,
             generate_page_url(URL, 0),
-            body=generate_array_response(
-                [generate_response(1, 2, 3), generate_response(1, 2, 4)]),
-            match_querystring=True
-        )
-        httpretty.register_uri(
-            httpretty.GET,
-            generate_page_url(URL, 5000),
-            body=generate_array_response([generate_response(3, 2, 1)]),
-            match_querystring=True
-        )
-        httpretty.register_uri(
-            httpretty.GET,
-            generate_page_url(URL, 10000),
-            status=204,
+            body=generate_array_response([generate_response(1, 2, 3), generate_response(1, 2, 4),
+                                          generate_response(3, 2, 1)]),
             match_querystring=True
         )
         httpretty.register_uri(
@@ -47,12 +38,6 @@ class RetrieveTests(unittest.TestCase):
             body=generate_array_response([generate_response(1, 2, 3)]),
             match_querystring=True
         )
-        httpretty.register_uri(
-            httpretty.GET,
-            generate_page_url(URL+"studies/1/", 5000),
-            status=204,
-            match_querystring=True
-        )
         httpretty.register_uri(
             httpretty.GET,
             URL+"studies/1/series/2/instances/3",
@@ -81,8 +66,28 @@ class RetrieveTests(unittest.TestCase):
             match_querystring=True
         )
 
-        mock_data = [
-            b'1C\r\n--456 Content-Type:image/png\r\n4\r\ndata\r\n5\r\n--456\r\n0\r\n\r\n']
+        for path in ("studies/111", "studies/111/series/111"):
+            httpretty.register_uri(
+                httpretty.GET,
+                URL+path,
+                body=generate_multipart(
+                    ["./cloudBuild/dcms/1.dcm", "./cloudBuild/dcms/testFolder1/2.dcm"]),
+                adding_headers={
+                    'Content-Type': 'multipart/related; type="application/dicom"; boundary=789;',
+                    'transfer-encoding': 'chunked'},
+                streaming=True
+            )
+        for path, body in (("studies", [generate_study(111)]),
+                           ("studies/111/series", [generate_series(111, 111)])):
+            httpretty.register_uri(
+                httpretty.GET,
+                URL+path+"?includefield=0020000D&limit=5000&offset=0",
+                body=generate_array_response(body),
+                match_querystring=True
+            )
+
+        mock_data = [to_chunked([b'--456\r\nContent-Type: image/png\r\n\r\n', b'data',
+                                 b'\r\n--456--\r\n'])]
         httpretty.register_uri(
             httpretty.GET,
             URL+"studies/1/series/2/instances/3/frames/1",
@@ -115,12 +120,120 @@ class RetrieveTests(unittest.TestCase):
                 shutil.rmtree(output)
 
 
+    def test_retrieve_bulk(self):  # pylint: disable=no-self-use; method in class for cleaner look by setup method
+        """instances of multipart study response should be saved by their UIDs"""
+        output = "./testData/"
+        dcmweb_cli = dcmweb.Dcmweb(URL, True, None)
+        for bulk in dcmweb.BULK_LEVELS:
+            dcmweb_cli.retrieve("studies/111", output, bulk=bulk)
+            check.is_true(filecmp.cmp(output + "111/111/111.dcm", "./cloudBuild/dcms/1.dcm",
+                                      shallow=False))
+            check.is_true(filecmp.cmp(output + "112/112/112.dcm",
+                                      "./cloudBuild/dcms/testFolder1/2.dcm", shallow=False))
+            check.equal(sorted(os.listdir(output)), ["111", "112"])
+            shutil.rmtree(output)
+        dcmweb_cli.retrieve("", output, resume=True, bulk="study")
+        with open(output + manifest.MANIFEST_NAME) as file:
+            check.equal(sorted(file.read().split()), ["111/111/111", "112/112/112"])
+        shutil.rmtree(output)
+        with self.assertRaises(ValueError):
+            dcmweb_cli.retrieve("", output, bulk="instance")
+
+    def test_retrieve_bulk_resume(self):  # pylint: disable=no-self-use; method in class for cleaner look by setup method
+        """only missing instances of partially retrieved study should be downloaded"""
+        output = "./testData/"
+        httpretty.register_uri(
+            httpretty.GET,
+            generate_page_url(URL + "studies/111/", 0),
+            body=generate_array_response(
+                [generate_response(111, 111, 111), generate_response(111, 111, 113)]),
+            match_querystring=True
+        )
+        httpretty.register_uri(
+            httpretty.GET,
+            URL + "studies/111/series/111/instances/113",
+            body="113.dcm",
+            adding_headers={'Content-Type': 'application/dicom'}
+        )
+        os.makedirs(output)
+        with open(output + manifest.MANIFEST_NAME, "w") as file:
+            file.write("111/111/111\n")
+        dcmweb_cli = dcmweb.Dcmweb(URL, False, None)
+        dcmweb_cli.retrieve("", output, resume=True, bulk="study")
+        check.equal(os.listdir(output + "111/111"), ["113.dcm"])
+        check.is_false(any(request.path == "/studies/111"
+                           for request in httpretty.latest_requests()))
+        with open(output + manifest.MANIFEST_NAME) as file:
+            check.equal(file.read().split(), ["111/111/111", "111/111/113"])
+        shutil.rmtree(output)
+
+    def test_retrieve_resume(self):  # pylint: disable=no-self-use; method in class for cleaner look by setup method
+        """instances from manifest should not be downloaded again"""
+        output = "./testData/"
+        dcmweb_cli = dcmweb.Dcmweb(URL, False, None)
+        dcmweb_cli.retrieve("", output, resume=True)
+        with open(output + manifest.MANIFEST_NAME) as file:
+            check.equal(sorted(file.read().split()), ["1/2/3", "1/2/4", "3/2/1"])
+        os.remove(output + "1/2/4.dcm")
+        with open(output + manifest.MANIFEST_NAME, "w") as file:
+            file.write("1/2/3\n3/2/1\n1/2/4")
+        dcmweb_cli.retrieve("", output, resume=True)
+        check.is_true(os.path.isfile(output + "1/2/4.dcm"))
+        os.remove(output + "1/2/3.dcm")
+        dcmweb_cli.retrieve("", output, resume=True)
+        check.is_false(os.path.isfile(output + "1/2/3.dcm"))
+        shutil.rmtree(output)
+
+    def test_retrieve_index(self):  # pylint: disable=no-self-use; method in class for cleaner look by setup method
+        """instances listed by index should be downloaded without QIDO search"""
+        output = "./testData/"
+        database = output + "index.sqlite"
+        os.makedirs(output, exist_ok=True)
+        with inventory.Inventory(database, URL) as index:
+            index.replace_study({"study_uid": "1", "study_date": None, "patient_id": None,
+                                 "instances": 1}, [{"study_id": "1", "series_id": "2",
+                                                    "instance_id": "4"}])
+        dcmweb_cli = dcmweb.Dcmweb(URL, False, None)
+        dcmweb_cli.retrieve("", output, index=database)
+        check.equal(os.listdir(output + "1/2"), ["4.dcm"])
+        check.is_false(os.path.exists(output + "3"))
+        check.is_false(any("/instances?" in request.path
+                           for request in httpretty.latest_requests()))
+        shutil.rmtree(output)
+
+
 def generate_response(study_id, series_id, instance_id):
     """generates json string for instance"""
     return '{"00080018":{"vr":"UI","Value":["'+str(instance_id)+'"]},\
     "0020000D":{"vr":"UI","Value":["'+str(study_id)+'"]},\
     "0020000E":{"vr":"UI","Value":["'+str(series_id)+'"]}}'
 
+def generate_study(study_id):
+    """generates json string for study"""
+    return '{"0020000D":{"vr":"UI","Value":["'+str(study_id)+'"]}}'
+
+
+def generate_series(study_id, series_id):
+    """generates json string for series"""
+    return '{"0020000D":{"vr":"UI","Value":["'+str(study_id)+'"]},\
+    "0020000E":{"vr":"UI","Value":["'+str(series_id)+'"]}}'
+
+
+def generate_multipart(file_names):
+    """generates chunked multipart body with file per part"""
+    chunks = []
+    for file_name in file_names:
+        with open(file_name, "rb") as file:
+            chunks += [b"--789\r\nContent-Type: application/dicom\r\n\r\n", file.read(), b"\r\n"]
+    chunks.append(b"--789--")
+    return [to_chunked(chunks)]
+
+
+def to_chunked(chunks):
+    """encodes chunks with chunked transfer encoding"""
+    return b"".join(b"%x\r\n%s\r\n" % (len(chunk), chunk) for chunk in chunks) + b"0\r\n\r\n"
+
+
 def generate_array_response(responses):
     """generates json string for list of instances"""
     return "[" + ",".join(responses) + "]"
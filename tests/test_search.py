@@ -55,3 +55,31 @@ def test_search():
     )
     assert dcmweb_cli.search("study/1234", "limit=1") == json.dumps(
         [], indent=INDENT, sort_keys=SORT_KEYS)
+
+
+@httpretty.activate
+def test_search_all(capsys, monkeypatch):
+    """all pages should be streamed as json lines by both json backends"""
+    httpretty.register_uri(httpretty.GET, "https://dicom.com/studies?limit=1",
+                           match_querystring=True)
+    dcmweb_cli = dcmweb.Dcmweb("https://dicom.com/", False, None)
+    for offset, body in ((0, '[{"b": 1, "a": [2]}, {"c": "3"}]'), (2, '[{"d": 4}]')):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://dicom.com/studies?limit=2&offset={}".format(offset),
+            body=body,
+            match_querystring=True
+        )
+    for offset in (4, 6):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://dicom.com/studies?limit=2&offset={}".format(offset),
+            status=204,
+            match_querystring=True
+        )
+    expected = '{"a":[2],"b":1}\n{"c":"3"}\n{"d":4}\n'
+    assert dcmweb_cli.search("studies", "limit=2", all=True) is None
+    assert capsys.readouterr().out == expected
+    monkeypatch.setattr(dcmweb, "orjson", None)
+    dcmweb_cli.search("studies", "limit=2", all=True)
+    assert capsys.readouterr().out == expected
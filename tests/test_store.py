@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 """Store method tests
 """
+import logging
 import httpretty
 import pytest_check as check
 from dcmweb import dcmweb
@@ -35,6 +36,61 @@ def test_store():
             .format(mask, "parallel" if multithreading else "sequential", amount))
             requests_counter.reset()
 
+@httpretty.activate
+def test_store_batch():
+    """files should be packed into batches limited by count and size"""
+    content_types = []
+
+    def batch_callback(request, _, response_headers):
+        content_types.append(request.headers.get('Content-Type'))
+        return [200, response_headers, '<NativeDicomModel></NativeDicomModel>']
+    httpretty.register_uri(
+        httpretty.POST,
+        "https://dicom.com/studies",
+        body=batch_callback
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        "https://dicom.com/studies?limit=1"
+    )
+    dcmweb_cli = dcmweb.Dcmweb("https://dicom.com/", False, None)
+    for batch_size, batch_bytes, amount in ((2, dcmweb.STORE_BATCH_BYTES, 2),
+                                            (10, dcmweb.STORE_BATCH_BYTES, 1), (10, 1, 3)):
+        content_types.clear()
+        dcmweb_cli.store("./cloudBuild/dcms/**", batch_size=batch_size, batch_bytes=batch_bytes)
+        check.equal(len(content_types), amount)
+        check.is_true(all(content_type.startswith("multipart/related")
+                          for content_type in content_types))
+
+@httpretty.activate
+def test_store_skip_existing(caplog):
+    """instances found on server should not be uploaded"""
+    caplog.set_level(logging.INFO)
+    requests_counter = RequestsCounter()
+    httpretty.register_uri(
+        httpretty.POST,
+        "https://dicom.com/studies",
+        body=requests_counter.request_callback
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        "https://dicom.com/studies?limit=1"
+    )
+    for study_id, status in (("111", 200), ("112", 404), ("113", 204)):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://dicom.com/studies/{}/instances?includefield=0020000D&includefield=\
+0020000E&limit=5000&offset=0".format(study_id),
+            status=status,
+            body='[{"0020000D": {"Value": ["111"]}, "0020000E": {"Value": ["111"]}, \
+"00080018": {"Value": ["111"]}}]' if status == 200 else "",
+            match_querystring=True
+        )
+    dcmweb_cli = dcmweb.Dcmweb("https://dicom.com/", False, None)
+    dcmweb_cli.store("./cloudBuild/dcms/**", skip_existing=True)
+    check.equal(requests_counter.requests, 2)
+    check.equal(caplog.records[-1].message, "Skipped 1 files already stored on server")
+
 @httpretty.activate
 def test_empty_store(caplog):
     """error message should be printed"""
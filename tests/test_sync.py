@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Sync method tests
+"""
+import os
+import shutil
+import httpretty
+import pytest_check as check
+from dcmweb import dcmweb
+
+URL = "https://dicom.com/"
+OUTPUT = "./testData/sync/"
+
+
+def instance_json(study_id, series_id, instance_id):
+    """generates json string for instance"""
+    return '{{"0020000D": {{"Value": ["{}"]}}, "0020000E": {{"Value": ["{}"]}}, \
+"00080018": {{"Value": ["{}"]}}}}'.format(study_id, series_id, instance_id)
+
+
+def create_local(paths):
+    """creates files in output folder"""
+    for path in paths:
+        os.makedirs(os.path.dirname(OUTPUT + path), exist_ok=True)
+        shutil.copy("./cloudBuild/dcms/1.dcm", OUTPUT + path)
+
+
+@httpretty.activate
+def test_sync():
+    """only missing instances should be transferred in both directions"""
+    httpretty.register_uri(httpretty.GET, URL + "studies?limit=1", match_querystring=True)
+    httpretty.register_uri(
+        httpretty.GET,
+        URL + "instances?includefield=0020000D&includefield=0020000E&limit=5000&offset=0",
+        body="[{}, {}]".format(instance_json(1, 2, 3), instance_json(1, 2, 4)),
+        match_querystring=True
+    )
+    for instance_id in (3, 4):
+        httpretty.register_uri(
+            httpretty.GET, URL + "studies/1/series/2/instances/{}".format(instance_id),
+            body="{}.dcm".format(instance_id), adding_headers={'Content-Type': 'application/dicom'})
+    httpretty.register_uri(httpretty.POST, URL + "studies", body='<NativeDicomModel>\
+<DicomAttribute keyword="ReferencedSOPSequence"><DicomAttribute keyword="RetrieveURL">\
+<Value>url</Value></DicomAttribute></DicomAttribute></NativeDicomModel>')
+    create_local(["1/2/3.dcm", "5/6/7.dcm", "5/6/.part-8.dcm"])
+    try:
+        dcmweb_cli = dcmweb.Dcmweb(URL, False, None)
+        dcmweb_cli.sync("", OUTPUT, upload=False)
+        check.is_false(any(request.method == "POST" for request in httpretty.latest_requests()))
+        with open(OUTPUT + "1/2/4.dcm") as file:
+            check.equal(file.read(), "4.dcm")
+        os.remove(OUTPUT + "1/2/4.dcm")
+
+        dcmweb_cli.sync("", OUTPUT)
+        check.equal([request.path for request in httpretty.latest_requests()
+                     if request.method == "POST"], ["/studies"])
+        check.is_true(os.path.isfile(OUTPUT + "1/2/4.dcm"))
+        check.equal(sorted(os.listdir(OUTPUT + "1/2")), ["3.dcm", "4.dcm"])
+    finally:
+        shutil.rmtree(OUTPUT)
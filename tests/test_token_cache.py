@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Token cache tests
+"""
+import os
+import time
+import datetime
+import shutil
+import concurrent.futures
+import google.auth
+import google.oauth2.credentials
+import pytest_check as check
+from dcmweb import dcmweb
+from dcmweb import token_cache
+
+CACHE = "./testData/tokenCache/token.json"
+
+
+class FakeCredentials:
+    """Credentials counting refreshes"""
+
+    refreshes = 0
+
+    def __init__(self):
+        self.token = None
+        self.expiry = None
+
+    @property
+    def valid(self):
+        """Valid after first refresh"""
+        return self.token is not None
+
+    def apply(self, headers):
+        """Adds token to headers in place and returns None like google.auth credentials"""
+        headers["authorization"] = "Bearer {}".format(self.token)
+
+    def refresh(self, _):
+        """Issues new token valid for an hour"""
+        time.sleep(0.05)
+        FakeCredentials.refreshes += 1
+        self.token = "token{}".format(FakeCredentials.refreshes)
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+
+def test_read_write():
+    """tokens should be read back until they expire soon"""
+    cache = token_cache.TokenCache(CACHE, 60)
+    try:
+        check.equal(cache.read("key"), None)
+        with cache.locked():
+            cache.write("key", "token", time.time() + 120)
+            cache.write("soon", "token", time.time() + 30)
+        check.equal(cache.read("key")[0], "token")
+        check.equal(cache.read("soon"), None)
+        with open(CACHE, "w") as file:
+            file.write("broken")
+        check.equal(cache.read("key"), None)
+    finally:
+        shutil.rmtree(os.path.dirname(CACHE))
+
+
+def test_credentials_key(monkeypatch):
+    """key should identify credentials file and change when file is replaced"""
+    folder = os.path.dirname(CACHE)
+    os.makedirs(folder, exist_ok=True)
+    monkeypatch.delenv("GOOGLE_APPLICATION_CREDENTIALS", raising=False)
+    monkeypatch.setenv("CLOUDSDK_CONFIG", folder)
+    try:
+        check.equal(token_cache.credentials_key(), token_cache.DEFAULT_KEY)
+        gcloud_credentials = os.path.join(folder, "application_default_credentials.json")
+        key_file = os.path.join(folder, "key.json")
+        for path in (gcloud_credentials, key_file):
+            with open(path, "w") as file:
+                file.write("{}")
+        gcloud_key = token_cache.credentials_key()
+        check.is_true(gcloud_key.startswith(os.path.abspath(gcloud_credentials)))
+        monkeypatch.setenv("GOOGLE_APPLICATION_CREDENTIALS", key_file)
+        key = token_cache.credentials_key()
+        check.is_true(key.startswith(os.path.abspath(key_file)))
+        os.utime(key_file, ns=(0, 0))
+        check.not_equal(token_cache.credentials_key(), key)
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_shared_refresh(monkeypatch):
+    """authenticators sharing cache should refresh token once"""
+    monkeypatch.setattr(google.auth, "default", lambda scopes: (FakeCredentials(), None))
+    monkeypatch.setattr(FakeCredentials, "refreshes", 0)
+    try:
+        first = dcmweb.GoogleAuthenticator(token_cache.TokenCache(CACHE))
+        second = dcmweb.GoogleAuthenticator(token_cache.TokenCache(CACHE))
+        check.equal(first.apply_credentials({}), {"authorization": "Bearer token1"})
+        check.equal(second.apply_credentials({}), {"authorization": "Bearer token1"})
+        check.equal(FakeCredentials.refreshes, 1)
+    finally:
+        shutil.rmtree(os.path.dirname(CACHE))
+
+
+def test_single_flight_refresh(monkeypatch):
+    """concurrent requests should refresh token once and keep using fresh token without refresh"""
+    monkeypatch.setattr(google.auth, "default", lambda scopes: (FakeCredentials(), None))
+    monkeypatch.setattr(FakeCredentials, "refreshes", 0)
+    authenticator = dcmweb.GoogleAuthenticator()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        headers = list(executor.map(lambda _: authenticator.apply_credentials({}), range(64)))
+        check.equal(headers, [{"authorization": "Bearer token1"}] * 64)
+        check.equal(FakeCredentials.refreshes, 1)
+
+        # token expiring soon is still used by other threads while one refreshes it
+        authenticator.credentials.expiry = datetime.datetime.utcnow() + \
+            datetime.timedelta(seconds=60)
+        authenticator.header = ({"authorization": "Bearer token1"}, time.time() + 60)
+        headers = list(executor.map(lambda _: authenticator.apply_credentials({}), range(8)))
+        check.is_true({"authorization": "Bearer token2"} in headers)
+        check.equal(FakeCredentials.refreshes, 2)
+
+
+def test_google_credentials(monkeypatch):
+    """authorization header should be built by google.auth credentials"""
+    credentials = google.oauth2.credentials.Credentials("token")
+    credentials.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    monkeypatch.setattr(google.auth, "default", lambda scopes: (credentials, None))
+    authenticator = dcmweb.GoogleAuthenticator()
+    check.equal(authenticator.apply_credentials({"accept": "application/dicom"}),
+                {"accept": "application/dicom", "authorization": "Bearer token"})
+    check.equal(authenticator.apply_credentials({}), {"authorization": "Bearer token"})
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Trace tests
+"""
+import json
+import os
+import shutil
+import pytest_check as check
+from dcmweb import dcmweb
+from dcmweb import requests_util
+from dcmweb import trace
+from benchmarks import mock_server
+
+OUTPUT = "./testData/trace/"
+
+
+def test_trace():
+    """every HTTP exchange should be written as Chrome trace event"""
+    os.makedirs(OUTPUT, exist_ok=True)
+    tracer = trace.Tracer(OUTPUT + "trace.json")
+    try:
+        with mock_server.MockServer(catalog=(1, 1, 2)) as server:
+            dcmweb_cli = dcmweb.Dcmweb(server.url, True, None, tracer=tracer)
+            dcmweb_cli.retrieve("studies/1", OUTPUT)
+        tracer.close()
+        with open(OUTPUT + "trace.json") as file:
+            events = json.load(file)
+        exchanges = [event for event in events if event["ph"] == "X"]
+        check.equal(len(exchanges), server.requests)
+        instances = sorted((event for event in exchanges if "/instances/" in event["name"]),
+                           key=lambda event: event["name"])
+        check.equal([event["name"] for event in instances],
+                    ["GET /studies/1/series/1.1/instances/1.1.1",
+                     "GET /studies/1/series/1.1/instances/1.1.2"])
+        for event in instances:
+            check.equal(event["args"]["status"], 200)
+            check.equal(event["args"]["received_bytes"], 8192)
+            check.is_true(event["dur"] >= event["args"]["ttfb_us"] - 1)
+        workers = {event["tid"] for event in exchanges}
+        check.equal(workers, {event["tid"] for event in events if event["ph"] == "M"})
+    finally:
+        shutil.rmtree(OUTPUT)
+
+
+def test_trace_failed_download():
+    """failed streamed responses should be traced too"""
+    os.makedirs(OUTPUT, exist_ok=True)
+    tracer = trace.Tracer(OUTPUT + "trace.json")
+    try:
+        with mock_server.MockServer(error_rate=1.0) as server:
+            requests = requests_util.Requests(server.url, None, tracer=tracer,
+                                              retry_policy=requests_util.RetryPolicy(2, 0))
+            try:
+                requests.download_dicom("studies/1/series/1.1/instances/1.1.1", OUTPUT, "1",
+                                        requests_util.DICOM_TYPE)
+            except requests_util.NetworkError as exception:
+                check.equal(exception.status_code, 503)
+            else:
+                check.is_true(False, "NetworkError expected")
+        tracer.close()
+        with open(OUTPUT + "trace.json") as file:
+            events = json.load(file)
+        exchanges = [event for event in events if event["ph"] == "X"]
+        check.equal(len(exchanges), server.requests)
+        check.equal([(event["args"]["status"], event["args"]["retry"]) for event in exchanges],
+                    [(503, 0), (503, 1)])
+    finally:
+        shutil.rmtree(OUTPUT)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Streaming file search tests
+"""
+import os
+import glob
+import shutil
+import pytest_check as check
+from dcmweb import walker
+
+ROOT = "./testData/walker"
+FILES = ("a.dcm", "b.txt", ".hidden.dcm", "sub/c.dcm", "sub/deep/d.dcm",
+         ".git/e.dcm", "sub/.cache/f.dcm")
+MASKS = ("{}/*", "{}/**", "{}/**.dcm", "{}/*/*.dcm", "{}/sub/**", "{}/.*", "{}/**/.cache/*",
+         "{}/a.dcm")
+
+
+def create_tree():
+    """creates tree of empty files"""
+    for file_name in FILES:
+        path = os.path.join(ROOT, file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "w").close()
+
+
+def test_same_as_glob():
+    """files should be matched like by glob in sequential and parallel modes"""
+    create_tree()
+    try:
+        for mask in MASKS:
+            mask = mask.format(ROOT)
+            expected = sorted(file_name for file_name in glob.glob(
+                mask.replace("**", "**/*"), recursive=True) if not os.path.isdir(file_name))
+            for workers in (1, 4):
+                check.equal(sorted(walker.find_files([mask], workers)), expected,
+                            "{} with {} workers".format(mask, workers))
+    finally:
+        shutil.rmtree(ROOT)
+
+
+def test_overlapping_masks():
+    """file matched by several masks should be generated once"""
+    create_tree()
+    try:
+        found = list(walker.find_files([ROOT + "/**", ROOT + "/*.dcm", ROOT + "/sub/c.dcm"]))
+        check.equal(len(found), len(set(found)))
+        check.equal(len(found), 4)
+    finally:
+        shutil.rmtree(ROOT)
+
+
+def test_no_files(caplog):
+    """error message should be printed for mask without files"""
+    check.equal(list(walker.find_files(["/wrong/path", "/wrong/**"])), [])
+    check.equal([record.message for record in caplog.records], [
+        "No files found matching /wrong/path", "No files found matching /wrong/**/*"])